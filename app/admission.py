@@ -0,0 +1,237 @@
+"""
+Control de admisión por cliente para las rutas caras (`/parse*`, `/sync/*`,
+`/emails/send`). Cada grupo de rutas tiene, por cliente (una `X-API-Key`
+de la lista permitida o, si no, la IP), un token bucket y un límite de
+peticiones simultáneas, más un límite global del grupo para todos los
+clientes juntos; las que superan alguno esperan en una cola corta. Si la cola
+del cliente (o la del grupo) está llena, o la espera supera `queue_timeout`, se
+responde 429 con `Retry-After` en lugar de acumular trabajo: un script masivo
+se frena a sí mismo sin quitar capacidad a los usuarios interactivos.
+"""
+import asyncio
+import math
+import time
+from typing import Collection, Dict, Iterable, Optional, Sequence
+
+from starlette.datastructures import Headers
+from starlette.responses import JSONResponse
+
+from app import metrics
+from app.ratelimit import TokenBucket
+
+API_KEY_HEADER = "x-api-key"
+
+QUEUE_DEPTH = metrics.gauge("admission_queue_depth", "Requests waiting for a per-client slot", ("group",))
+IN_FLIGHT = metrics.gauge("admission_in_flight", "Admitted requests running", ("group",))
+REJECTED = metrics.counter("admission_rejected_total", "Requests shed with 429", ("group", "reason"))
+WAIT = metrics.histogram(
+    "admission_wait_seconds", "Time spent queued before admission", ("group",),
+    buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+)
+
+
+class RouteGroup:
+    """
+    Rutas POST que comparten límites: `concurrency` y `rate`/`burst` por
+    cliente, y `max_in_flight` para todos los clientes del grupo
+    """
+
+    def __init__(self, name: str, prefixes: Sequence[str], concurrency: int, rate: float, burst: float,
+                 max_in_flight: int):
+        self.name = name
+        self.prefixes = tuple(prefixes)
+        self.concurrency = concurrency
+        self.rate = rate
+        self.burst = burst
+        self.max_in_flight = max_in_flight
+        # Duración media (EWMA) de las peticiones admitidas, para estimar Retry-After
+        self.avg_duration = 1.0
+
+    def matches(self, path: str) -> bool:
+        return any(path == p or path.startswith(p.rstrip("/") + "/") for p in self.prefixes)
+
+    def observe(self, seconds: float) -> None:
+        self.avg_duration += 0.1 * (seconds - self.avg_duration)
+
+
+class _Client:
+    def __init__(self, group: RouteGroup):
+        self.slots = asyncio.Semaphore(group.concurrency)
+        self.bucket = TokenBucket(group.rate, group.burst)
+        self.waiting = 0
+        self.in_flight = 0
+        self.last_seen = time.monotonic()
+
+
+class Rejected(Exception):
+    def __init__(self, group: str, reason: str, retry_after: float):
+        super().__init__(f"{group}: {reason}")
+        self.group = group
+        self.reason = reason
+        self.retry_after = retry_after
+
+    def response(self) -> JSONResponse:
+        return JSONResponse(
+            status_code=429,
+            content={"detail": "Too many requests", "group": self.group, "reason": self.reason},
+            headers={"Retry-After": str(max(math.ceil(self.retry_after), 1))},
+        )
+
+
+class Admission:
+    """Estado de un grupo: un `_Client` por cliente, creado en su primera petición"""
+
+    def __init__(self, group: RouteGroup, max_queue: int, queue_timeout: float, max_queue_total: int):
+        self.group = group
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.max_queue_total = max_queue_total
+        # Turnos del grupo para todos los clientes: muchas claves o IPs no suman capacidad
+        self.slots = asyncio.Semaphore(group.max_in_flight)
+        self.clients: Dict[str, _Client] = {}
+        self.waiting = 0
+        self.in_flight = 0
+        self._pruned = time.monotonic()
+        # Un cliente sin actividad durante este tiempo ya tiene el bucket lleno: se olvida
+        self.idle_ttl = max(group.burst / group.rate if group.rate > 0 else 0.0, 60.0)
+
+    def _prune(self, now: float) -> None:
+        if now - self._pruned < 60:
+            return
+        self._pruned = now
+        for key, client in list(self.clients.items()):
+            if not client.waiting and not client.in_flight and now - client.last_seen > self.idle_ttl:
+                del self.clients[key]
+
+    def _retry_after(self, client: _Client) -> float:
+        """Tiempo aproximado hasta que se libere un turno para este cliente"""
+        return self.group.avg_duration * (client.waiting + 1) / self.group.concurrency
+
+    def _set_gauges(self) -> None:
+        QUEUE_DEPTH.set(self.waiting, group=self.group.name)
+        IN_FLIGHT.set(self.in_flight, group=self.group.name)
+
+    async def acquire(self, key: str) -> _Client:
+        """Reservar un turno para el cliente (esperando en cola si hace falta) o lanzar `Rejected`"""
+        now = time.monotonic()
+        self._prune(now)
+        client = self.clients.get(key)
+        if client is None:
+            client = self.clients[key] = _Client(self.group)
+        client.last_seen = now
+
+        wait = client.bucket.try_acquire()
+        if wait <= 0 and not client.slots.locked() and not self.slots.locked():
+            await client.slots.acquire()
+            await self.slots.acquire()
+        else:
+            # Sin token o sin turno libre: esperar en cola (backpressure) o descartar
+            if client.waiting >= self.max_queue:
+                self._reject("queue_full", max(wait, self._retry_after(client)))
+            if self.waiting >= self.max_queue_total:
+                self._reject("group_queue_full", max(wait, self._retry_after(client)))
+            if wait > self.queue_timeout:
+                self._reject("rate_limited", wait)
+            client.waiting += 1
+            self.waiting += 1
+            self._set_gauges()
+            try:
+                await asyncio.wait_for(self._wait_turn(self.slots, client, wait), self.queue_timeout)
+            except asyncio.TimeoutError:
+                self._reject("queue_timeout", self._retry_after(client))
+            finally:
+                client.waiting -= 1
+                self.waiting -= 1
+                WAIT.observe(time.monotonic() - now, group=self.group.name)
+        client.in_flight += 1
+        self.in_flight += 1
+        self._set_gauges()
+        return client
+
+    @staticmethod
+    async def _wait_turn(group_slots: asyncio.Semaphore, client: _Client, wait: float) -> None:
+        if wait > 0:
+            await client.bucket.acquire()
+        await client.slots.acquire()
+        try:
+            await group_slots.acquire()
+        except BaseException:
+            # Timeout esperando el turno del grupo: devolver el del cliente
+            client.slots.release()
+            raise
+
+    def release(self, client: _Client, started: float) -> None:
+        self.slots.release()
+        client.slots.release()
+        client.in_flight -= 1
+        self.in_flight -= 1
+        client.last_seen = time.monotonic()
+        self.group.observe(client.last_seen - started)
+        self._set_gauges()
+
+    def _reject(self, reason: str, retry_after: float) -> None:
+        REJECTED.inc(group=self.group.name, reason=reason)
+        self._set_gauges()
+        raise Rejected(self.group.name, reason, retry_after)
+
+
+def client_key(scope, trust_forwarded: bool = False, api_keys: Collection[str] = ()) -> str:
+    """
+    `X-API-Key` si está en `api_keys`; si no, la IP (la de `X-Forwarded-For`
+    detrás de un proxy de confianza). Una clave desconocida no crea un cliente
+    nuevo: si no, cada valor aleatorio tendría su propio bucket.
+    """
+    headers = Headers(scope=scope)
+    api_key = headers.get(API_KEY_HEADER)
+    if api_key and api_key in api_keys:
+        return f"key:{api_key}"
+    if trust_forwarded:
+        forwarded = headers.get("x-forwarded-for", "").split(",")[0].strip()
+        if forwarded:
+            return f"ip:{forwarded}"
+    client = scope.get("client")
+    return f"ip:{client[0] if client else 'unknown'}"
+
+
+class AdmissionMiddleware:
+    """
+    Middleware ASGI: las peticiones POST de cada grupo pasan por su
+    `Admission`; el turno se mantiene hasta enviar la respuesta completa
+    (también en streaming). El resto de peticiones pasa sin cambios.
+    """
+
+    def __init__(self, app, groups: Iterable[RouteGroup], max_queue: int = 8,
+                 queue_timeout: float = 10.0, max_queue_total: int = 64,
+                 trust_forwarded: bool = False, api_keys: Collection[str] = ()):
+        self.app = app
+        self.admissions = [Admission(g, max_queue, queue_timeout, max_queue_total) for g in groups]
+        self.trust_forwarded = trust_forwarded
+        self.api_keys = frozenset(api_keys)
+        self._warned_forwarded = False
+
+    def _admission(self, scope) -> Optional[Admission]:
+        if scope["type"] != "http" or scope["method"] != "POST":
+            return None
+        return next((a for a in self.admissions if a.group.matches(scope["path"])), None)
+
+    async def __call__(self, scope, receive, send):
+        admission = self._admission(scope)
+        if admission is None:
+            await self.app(scope, receive, send)
+            return
+        if not self.trust_forwarded and not self._warned_forwarded and Headers(scope=scope).get("x-forwarded-for"):
+            # Detrás de un proxy todos los usuarios comparten la IP del proxy (y sus límites)
+            self._warned_forwarded = True
+            print("[WARN] Admission control sees X-Forwarded-For but ADMISSION_TRUST_FORWARDED=false: "
+                  "all clients behind the proxy share one limit")
+        try:
+            client = await admission.acquire(client_key(scope, self.trust_forwarded, self.api_keys))
+        except Rejected as e:
+            await e.response()(scope, receive, send)
+            return
+        started = time.monotonic()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            admission.release(client, started)
+
@@ -9,6 +9,17 @@ load_dotenv()
 # Gemini API Configuration
 GEMINI_KEY = os.getenv("GEMINI_KEY_API")
 GEMINI_MODEL = os.getenv("GEMINI_MODEL", "gemini-2.5-flash")
+GEMINI_BASE_URL = os.getenv("GEMINI_BASE_URL", "https://generativelanguage.googleapis.com").rstrip("/")
+
+# Parse (Gemini) batch and cache
+PARSE_BATCH_CONCURRENCY = int(os.getenv("PARSE_BATCH_CONCURRENCY", "8"))
+PARSE_BATCH_MAX_ITEMS = int(os.getenv("PARSE_BATCH_MAX_ITEMS", "500"))
+PARSE_CACHE_TTL = float(os.getenv("PARSE_CACHE_TTL", "3600"))
+PARSE_CACHE_MAX_ENTRIES = int(os.getenv("PARSE_CACHE_MAX_ENTRIES", "1000"))
+
+# Local pre-extraction: skip Gemini when structured input is parsed with this confidence
+PREEXTRACT_ENABLED = os.getenv("PREEXTRACT_ENABLED", "true").lower() in {"1", "true", "yes"}
+PREEXTRACT_MIN_CONFIDENCE = float(os.getenv("PREEXTRACT_MIN_CONFIDENCE", "0.9"))
 
 # Supabase Configuration
 SUPABASE_URL = os.getenv("SUPABASE_URL") or os.getenv("VITE_SUPABASE_URL")
@@ -22,6 +33,34 @@ SUPABASE_SERVICE_KEY = (
 GMAIL_USER = os.getenv("GMAIL_USER")
 GMAIL_PASSWORD_APP = os.getenv("GMAIL_PASSWORD_APP")
 
+# SMTP connection pool (defaults to Gmail over SSL)
+SMTP_HOST = os.getenv("SMTP_HOST", "smtp.gmail.com")
+SMTP_PORT = int(os.getenv("SMTP_PORT", "465"))
+SMTP_SSL = os.getenv("SMTP_SSL", "true").lower() in {"1", "true", "yes"}
+SMTP_STARTTLS = os.getenv("SMTP_STARTTLS", "false").lower() in {"1", "true", "yes"}
+SMTP_POOL_SIZE = int(os.getenv("SMTP_POOL_SIZE", "4"))
+SMTP_TIMEOUT = float(os.getenv("SMTP_TIMEOUT", "30"))
+SMTP_NOOP_INTERVAL = float(os.getenv("SMTP_NOOP_INTERVAL", "30"))
+
+# Size limits for /emails/send (bytes): each attachment by its raw file size,
+# the whole message by its encoded (base64) size, which is what SMTP servers
+# measure. EMAIL_MAX_MESSAGE_BYTES is the old name of the encoded limit.
+EMAIL_MAX_ATTACHMENT_BYTES = int(os.getenv("EMAIL_MAX_ATTACHMENT_BYTES", str(20 * 1024 * 1024)))
+EMAIL_MAX_ENCODED_MESSAGE_BYTES = int(
+    os.getenv("EMAIL_MAX_ENCODED_MESSAGE_BYTES") or os.getenv("EMAIL_MAX_MESSAGE_BYTES") or str(25 * 1024 * 1024)
+)
+
+# Email outbox (background delivery with retries)
+OUTBOX_DIR = os.getenv("OUTBOX_DIR", ".outbox")
+OUTBOX_WORKERS = int(os.getenv("OUTBOX_WORKERS", "2"))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "6"))
+OUTBOX_RETRY_BASE = float(os.getenv("OUTBOX_RETRY_BASE", "5"))
+OUTBOX_RETRY_MAX = float(os.getenv("OUTBOX_RETRY_MAX", "600"))
+
+# Bulk (mail-merge) sends: messages per second and contacts per page
+EMAIL_BULK_RATE = float(os.getenv("EMAIL_BULK_RATE", "10"))
+EMAIL_BULK_PAGE_SIZE = int(os.getenv("EMAIL_BULK_PAGE_SIZE", "500"))
+
 # CORS Configuration
 CORS_ORIGIN = os.getenv("CORS_ORIGIN", "*")
 ALLOWED_ORIGINS = [
@@ -30,3 +69,126 @@ ALLOWED_ORIGINS = [
     "https://instrategy-sales-flow.lovable.app",
     CORS_ORIGIN
 ]
+
+# Admin token (X-Admin-Token) for ?profile=1 and other admin-only features
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+PROFILE_SAMPLE_INTERVAL = float(os.getenv("PROFILE_SAMPLE_INTERVAL", "0.005"))
+
+# Upstream timeouts (seconds)
+HUBSPOT_TIMEOUT = float(os.getenv("HUBSPOT_TIMEOUT", "10"))
+GEMINI_TIMEOUT = float(os.getenv("GEMINI_TIMEOUT", "60"))
+
+# Circuit breakers: open after N consecutive failures, probe again after the reset timeout
+BREAKER_FAILURE_THRESHOLD = int(os.getenv("BREAKER_FAILURE_THRESHOLD", "5"))
+BREAKER_RESET_TIMEOUT = float(os.getenv("BREAKER_RESET_TIMEOUT", "30"))
+
+# Bulkheads: max concurrent calls per upstream and max wait for a free slot
+# (SMTP has no bulkhead: the connection pool already bounds it)
+BULKHEAD_LIMITS = {
+    "hubspot": int(os.getenv("BULKHEAD_HUBSPOT", "8")),
+    "gemini": int(os.getenv("BULKHEAD_GEMINI", "16")),
+    "supabase": int(os.getenv("BULKHEAD_SUPABASE", "32")),
+}
+BULKHEAD_MAX_WAIT = float(os.getenv("BULKHEAD_MAX_WAIT", "2"))
+
+# Per-client admission control (allow-listed X-API-Key or IP) for expensive POST routes:
+# concurrent requests and token bucket (requests/second, burst) per client and route group,
+# plus concurrent requests per group across all clients (max_in_flight).
+# Clients are keyed by IP: behind a reverse proxy set ADMISSION_TRUST_FORWARDED=true,
+# otherwise every user shares the proxy's limits
+ADMISSION_ENABLED = os.getenv("ADMISSION_ENABLED", "true").lower() in ("1", "true", "yes")
+ADMISSION_GROUPS = {
+    "parse": {
+        "prefixes": ("/parse",),
+        "concurrency": int(os.getenv("ADMISSION_PARSE_CONCURRENCY", "4")),
+        "rate": float(os.getenv("ADMISSION_PARSE_RATE", "2")),
+        "burst": float(os.getenv("ADMISSION_PARSE_BURST", "10")),
+        "max_in_flight": int(os.getenv("ADMISSION_PARSE_MAX_IN_FLIGHT", "16")),
+    },
+    "sync": {
+        "prefixes": ("/sync",),
+        "concurrency": int(os.getenv("ADMISSION_SYNC_CONCURRENCY", "4")),
+        "rate": float(os.getenv("ADMISSION_SYNC_RATE", "5")),
+        "burst": float(os.getenv("ADMISSION_SYNC_BURST", "20")),
+        "max_in_flight": int(os.getenv("ADMISSION_SYNC_MAX_IN_FLIGHT", "16")),
+    },
+    "email": {
+        "prefixes": ("/emails/send", "/emails/bulk"),
+        "concurrency": int(os.getenv("ADMISSION_EMAIL_CONCURRENCY", "2")),
+        "rate": float(os.getenv("ADMISSION_EMAIL_RATE", "2")),
+        "burst": float(os.getenv("ADMISSION_EMAIL_BURST", "10")),
+        "max_in_flight": int(os.getenv("ADMISSION_EMAIL_MAX_IN_FLIGHT", "8")),
+    },
+}
+# Requests a client may have queued per group, and max seconds queued, before a 429
+ADMISSION_MAX_QUEUE = int(os.getenv("ADMISSION_MAX_QUEUE", "8"))
+ADMISSION_QUEUE_TIMEOUT = float(os.getenv("ADMISSION_QUEUE_TIMEOUT", "10"))
+# Requests queued per group across all clients before a 429
+ADMISSION_MAX_QUEUE_TOTAL = int(os.getenv("ADMISSION_MAX_QUEUE_TOTAL", "64"))
+# X-API-Key values that get their own limits (comma-separated); any other key is keyed by IP
+ADMISSION_API_KEYS = {k.strip() for k in os.getenv("ADMISSION_API_KEYS", "").split(",") if k.strip()}
+# Use the first X-Forwarded-For address as the client IP (only behind a trusted proxy)
+ADMISSION_TRUST_FORWARDED = os.getenv("ADMISSION_TRUST_FORWARDED", "false").lower() in ("1", "true", "yes")
+
+# Idempotency-Key: how long (seconds) and how many responses are kept for replay
+IDEMPOTENCY_TTL = float(os.getenv("IDEMPOTENCY_TTL", "86400"))
+IDEMPOTENCY_MAX_ENTRIES = int(os.getenv("IDEMPOTENCY_MAX_ENTRIES", "10000"))
+
+# Background Supabase -> HubSpot sync (needs a cursor column such as updated_at kept by a trigger)
+HUBSPOT_SYNC_ENABLED = os.getenv("HUBSPOT_SYNC_ENABLED", "false").lower() in ("1", "true", "yes")
+HUBSPOT_SYNC_INTERVAL = float(os.getenv("HUBSPOT_SYNC_INTERVAL", "60"))
+HUBSPOT_SYNC_BATCH_SIZE = int(os.getenv("HUBSPOT_SYNC_BATCH_SIZE", "100"))
+HUBSPOT_SYNC_CURSOR_COLUMN = os.getenv("HUBSPOT_SYNC_CURSOR_COLUMN", "updated_at")
+HUBSPOT_SYNC_STATE_PATH = os.getenv("HUBSPOT_SYNC_STATE_PATH", ".sync/hubspot.json")
+
+# HubSpot -> Supabase import: rows per upsert
+HUBSPOT_IMPORT_CHUNK_SIZE = int(os.getenv("HUBSPOT_IMPORT_CHUNK_SIZE", "500"))
+
+# Failed /sync/* calls are kept in a local SQLite table and replayed in bulk (batch calls per second)
+HUBSPOT_DEAD_LETTER_PATH = os.getenv("HUBSPOT_DEAD_LETTER_PATH", ".sync/dead_letters.sqlite3")
+HUBSPOT_REPLAY_RATE = float(os.getenv("HUBSPOT_REPLAY_RATE", "4"))
+
+# HubSpot property definitions: validate payloads locally before sending, refresh every TTL seconds
+HUBSPOT_SCHEMA_VALIDATION = os.getenv("HUBSPOT_SCHEMA_VALIDATION", "true").lower() in ("1", "true", "yes")
+HUBSPOT_SCHEMA_TTL = float(os.getenv("HUBSPOT_SCHEMA_TTL", "3600"))
+
+# /events (Server-Sent Events): per-client queue, events kept for Last-Event-ID resume, heartbeat seconds
+EVENTS_QUEUE_SIZE = int(os.getenv("EVENTS_QUEUE_SIZE", "256"))
+EVENTS_HISTORY = int(os.getenv("EVENTS_HISTORY", "1000"))
+EVENTS_HEARTBEAT = float(os.getenv("EVENTS_HEARTBEAT", "15"))
+EVENTS_MAX_CLIENTS = int(os.getenv("EVENTS_MAX_CLIENTS", "1000"))
+
+# Responses: JSON serializer ("orjson" if installed, or "json") and gzip/brotli compression
+JSON_SERIALIZER = os.getenv("JSON_SERIALIZER", "orjson").lower()
+COMPRESSION_ENABLED = os.getenv("COMPRESSION_ENABLED", "true").lower() in ("1", "true", "yes")
+COMPRESSION_MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", "1024"))
+GZIP_LEVEL = int(os.getenv("GZIP_LEVEL", "5"))
+BROTLI_QUALITY = int(os.getenv("BROTLI_QUALITY", "4"))
+# Full HubSpot list dumps (/empresas, /contactos without params) are kept encoded for this many seconds
+HUBSPOT_LIST_CACHE_TTL = float(os.getenv("HUBSPOT_LIST_CACHE_TTL", "30"))
+
+# Typed CRUD routes (/companies, /contacts, /calls): rows per bulk request and per insert,
+# keyset page size for /export, seconds list/get responses are cached (0 disables)
+CRUD_BULK_MAX_ROWS = int(os.getenv("CRUD_BULK_MAX_ROWS", "1000"))
+CRUD_BULK_CHUNK_SIZE = int(os.getenv("CRUD_BULK_CHUNK_SIZE", "500"))
+CRUD_EXPORT_PAGE_SIZE = int(os.getenv("CRUD_EXPORT_PAGE_SIZE", "1000"))
+CRUD_CACHE_TTL = float(os.getenv("CRUD_CACHE_TTL", "0"))
+
+# Parquet snapshots of companies/contacts/calls/emails for analytics (needs pyarrow):
+# output directory, rows per Supabase page, partitioning ("month" of created_at or "none"),
+# column used for incremental appends ("id": new rows only; "updated_at" also picks up edits
+# but the column must exist and be bumped on every write, e.g. by a moddatetime trigger),
+# Parquet compression, and seconds between background incremental snapshots (0 disables).
+# Incremental snapshots never reflect deletes: run a full one for that
+SNAPSHOT_DIR = os.getenv("SNAPSHOT_DIR", ".snapshots")
+SNAPSHOT_PAGE_SIZE = int(os.getenv("SNAPSHOT_PAGE_SIZE", "5000"))
+SNAPSHOT_PARTITION = os.getenv("SNAPSHOT_PARTITION", "month").lower()
+SNAPSHOT_CURSOR_COLUMN = os.getenv("SNAPSHOT_CURSOR_COLUMN", "id")
+SNAPSHOT_COMPRESSION = os.getenv("SNAPSHOT_COMPRESSION", "zstd")
+SNAPSHOT_INTERVAL = float(os.getenv("SNAPSHOT_INTERVAL", "0"))
+
+# Startup: warm up external clients in the background (comma-separated names)
+WARMUP_ON_STARTUP = os.getenv("WARMUP_ON_STARTUP", "true").lower() in ("1", "true", "yes")
+WARMUP_CLIENTS = [
+    c.strip() for c in os.getenv("WARMUP_CLIENTS", "supabase,hubspot,gemini,smtp").split(",") if c.strip()
+]
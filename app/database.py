@@ -1,34 +1,53 @@
 """
 Configuración de la base de datos y dependencias de Supabase
 """
-from typing import Optional
+from typing import TYPE_CHECKING, Any, Optional
 from fastapi import HTTPException
 
-try:
-    from supabase import create_client, Client
-except Exception:
-    create_client = None
-    Client = None
-
 from app.config import SUPABASE_URL, SUPABASE_SERVICE_KEY
+from app.registry import registry
+
+if TYPE_CHECKING:
+    from supabase import Client
+else:
+    # El paquete supabase se importa en el primer uso (arranque más rápido)
+    Client = Any
 
-# Cliente de Supabase
-supabase_client: Optional[Client] = None
 
-if create_client and SUPABASE_URL and SUPABASE_SERVICE_KEY:
+def create_supabase_client() -> Optional[Client]:
+    """Crear el cliente de Supabase; None si no está configurado o falla"""
+    if not (SUPABASE_URL and SUPABASE_SERVICE_KEY):
+        return None
+    try:
+        from supabase import create_client
+    except Exception:
+        return None
     try:
-        supabase_client = create_client(SUPABASE_URL, SUPABASE_SERVICE_KEY)
+        client = create_client(SUPABASE_URL, SUPABASE_SERVICE_KEY)
     except Exception as e:
         print("[WARN] Could not initialize Supabase client:", e)
+        return None
+
+    from app.http_instrumentation import instrumented_session, postgrest_operation
+    session = client.postgrest.session
+    client.postgrest.session = instrumented_session(session, "supabase", postgrest_operation)
+    session.close()
+    return client
+
+
+def get_client() -> Optional[Client]:
+    """Cliente de Supabase compartido (creado en el primer uso) o None"""
+    return registry.get("supabase")
 
 
 def get_supabase() -> Client:
     """
     Dependency para obtener el cliente de Supabase
     """
-    if not supabase_client:
+    client = get_client()
+    if not client:
         raise HTTPException(
             status_code=500,
             detail="Supabase server client not configured (set SUPABASE_URL and SUPABASE_SERVICE_ROLE_KEY)"
         )
-    return supabase_client
+    return client
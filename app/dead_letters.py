@@ -0,0 +1,366 @@
+"""
+Dead letters de la sincronización con HubSpot.
+Cuando `/sync/empresa` o `/sync/contacto` fallan por HubSpot (5xx, 429,
+circuito abierto o red) el registro se guarda en una tabla SQLite local con
+sus propiedades ya mapeadas y el error, en lugar de perderse con el 500.
+Tras la caída se reenvían todos de una vez con las APIs batch de HubSpot, a
+un ritmo limitado, y los `hubspot_id` nuevos se guardan en Supabase. Si
+HubSpot rechaza un lote por un registro inválido (4xx), el lote se parte para
+aislarlo y el resto se reenvía igualmente.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from fastapi import HTTPException
+
+from app import database, events, metrics
+from app.config import HUBSPOT_DEAD_LETTER_PATH, HUBSPOT_REPLAY_RATE
+from app.hubspot_api import (
+    BATCH_LIMIT,
+    HubSpotError,
+    actualizar_en_lote,
+    asociar_contactos_empresas,
+    crear_en_lote,
+    propiedades_contacto,
+    propiedades_empresa,
+    upsert_contactos_por_email,
+)
+from app.ratelimit import TokenBucket
+from app.resilience import UpstreamUnavailable
+
+OBJECT_TYPES = ("companies", "contacts")
+# Ids por lectura al guardar hubspot_id (longitud de la URL de `in_`)
+WRITE_BACK_CHUNK = 200
+
+DEAD_LETTERS = metrics.counter(
+    "hubspot_dead_letters_total", "Failed HubSpot syncs stored and replayed", ("entity", "outcome")
+)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS hubspot_dead_letters (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    object_type TEXT NOT NULL,
+    record_id INTEGER NOT NULL,
+    hubspot_id TEXT,
+    company_hubspot_id TEXT,
+    properties TEXT NOT NULL,
+    data TEXT NOT NULL,
+    error TEXT,
+    status_code INTEGER,
+    attempts INTEGER NOT NULL DEFAULT 1,
+    created_at TEXT NOT NULL,
+    updated_at TEXT NOT NULL,
+    UNIQUE (object_type, record_id)
+)
+"""
+
+
+def _now_iso() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+def error_status(error: Exception) -> Optional[int]:
+    """Estado HTTP del fallo: el de HubSpot si lo hubo (no el 500 con que se responde)"""
+    if isinstance(error, HubSpotError):
+        return error.upstream_status
+    if isinstance(error, UpstreamUnavailable):
+        return 503
+    return getattr(error, "status_code", None)
+
+
+def is_retryable(error: Exception) -> bool:
+    """Fallos de HubSpot que un reenvío puede resolver: 429, 5xx, circuito abierto o red"""
+    if isinstance(error, (HubSpotError, UpstreamUnavailable, HTTPException)):
+        status = error_status(error)
+        return status == 429 or status >= 500
+    return True
+
+
+def write_hubspot_ids(db, table: str, hubspot_ids: Dict[int, str]) -> List[dict]:
+    """
+    Guardar {id de Supabase: hubspot_id} con dos llamadas por bloque, no una
+    por fila: se leen las filas que siguen existiendo sin `hubspot_id` y se
+    hace un upsert solo de (id, hubspot_id). No se reescriben otras columnas
+    ni se recrean filas borradas. Devuelve las filas escritas (ya publicadas
+    en /events).
+    """
+    ids = list(hubspot_ids)
+    written: List[dict] = []
+    try:
+        for start in range(0, len(ids), WRITE_BACK_CHUNK):
+            resp = (
+                db.table(table).select("id")
+                .in_("id", ids[start:start + WRITE_BACK_CHUNK]).is_("hubspot_id", "null").execute()
+            )
+            rows = [{"id": r["id"], "hubspot_id": hubspot_ids[r["id"]]} for r in resp.data or []]
+            if rows:
+                written.extend(db.table(table).upsert(rows, on_conflict="id").execute().data or [])
+    finally:
+        events.publish(table, events.UPDATED, written)
+    return written
+
+
+class DeadLetterStore:
+    def __init__(self, path: str):
+        self.path = path
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+
+    def _db(self) -> sqlite3.Connection:
+        if self._conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(SCHEMA)
+            self._conn = conn
+        return self._conn
+
+    @staticmethod
+    def _row(row: sqlite3.Row) -> dict:
+        item = dict(row)
+        item["properties"] = json.loads(item["properties"])
+        item["data"] = json.loads(item["data"])
+        return item
+
+    def record(self, object_type: str, data: dict, properties: dict, error: str,
+               status_code: Optional[int] = None, company_hubspot_id: Optional[str] = None) -> None:
+        """Guardar un fallo; si el registro ya estaba, se reemplaza por su última versión"""
+        now = _now_iso()
+        with self._lock:
+            db = self._db()
+            db.execute(
+                """
+                INSERT INTO hubspot_dead_letters (object_type, record_id, hubspot_id, company_hubspot_id,
+                    properties, data, error, status_code, created_at, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (object_type, record_id) DO UPDATE SET
+                    hubspot_id = COALESCE(excluded.hubspot_id, hubspot_id),
+                    company_hubspot_id = COALESCE(excluded.company_hubspot_id, company_hubspot_id),
+                    properties = excluded.properties, data = excluded.data, error = excluded.error,
+                    status_code = excluded.status_code, attempts = attempts + 1,
+                    updated_at = excluded.updated_at
+                """,
+                (object_type, data["id"], data.get("hubspot_id"), company_hubspot_id,
+                 json.dumps(properties), json.dumps(data, default=str), error, status_code, now, now),
+            )
+            db.commit()
+
+    def list(self, object_type: Optional[str] = None, limit: int = 100, offset: int = 0) -> Tuple[List[dict], int]:
+        where, args = ("WHERE object_type = ?", [object_type]) if object_type else ("", [])
+        with self._lock:
+            db = self._db()
+            total = db.execute(f"SELECT COUNT(*) FROM hubspot_dead_letters {where}", args).fetchone()[0]
+            rows = db.execute(
+                f"SELECT * FROM hubspot_dead_letters {where} ORDER BY id LIMIT ? OFFSET ?", args + [limit, offset]
+            ).fetchall()
+        return [self._row(r) for r in rows], total
+
+    def counts(self) -> Dict[str, int]:
+        with self._lock:
+            rows = self._db().execute(
+                "SELECT object_type, COUNT(*) FROM hubspot_dead_letters GROUP BY object_type"
+            ).fetchall()
+        return {object_type: n for object_type, n in rows}
+
+    def batch(self, object_type: str, after_id: int, limit: int) -> List[dict]:
+        """Siguiente bloque por id (para recorrer la tabla mientras se reenvía)"""
+        with self._lock:
+            rows = self._db().execute(
+                "SELECT * FROM hubspot_dead_letters WHERE object_type = ? AND id > ? ORDER BY id LIMIT ?",
+                (object_type, after_id, limit),
+            ).fetchall()
+        return [self._row(r) for r in rows]
+
+    def delete(self, ids: Iterable[int]) -> int:
+        ids = list(ids)
+        if not ids:
+            return 0
+        with self._lock:
+            db = self._db()
+            cursor = db.executemany("DELETE FROM hubspot_dead_letters WHERE id = ?", [(i,) for i in ids])
+            db.commit()
+        return cursor.rowcount
+
+    def failed_again(self, ids: Iterable[int], error: str, hubspot_ids: Optional[Dict[int, str]] = None,
+                     status_code: Optional[int] = None) -> None:
+        """Reenvío fallido: sumar el intento (y guardar el hubspot_id si ya se creó)"""
+        hubspot_ids = hubspot_ids or {}
+        now = _now_iso()
+        with self._lock:
+            db = self._db()
+            db.executemany(
+                """
+                UPDATE hubspot_dead_letters SET attempts = attempts + 1, error = ?, updated_at = ?,
+                    hubspot_id = COALESCE(?, hubspot_id), status_code = COALESCE(?, status_code)
+                WHERE id = ?
+                """,
+                [(error, now, hubspot_ids.get(i), status_code, i) for i in ids],
+            )
+            db.commit()
+
+
+class Replay:
+    """Reenvío en bloque de las dead letters (bloqueante: ejecutar en un hilo)"""
+
+    def __init__(self, store: DeadLetterStore, rate: float):
+        self.store = store
+        # Llamadas batch a HubSpot por segundo
+        self.limiter = TokenBucket(rate)
+
+    def _call(self, fn, *args):
+        while True:
+            wait = self.limiter.try_acquire()
+            if wait <= 0:
+                return fn(*args)
+            time.sleep(wait)
+
+    def _push(self, object_type: str, letters: List[dict], done: Dict[int, str]) -> None:
+        """Enviar un bloque; anota en `done` {id de dead letter: hubspot_id} de los enviados"""
+        updates = [l for l in letters if l["hubspot_id"]]
+        others = [l for l in letters if not l["hubspot_id"]]
+        if updates:
+            updated = set(self._call(actualizar_en_lote, object_type,
+                                     [(l["hubspot_id"], l["properties"]) for l in updates]))
+            done.update({l["id"]: l["hubspot_id"] for l in updates if l["hubspot_id"] in updated})
+        # El email identifica al contacto en HubSpot: upsert para evitar duplicados
+        upserts = [l for l in others if object_type == "contacts" and l["properties"].get("email")]
+        creates = [l for l in others if l not in upserts]
+        if upserts:
+            by_email = self._call(upsert_contactos_por_email, [l["properties"] for l in upserts])
+            for l in upserts:
+                hubspot_id = by_email.get(l["properties"]["email"].lower())
+                if hubspot_id:
+                    done[l["id"]] = hubspot_id
+        if creates:
+            created = self._call(crear_en_lote, object_type, [(str(l["id"]), l["properties"]) for l in creates])
+            done.update({int(key): hubspot_id for key, hubspot_id in created.items()})
+
+    def _send(self, object_type: str, letters: List[dict], done: Dict[int, str],
+              rejected: Dict[int, Exception]) -> None:
+        """
+        `_push` de un bloque. Si HubSpot lo rechaza por un error del cliente
+        (4xx que no es 429), se parte en mitades hasta aislar los registros
+        inválidos, que quedan en `rejected`; un fallo reintentable se propaga.
+        """
+        pending = [l for l in letters if l["id"] not in done]
+        if not pending:
+            return
+        try:
+            self._push(object_type, pending, done)
+        except Exception as e:
+            if is_retryable(e):
+                raise
+            if len(pending) == 1:
+                rejected[pending[0]["id"]] = e
+                return
+            middle = len(pending) // 2
+            self._send(object_type, pending[:middle], done, rejected)
+            self._send(object_type, pending[middle:], done, rejected)
+
+    def _associate(self, letters: List[dict], done: Dict[int, str]) -> None:
+        pairs = [(done[l["id"]], l["company_hubspot_id"]) for l in letters
+                 if l["id"] in done and l["company_hubspot_id"]]
+        if pairs:
+            self._call(asociar_contactos_empresas, pairs)
+
+    def _write_back(self, object_type: str, letters: List[dict], done: Dict[int, str]) -> None:
+        """
+        Guardar en Supabase los hubspot_id nuevos, en una escritura por bloque.
+        Solo se escribe `hubspot_id` (y solo si sigue vacío): `data` es la fila
+        de cuando falló y reescribirla desharía los cambios posteriores.
+        """
+        db = database.get_client()
+        if db is None:
+            return
+        write_hubspot_ids(db, object_type, {
+            l["record_id"]: done[l["id"]]
+            for l in letters if l["id"] in done and not l["data"].get("hubspot_id")
+        })
+
+    def run(self, object_types: Iterable[str] = OBJECT_TYPES, limit: Optional[int] = None) -> dict:
+        result: Dict[str, object] = {"ok": True, "replayed": {}, "failed": {}}
+        budget = limit
+        for object_type in [o for o in OBJECT_TYPES if o in set(object_types)]:
+            replayed = failed = 0
+            last_id = 0
+            while budget is None or budget > 0:
+                size = BATCH_LIMIT if budget is None else min(BATCH_LIMIT, budget)
+                letters = self.store.batch(object_type, last_id, size)
+                if not letters:
+                    break
+                last_id = letters[-1]["id"]
+                if budget is not None:
+                    budget -= len(letters)
+                done: Dict[int, str] = {}
+                rejected: Dict[int, Exception] = {}
+                try:
+                    self._send(object_type, letters, done, rejected)
+                    if object_type == "contacts":
+                        self._associate(letters, done)
+                    self._write_back(object_type, letters, done)
+                except Exception as e:
+                    # HubSpot sigue fallando: no insistir con el resto
+                    error = str(getattr(e, "detail", e))
+                    # Los ya creados guardan su hubspot_id: el próximo reenvío los actualiza
+                    self.store.failed_again([l["id"] for l in letters], error, done)
+                    failed += len(letters)
+                    DEAD_LETTERS.inc(len(letters), entity=object_type, outcome="replay_failed")
+                    result.update(ok=False, error=error)
+                    break
+                # Rechazados por HubSpot: siguen como dead letter con su error, el lote sigue
+                for letter_id, e in rejected.items():
+                    self.store.failed_again([letter_id], str(getattr(e, "detail", e)), status_code=error_status(e))
+                missing = [l["id"] for l in letters if l["id"] not in done and l["id"] not in rejected]
+                self.store.delete(done)
+                self.store.failed_again(missing, "HubSpot did not return this record in the batch response")
+                replayed += len(done)
+                failed += len(missing) + len(rejected)
+                DEAD_LETTERS.inc(len(done), entity=object_type, outcome="replayed")
+                if missing or rejected:
+                    DEAD_LETTERS.inc(len(missing) + len(rejected), entity=object_type, outcome="replay_failed")
+            result["replayed"][object_type] = replayed
+            result["failed"][object_type] = failed
+            if not result["ok"]:
+                break
+        result["remaining"] = self.store.counts()
+        return result
+
+
+store = DeadLetterStore(HUBSPOT_DEAD_LETTER_PATH)
+_replaying = threading.Lock()
+
+MAPPERS = {"companies": propiedades_empresa, "contacts": propiedades_contacto}
+
+
+def record_sync_failure(object_type: str, data: dict, error: Exception,
+                        company_hubspot_id: Optional[str] = None) -> bool:
+    """Guardar un `/sync/*` fallido si reenviarlo puede funcionar; True si se guardó"""
+    if not is_retryable(error):
+        return False
+    status_code = error_status(error)
+    try:
+        store.record(object_type, data, MAPPERS[object_type](data), str(getattr(error, "detail", error)),
+                     status_code, company_hubspot_id)
+    except Exception as e:
+        print(f"[WARN] No se pudo guardar la dead letter de {object_type} {data.get('id')}: {e}")
+        return False
+    DEAD_LETTERS.inc(entity=object_type, outcome="recorded")
+    return True
+
+
+def replay(object_types: Iterable[str] = OBJECT_TYPES, limit: Optional[int] = None) -> dict:
+    """Reenviar las dead letters; no se solapa con otro reenvío en curso"""
+    if not _replaying.acquire(blocking=False):
+        return {"ok": False, "reason": "already_running"}
+    try:
+        return Replay(store, HUBSPOT_REPLAY_RATE).run(object_types, limit)
+    finally:
+        _replaying.release()
@@ -0,0 +1,207 @@
+"""
+Resolución de entidades para contactos extraídos por el parser.
+Empareja cada item con contactos existentes (por email o por nombre + empresa),
+resuelve `company` → `company_id`, deduplica y escribe en lote.
+"""
+import re
+import unicodedata
+from typing import Dict, List, Optional, Tuple
+
+from pydantic import ValidationError
+
+from app import events
+from app.models import ContactCreate
+
+# Campos del item parseado que se copian a la fila de contacts
+CONTACT_FIELDS = ("first_name", "last_name", "cargo", "email", "telefono", "country", "role")
+# Emails por consulta: cada uno es un `email.ilike."…"` en la URL
+EMAIL_CHUNK_SIZE = 100
+
+
+def normalize_text(value: Optional[str]) -> str:
+    """Minúsculas, sin acentos ni espacios repetidos"""
+    value = unicodedata.normalize("NFKD", value or "")
+    value = "".join(c for c in value if not unicodedata.combining(c))
+    return re.sub(r"\s+", " ", value).strip().lower()
+
+
+def normalize_email(value: Optional[str]) -> str:
+    return (value or "").strip().lower()
+
+
+def _name_key(nombre: Optional[str], company_id: Optional[int]) -> Optional[Tuple[str, Optional[int]]]:
+    name = normalize_text(nombre)
+    return (name, company_id) if name else None
+
+
+def _chunks(values: List[str], size: int = 200):
+    for i in range(0, len(values), size):
+        yield values[i:i + size]
+
+
+def _to_row(item: dict, company_index: Dict[str, int]) -> dict:
+    """Convertir un item del parser en columnas de la tabla contacts"""
+    row = {k: item.get(k) for k in CONTACT_FIELDS if item.get(k)}
+    if row.get("email"):
+        row["email"] = normalize_email(row["email"])
+    nombre = item.get("nombre") or " ".join(
+        p for p in (item.get("first_name"), item.get("last_name")) if p
+    )
+    if not nombre and row.get("email"):
+        nombre = row["email"].split("@")[0]
+    if nombre:
+        row["nombre"] = nombre
+    company = normalize_text(item.get("company"))
+    if company and company in company_index:
+        row["company_id"] = company_index[company]
+    return row
+
+
+def _fetch_company_index(db) -> Dict[str, int]:
+    resp = db.table("companies").select("id,name").limit(1000).execute()
+    return {
+        normalize_text(r.get("name")): r["id"]
+        for r in (getattr(resp, "data", None) or [])
+        if r.get("name")
+    }
+
+
+def _quote(value: str) -> str:
+    """Valor entre comillas para un filtro `or` de PostgREST (admite comas y paréntesis)"""
+    return '"' + value.replace("\\", "\\\\").replace('"', '\\"') + '"'
+
+
+def _fetch_existing(db, emails: List[str], names: List[str]) -> List[dict]:
+    """
+    Traer solo los contactos candidatos (por email o nombre), no toda la tabla.
+    Los emails se buscan con `ilike`: en la tabla pueden estar guardados con
+    mayúsculas (`John@Acme.com`) y `in_` compara exacto. `_` y `%` del email
+    pueden traer alguno de más; el emparejado final compara normalizado.
+    """
+    rows: Dict[int, dict] = {}
+    for chunk in _chunks(emails, EMAIL_CHUNK_SIZE):
+        resp = db.table("contacts").select("*").or_(
+            ",".join(f"email.ilike.{_quote(email)}" for email in chunk)
+        ).execute()
+        for r in getattr(resp, "data", None) or []:
+            rows[r["id"]] = r
+    for chunk in _chunks(names):
+        resp = db.table("contacts").select("*").in_("nombre", chunk).execute()
+        for r in getattr(resp, "data", None) or []:
+            rows[r["id"]] = r
+    return list(rows.values())
+
+
+def commit_contacts(db, items: List[dict], defaults: Optional[dict] = None) -> dict:
+    """
+    Resolver y guardar contactos parseados. `defaults` (fuente, propietario)
+    solo se aplican a los contactos nuevos; a los existentes se les envían
+    únicamente las columnas que cambian.
+    Devuelve los ids creados, actualizados, emparejados sin cambios y los omitidos.
+    """
+    defaults = defaults or {}
+    company_index = _fetch_company_index(db)
+
+    # Filas candidatas, deduplicadas dentro del propio lote
+    rows: List[dict] = []
+    seen: Dict[object, dict] = {}
+    skipped: List[dict] = []
+    for index, item in enumerate(items or []):
+        if not isinstance(item, dict):
+            skipped.append({"index": index, "reason": "invalid_item"})
+            continue
+        row = _to_row(item, company_index)
+        if not row.get("nombre") and not row.get("email"):
+            skipped.append({"index": index, "reason": "missing_name_and_email"})
+            continue
+        if item.get("company") and "company_id" not in row:
+            row["_unresolved_company"] = item["company"]
+        keys = [k for k in (row.get("email"), _name_key(row.get("nombre"), row.get("company_id"))) if k]
+        previous = next((seen[k] for k in keys if k in seen), None)
+        if previous is not None:
+            for k, v in row.items():
+                previous.setdefault(k, v)
+            skipped.append({"index": index, "reason": "duplicate_in_batch"})
+            continue
+        row["_index"] = index
+        for k in keys:
+            seen[k] = row
+        rows.append(row)
+
+    # Índices hash de contactos existentes
+    existing = _fetch_existing(
+        db,
+        sorted({r["email"] for r in rows if r.get("email")}),
+        sorted({r["nombre"] for r in rows if r.get("nombre")}),
+    )
+    by_email = {normalize_email(r.get("email")): r for r in existing if r.get("email")}
+    by_name = {}
+    for r in existing:
+        key = _name_key(r.get("nombre"), r.get("company_id"))
+        if key:
+            by_name.setdefault(key, r)
+
+    to_insert: List[dict] = []
+    to_update: Dict[int, dict] = {}
+    matched: List[dict] = []
+    unresolved_companies = sorted({r.pop("_unresolved_company") for r in rows if "_unresolved_company" in r})
+
+    for row in rows:
+        index = row.pop("_index")
+        current = by_email.get(row.get("email")) or by_name.get(
+            _name_key(row.get("nombre"), row.get("company_id"))
+        )
+        if current is None:
+            new_row = {k: v for k, v in defaults.items() if v is not None}
+            new_row.update(row)
+            try:
+                # Solo lo que trae el item: las columnas omitidas toman el DEFAULT de la tabla
+                new_row = ContactCreate(**new_row).model_dump(mode="json", exclude_unset=True)
+            except ValidationError as e:
+                skipped.append({"index": index, "reason": "invalid", "errors": e.errors(include_url=False)})
+                continue
+            to_insert.append(new_row)
+            continue
+
+        pending = to_update.get(current["id"], {})
+        stored = {**current, **pending}
+        changes = {
+            k: v for k, v in row.items()
+            if v not in (None, "") and stored.get(k) != v
+            # El mismo email con otras mayúsculas no es un cambio
+            and not (k == "email" and normalize_email(stored.get(k)) == v)
+        }
+        if changes:
+            to_update[current["id"]] = {**pending, **changes}
+        elif current["id"] not in to_update:
+            matched.append({"index": index, "id": current["id"]})
+
+    created: List[dict] = []
+    updated: List[dict] = []
+    if to_insert:
+        resp = db.table("contacts").insert(to_insert, default_to_null=False).execute()
+        created = getattr(resp, "data", None) or []
+        events.publish("contacts", events.CREATED, created)
+    # Un upsert por conjunto de columnas cambiadas: el resto de la fila no se envía
+    groups: Dict[tuple, List[dict]] = {}
+    for contact_id, changes in to_update.items():
+        groups.setdefault(tuple(sorted(changes)), []).append({"id": contact_id, **changes})
+    for group in groups.values():
+        resp = db.table("contacts").upsert(group, on_conflict="id").execute()
+        rows_updated = getattr(resp, "data", None) or []
+        events.publish("contacts", events.UPDATED, rows_updated)
+        updated.extend(rows_updated)
+
+    return {
+        "created": [r.get("id") for r in created],
+        "updated": [r.get("id") for r in updated],
+        "matched": matched,
+        "skipped": skipped,
+        "unresolved_companies": unresolved_companies,
+        "summary": {
+            "created": len(to_insert),
+            "updated": len(to_update),
+            "matched": len(matched),
+            "skipped": len(skipped),
+        },
+    }
@@ -0,0 +1,220 @@
+"""
+Feed de cambios en memoria para Server-Sent Events (`GET /events`).
+Las rutas CRUD, el outbox, el mail-merge, `/parse?commit=true` y las
+escrituras de `hubspot_id` publican un evento por cada alta, modificación o
+baja; las importaciones masivas publican un `reset` de la tabla. Cada
+cliente conectado tiene su propia cola acotada, así que un cliente lento no
+frena a los demás: si su cola se llena se le envía `reset` y se cierra su
+conexión. Los últimos eventos se guardan para reanudar con `Last-Event-ID`.
+"""
+import asyncio
+import itertools
+import json
+import threading
+import uuid
+from collections import deque
+from typing import Dict, Iterable, List, Optional, Set
+
+from app import metrics
+from app.config import EVENTS_HISTORY, EVENTS_MAX_CLIENTS, EVENTS_QUEUE_SIZE
+
+CREATED = "created"
+UPDATED = "updated"
+DELETED = "deleted"
+RESET = "reset"
+
+TABLES = ("companies", "contacts", "calls", "emails")
+
+SUBSCRIBERS = metrics.gauge("events_subscribers", "Clients connected to the /events stream")
+PUBLISHED = metrics.counter("events_published_total", "Change events published", ("table", "type"))
+LAGGED = metrics.counter("events_lagged_clients_total", "Clients disconnected because their queue filled up")
+
+
+class Event:
+    def __init__(self, seq: int, event_id: str, table: str, type_: str, data: dict):
+        self.seq = seq
+        self.id = event_id
+        self.table = table
+        self.type = type_
+        self.data = data
+
+    def encode(self) -> str:
+        if self.type == RESET:
+            payload = {"table": self.table, "reason": self.data.get("reason")}
+            return f"id: {self.id}\nevent: {RESET}\ndata: {json.dumps(payload)}\n\n"
+        payload = {"table": self.table, "type": self.type, "id": self.data.get("id"), "data": self.data}
+        return f"id: {self.id}\nevent: {self.type}\ndata: {json.dumps(payload, ensure_ascii=False, default=str)}\n\n"
+
+
+def encode_reset(reason: str) -> str:
+    """El cliente debe volver a pedir las listas completas"""
+    return f"event: reset\ndata: {json.dumps({'reason': reason})}\n\n"
+
+
+class TooManySubscribers(Exception):
+    pass
+
+
+class Subscriber:
+    def __init__(self, tables: Optional[Set[str]], queue_size: int):
+        self.tables = tables
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.lagged = False
+
+    def wants(self, table: str) -> bool:
+        return not self.tables or table in self.tables
+
+
+class EventHub:
+    def __init__(self, queue_size: int = 256, history: int = 1000, max_clients: int = 1000):
+        self.queue_size = queue_size
+        self.max_clients = max_clients
+        # Los ids llevan el arranque del proceso: un Last-Event-ID de otro arranque no se reanuda
+        self.boot = uuid.uuid4().hex[:8]
+        self._seq = itertools.count(1)
+        self._history: deque = deque(maxlen=history)
+        self._subscribers: Set[Subscriber] = set()
+        # Versión por tabla: cambia con cada publicación (claves de la caché CRUD)
+        self._versions: Dict[str, int] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread = None
+
+    # ---- Publicación ----
+    def publish(self, table: str, type_: str, rows) -> None:
+        """Publicar un evento por fila (`rows` es la respuesta de Supabase: lista o dict)"""
+        if not rows:
+            return
+        rows = [rows] if isinstance(rows, dict) else list(rows)
+        self.touch(table)
+        loop = self._loop
+        if loop is not None and loop.is_closed():
+            # Bucle cerrado (recarga, otro lifespan): sus clientes ya no existen
+            self._forget_loop(loop)
+            loop = None
+        if loop is not None and threading.get_ident() != self._thread:
+            # Desde un hilo: las colas de asyncio solo se tocan en su bucle.
+            # La escritura ya está hecha: si el bucle se cierra justo ahora se
+            # pierde el evento, pero la petición no falla por ello
+            try:
+                loop.call_soon_threadsafe(self._publish, table, type_, rows)
+            except RuntimeError as e:
+                print(f"[WARN] Event for {table} dropped: {e}")
+            return
+        self._publish(table, type_, rows)
+
+    def _forget_loop(self, loop: asyncio.AbstractEventLoop) -> None:
+        if self._loop is loop:
+            self._loop = self._thread = None
+            self._subscribers.clear()
+            SUBSCRIBERS.set(0)
+
+    def reset(self, table: str, reason: str) -> None:
+        """Cambios masivos sin filas (p. ej. una importación): los clientes recargan la tabla"""
+        self.publish(table, RESET, [{"reason": reason}])
+
+    def touch(self, table: str) -> None:
+        """Cambiar la versión de la tabla sin publicar (escrituras de una importación en curso)"""
+        self._versions[table] = self._versions.get(table, 0) + 1
+
+    def version(self, table: str) -> int:
+        return self._versions.get(table, 0)
+
+    def _publish(self, table: str, type_: str, rows: List[dict]) -> None:
+        for row in rows:
+            if not isinstance(row, dict):
+                continue
+            seq = next(self._seq)
+            event = Event(seq, f"{self.boot}-{seq}", table, type_, row)
+            self._history.append(event)
+            PUBLISHED.inc(table=table, type=type_)
+            for subscriber in self._subscribers:
+                if subscriber.lagged or not subscriber.wants(table):
+                    continue
+                try:
+                    subscriber.queue.put_nowait(event)
+                except asyncio.QueueFull:
+                    # Cliente lento: se le corta en lugar de acumular sin límite
+                    subscriber.lagged = True
+                    LAGGED.inc()
+
+    # ---- Suscripción ----
+    def subscribe(self, tables: Optional[Iterable[str]] = None) -> Subscriber:
+        if self._loop is not None and self._loop.is_closed():
+            self._forget_loop(self._loop)
+        if len(self._subscribers) >= self.max_clients:
+            raise TooManySubscribers()
+        if self._loop is None:
+            self._loop = asyncio.get_running_loop()
+            self._thread = threading.get_ident()
+        subscriber = Subscriber(set(tables) if tables else None, self.queue_size)
+        self._subscribers.add(subscriber)
+        SUBSCRIBERS.set(len(self._subscribers))
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber) -> None:
+        self._subscribers.discard(subscriber)
+        SUBSCRIBERS.set(len(self._subscribers))
+
+    def since(self, last_event_id: str) -> Optional[List[Event]]:
+        """Eventos posteriores a `last_event_id`; None si ya no están en el historial"""
+        boot, _, seq = last_event_id.partition("-")
+        if boot != self.boot or not seq.isdigit():
+            return None
+        seq = int(seq)
+        if self._history and self._history[0].seq > seq + 1:
+            return None
+        return [e for e in self._history if e.seq > seq]
+
+    async def stream(self, subscriber: Subscriber, last_event_id: Optional[str], heartbeat: float):
+        """
+        Generador SSE para un cliente ya suscrito. Si el cliente se desconecta
+        antes del primer bloque el generador no llega a empezar: la ruta
+        desuscribe también en la tarea de fondo de la respuesta.
+        """
+        try:
+            yield "retry: 3000\n\n"
+            sent = 0
+            if last_event_id:
+                backlog = self.since(last_event_id)
+                if backlog is None:
+                    yield encode_reset("history_expired")
+                else:
+                    for event in backlog:
+                        if subscriber.wants(event.table):
+                            yield event.encode()
+                        sent = event.seq
+            while True:
+                try:
+                    event = await asyncio.wait_for(subscriber.queue.get(), heartbeat)
+                except asyncio.TimeoutError:
+                    # Mantener viva la conexión a través de proxies
+                    yield ": ping\n\n"
+                    continue
+                if subscriber.lagged:
+                    yield encode_reset("lagged")
+                    return
+                # Ya enviado en el historial (se suscribió antes de leerlo)
+                if event.seq <= sent:
+                    continue
+                yield event.encode()
+        finally:
+            self.unsubscribe(subscriber)
+
+
+hub = EventHub(EVENTS_QUEUE_SIZE, EVENTS_HISTORY, EVENTS_MAX_CLIENTS)
+
+
+def publish(table: str, type_: str, rows) -> None:
+    hub.publish(table, type_, rows)
+
+
+def reset(table: str, reason: str) -> None:
+    hub.reset(table, reason)
+
+
+def touch(table: str) -> None:
+    hub.touch(table)
+
+
+def version(table: str) -> int:
+    return hub.version(table)
@@ -0,0 +1,304 @@
+"""
+Extracción determinista (sin LLM) de contactos y empresas.
+Reconoce tablas tipo CSV/TSV, vCards y bloques de firma con expresiones
+regulares compiladas y heurísticas, y asigna una confianza al resultado.
+"""
+import csv
+import re
+import unicodedata
+from typing import Callable, Dict, List, Optional
+
+EMAIL_RE = re.compile(r"[A-Za-z0-9._%+\-]+@[A-Za-z0-9.\-]+\.[A-Za-z]{2,}")
+PHONE_RE = re.compile(r"(?<![\w@])\+?\d[\d\s().\-]{6,}\d(?![\w@])")
+URL_RE = re.compile(r"https?://|www\.", re.IGNORECASE)
+VCARD_RE = re.compile(r"BEGIN:VCARD(.*?)END:VCARD", re.IGNORECASE | re.DOTALL)
+DIRECTOR_RE = re.compile(
+    r"\b(ceo|chief executive|director general|directora general|gerente general|managing director)\b",
+    re.IGNORECASE,
+)
+CAPITALIZED_NAME_RE = re.compile(r"^[A-ZÁÉÍÓÚÑ][\w'\-]+(\s+[A-ZÁÉÍÓÚÑ][\w'\-]+){1,3}$")
+
+DELIMITERS = [",", ";", "\t", "|"]
+
+# Encabezados reconocidos (normalizados) → campo de salida
+CONTACT_HEADERS = {
+    "nombre": "nombre", "name": "nombre", "fullname": "nombre", "nombrecompleto": "nombre",
+    "firstname": "first_name", "nombres": "first_name", "primernombre": "first_name",
+    "lastname": "last_name", "apellido": "last_name", "apellidos": "last_name", "surname": "last_name",
+    "empresa": "company", "company": "company", "compania": "company", "organizacion": "company",
+    "organization": "company",
+    "cargo": "cargo", "puesto": "cargo", "title": "cargo", "jobtitle": "cargo", "position": "cargo",
+    "email": "email", "correo": "email", "mail": "email", "emailaddress": "email",
+    "correoelectronico": "email",
+    "telefono": "telefono", "phone": "telefono", "celular": "telefono", "movil": "telefono",
+    "mobile": "telefono", "tel": "telefono",
+    "pais": "country", "country": "country",
+}
+COMPANY_HEADERS = {
+    "nombre": "name", "name": "name", "empresa": "name", "company": "name", "compania": "name",
+    "razonsocial": "name",
+    "pais": "country", "country": "country",
+    "sector": "sector", "industria": "sector", "industry": "sector",
+    "ingresos": "total_revenue", "revenue": "total_revenue", "totalrevenue": "total_revenue",
+    "facturacion": "total_revenue",
+    "utilidad": "net_profit", "netprofit": "net_profit", "ganancianeta": "net_profit",
+    "profit": "net_profit",
+    "leadstatus": "lead_status", "estado": "lead_status",
+}
+
+HIGH_CONFIDENCE = 0.95
+MEDIUM_CONFIDENCE = 0.6
+LOW_CONFIDENCE = 0.3
+
+
+def _normalize(value: str) -> str:
+    value = unicodedata.normalize("NFKD", value or "")
+    value = "".join(c for c in value if not unicodedata.combining(c))
+    return re.sub(r"[^a-z0-9]", "", value.lower())
+
+
+def _digits(value: str) -> str:
+    return re.sub(r"\D", "", value or "")
+
+
+def _role_for(cargo: Optional[str]) -> str:
+    return "Director General" if cargo and DIRECTOR_RE.search(cargo) else "Trabajador"
+
+
+def _finish_contact(item: Dict[str, str]) -> Dict[str, str]:
+    """Completar first_name/last_name y role de un contacto extraído"""
+    nombre = item.pop("nombre", None)
+    if nombre and not item.get("first_name"):
+        parts = nombre.split()
+        item["first_name"] = parts[0]
+        if len(parts) > 1 and not item.get("last_name"):
+            item["last_name"] = " ".join(parts[1:])
+    if item.get("email"):
+        item["email"] = item["email"].strip().lower()
+    item["role"] = _role_for(item.get("cargo"))
+    return {k: v for k, v in item.items() if v}
+
+
+def _split_table(text: str) -> Optional[List[List[str]]]:
+    """Detectar un delimitador con el mismo número de columnas en todas las filas"""
+    lines = [line for line in text.strip().splitlines() if line.strip()]
+    if len(lines) < 2:
+        return None
+    for delimiter in DELIMITERS:
+        if delimiter not in lines[0]:
+            continue
+        rows = [[c.strip() for c in row] for row in csv.reader(lines, delimiter=delimiter)]
+        width = len(rows[0])
+        if width >= 2 and all(len(r) == width for r in rows):
+            return rows
+    return None
+
+
+def _extract_table(_type: str, rows: List[List[str]]) -> Optional[dict]:
+    headers = CONTACT_HEADERS if _type == "contacts" else COMPANY_HEADERS
+    header = [headers.get(_normalize(c)) for c in rows[0]]
+    has_header = sum(1 for h in header if h) * 2 >= len(header) and not any(
+        EMAIL_RE.search(c) for c in rows[0]
+    )
+
+    confidence = HIGH_CONFIDENCE
+    if has_header:
+        body = rows[1:]
+    else:
+        # Sin encabezado: clasificar columnas por contenido
+        body = rows
+        header = []
+        text_columns = (["nombre", "company", "cargo"] if _type == "contacts" else ["name", "country", "sector"])
+        for col in range(len(rows[0])):
+            cells = [r[col] for r in rows if r[col]]
+            if cells and all(EMAIL_RE.fullmatch(c) for c in cells) and _type == "contacts":
+                header.append("email")
+            elif cells and all(PHONE_RE.fullmatch(c) for c in cells) and _type == "contacts":
+                header.append("telefono")
+            else:
+                header.append(text_columns.pop(0) if text_columns else None)
+        confidence = MEDIUM_CONFIDENCE
+
+    items = []
+    for row in body:
+        item = {field: cell for field, cell in zip(header, row) if field and cell}
+        if _type == "contacts":
+            if item.get("email") and not EMAIL_RE.fullmatch(item["email"]):
+                confidence = min(confidence, MEDIUM_CONFIDENCE)
+            item = _finish_contact(item)
+            if not (item.get("first_name") or item.get("email")):
+                continue
+        elif not item.get("name"):
+            continue
+        items.append(item)
+
+    if not items:
+        return None
+    return {"items": items, "confidence": confidence, "format": "table"}
+
+
+def _extract_vcards(blocks: List[str]) -> dict:
+    items = []
+    for block in blocks:
+        item: Dict[str, str] = {}
+        for line in block.splitlines():
+            if ":" not in line:
+                continue
+            key, value = line.split(":", 1)
+            key = key.split(";")[0].strip().upper()
+            value = value.strip()
+            if key == "FN":
+                item["nombre"] = value
+            elif key == "N":
+                parts = value.split(";")
+                item["last_name"] = parts[0].strip()
+                if len(parts) > 1:
+                    item["first_name"] = parts[1].strip()
+            elif key == "ORG":
+                item["company"] = value.split(";")[0].strip()
+            elif key == "TITLE":
+                item["cargo"] = value
+            elif key == "EMAIL" and "email" not in item:
+                item["email"] = value
+            elif key == "TEL" and "telefono" not in item:
+                item["telefono"] = value
+            elif key == "ADR":
+                parts = value.split(";")
+                if len(parts) >= 7 and parts[6].strip():
+                    item["country"] = parts[6].strip()
+        item = _finish_contact(item)
+        if item.get("first_name") or item.get("email"):
+            items.append(item)
+    return {"items": items, "confidence": HIGH_CONFIDENCE if items else 0.0, "format": "vcard"}
+
+
+def _extract_signature(text: str, emails: List[str], phones: List[str]) -> Optional[dict]:
+    """Bloque de firma: nombre, cargo y empresa en las primeras líneas, un solo email"""
+    lines = [line.strip() for line in text.strip().splitlines() if line.strip()]
+    if len(emails) != 1 or len(lines) > 8:
+        return None
+    plain = [
+        line for line in lines
+        if not EMAIL_RE.search(line) and not PHONE_RE.search(line) and not URL_RE.search(line)
+    ]
+    start = next((i for i, line in enumerate(plain) if CAPITALIZED_NAME_RE.match(line)), None)
+    if start is None:
+        return None
+    plain = plain[start:]
+    item = {"nombre": plain[0], "email": emails[0]}
+    if len(plain) > 1:
+        item["cargo"] = plain[1]
+    if len(plain) > 2:
+        item["company"] = plain[2]
+    if phones:
+        item["telefono"] = phones[0]
+    return {"items": [_finish_contact(item)], "confidence": MEDIUM_CONFIDENCE, "format": "signature"}
+
+
+def pre_extract(_type: str, text: str) -> dict:
+    """
+    Extraer items localmente. Devuelve `items`, `confidence` (0..1), `format`
+    y los `emails`/`phones` presentes en el texto (para validar la salida del LLM).
+    """
+    text = text or ""
+    emails = [e.lower() for e in EMAIL_RE.findall(text)]
+    phones = [p.strip() for p in PHONE_RE.findall(text)]
+    result: Optional[dict] = None
+
+    vcards = VCARD_RE.findall(text) if _type == "contacts" else []
+    if vcards:
+        result = _extract_vcards(vcards)
+    else:
+        rows = _split_table(text)
+        if rows:
+            result = _extract_table(_type, rows)
+        if result is None and _type == "contacts":
+            result = _extract_signature(text, emails, phones)
+
+    if result is None:
+        items = [{"email": e} for e in dict.fromkeys(emails)] if _type == "contacts" else []
+        result = {"items": items, "confidence": LOW_CONFIDENCE if items else 0.0, "format": "free"}
+
+    result["emails"] = emails
+    result["phones"] = phones
+    return result
+
+
+def item_merger(extraction: dict) -> Callable[[dict], dict]:
+    """
+    Validar y completar un item del LLM con lo extraído localmente (ver
+    `merge_extraction`); los índices se construyen una vez, para aplicarlo a
+    cada item según llega en el streaming.
+    """
+    known_emails = set(extraction.get("emails") or [])
+    known_phones = {_digits(p) for p in extraction.get("phones") or []}
+    local_by_email = {i["email"]: i for i in extraction.get("items") or [] if i.get("email")}
+    local_by_name = {
+        _normalize(f"{i.get('first_name', '')}{i.get('last_name', '')}"): i
+        for i in extraction.get("items") or []
+        if i.get("first_name")
+    }
+
+    def merge(item: dict) -> dict:
+        email = str(item.get("email") or "").strip().lower()
+        if email and email not in known_emails:
+            item.pop("email", None)
+            email = ""
+        phone = _digits(str(item.get("telefono") or ""))
+        if phone and not any(phone.endswith(p) or p.endswith(phone) for p in known_phones if p):
+            item.pop("telefono", None)
+
+        local = local_by_email.get(email) or local_by_name.get(
+            _normalize(f"{item.get('first_name', '')}{item.get('last_name', '')}")
+        )
+        if local:
+            for field in ("email", "telefono"):
+                if not item.get(field) and local.get(field):
+                    item[field] = local[field]
+        return item
+
+    return merge
+
+
+def merge_extraction(parsed, extraction: dict):
+    """
+    Validar y completar la salida del LLM con lo extraído localmente:
+    descarta emails/teléfonos que no aparecen en el texto y rellena los
+    que falten a partir de los items locales (por email o nombre).
+    """
+    if not isinstance(parsed, dict) or not isinstance(parsed.get("items"), list):
+        return parsed
+    merge = item_merger(extraction)
+    for item in parsed["items"]:
+        if isinstance(item, dict):
+            merge(item)
+    return parsed
+
+    known_emails = set(extraction.get("emails") or [])
+    known_phones = {_digits(p) for p in extraction.get("phones") or []}
+    local_by_email = {i["email"]: i for i in extraction.get("items") or [] if i.get("email")}
+    local_by_name = {
+        _normalize(f"{i.get('first_name', '')}{i.get('last_name', '')}"): i
+        for i in extraction.get("items") or []
+        if i.get("first_name")
+    }
+
+    for item in parsed["items"]:
+        if not isinstance(item, dict):
+            continue
+        email = str(item.get("email") or "").strip().lower()
+        if email and email not in known_emails:
+            item.pop("email", None)
+            email = ""
+        phone = _digits(str(item.get("telefono") or ""))
+        if phone and not any(phone.endswith(p) or p.endswith(phone) for p in known_phones if p):
+            item.pop("telefono", None)
+
+        local = local_by_email.get(email) or local_by_name.get(
+            _normalize(f"{item.get('first_name', '')}{item.get('last_name', '')}")
+        )
+        if local:
+            for field in ("email", "telefono"):
+                if not item.get(field) and local.get(field):
+                    item[field] = local[field]
+    return parsed
@@ -0,0 +1,94 @@
+"""
+Transportes httpx instrumentados (Supabase/PostgREST y Gemini).
+Separado de `app/instrumentation.py` para no importar httpx al arrancar.
+Cada petición pasa por el circuit breaker y el bulkhead del upstream
+(`app/resilience.py`).
+"""
+from typing import Callable, Optional
+
+import httpx
+
+from app.instrumentation import track
+from app.resilience import dependency
+
+POSTGREST_OPERATIONS = {
+    "GET": "select",
+    "HEAD": "count",
+    "POST": "insert",
+    "PATCH": "update",
+    "DELETE": "delete",
+}
+
+
+def postgrest_operation(request: httpx.Request) -> str:
+    """`select contacts`, `upsert companies`, `rpc fn`… a partir de la URL de PostgREST"""
+    path = request.url.path.rstrip("/")
+    if "/rpc/" in path:
+        return "rpc " + path.rsplit("/", 1)[-1]
+    table = path.rsplit("/", 1)[-1]
+    action = POSTGREST_OPERATIONS.get(request.method, request.method.lower())
+    if action == "insert" and "resolution=" in request.headers.get("prefer", ""):
+        action = "upsert"
+    return f"{action} {table}"
+
+
+def gemini_operation(request: httpx.Request) -> str:
+    """Método de la API de Gemini (`generateContent`, `streamGenerateContent`)"""
+    last = request.url.path.rsplit("/", 1)[-1]
+    return last.split(":", 1)[1] if ":" in last else request.method.lower()
+
+
+class InstrumentedTransport(httpx.BaseTransport):
+    """Mide y protege cada petición de un httpx.Client (hasta recibir las cabeceras)"""
+
+    def __init__(self, upstream: str, operation: Callable[[httpx.Request], str],
+                 transport: Optional[httpx.BaseTransport] = None):
+        self.upstream = upstream
+        self.operation = operation
+        self.transport = transport or httpx.HTTPTransport()
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        with dependency(self.upstream).call() as attempt:
+            with track(self.upstream, self.operation(request)) as call:
+                response = self.transport.handle_request(request)
+                call.status = attempt.status = response.status_code
+        return response
+
+    def close(self) -> None:
+        self.transport.close()
+
+
+class AsyncInstrumentedTransport(httpx.AsyncBaseTransport):
+    """Versión asíncrona de InstrumentedTransport"""
+
+    def __init__(self, upstream: str, operation: Callable[[httpx.Request], str],
+                 transport: Optional[httpx.AsyncBaseTransport] = None):
+        self.upstream = upstream
+        self.operation = operation
+        self.transport = transport or httpx.AsyncHTTPTransport()
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        async with dependency(self.upstream).acall() as attempt:
+            async with track(self.upstream, self.operation(request)) as call:
+                response = await self.transport.handle_async_request(request)
+                call.status = attempt.status = response.status_code
+        return response
+
+    async def aclose(self) -> None:
+        await self.transport.aclose()
+
+
+def instrumented_session(session: httpx.Client, upstream: str,
+                         operation: Callable[[httpx.Request], str]) -> httpx.Client:
+    """
+    Crear un cliente equivalente a `session` (p. ej. la sesión de postgrest)
+    con `transport=InstrumentedTransport(...)`; quien llama lo sustituye y
+    cierra el original.
+    """
+    return type(session)(
+        base_url=session.base_url,
+        headers=session.headers,
+        timeout=session.timeout,
+        follow_redirects=session.follow_redirects,
+        transport=InstrumentedTransport(upstream, operation, httpx.HTTPTransport(http2=True)),
+    )
@@ -1,28 +1,75 @@
 # hubspot_api.py
 import os
-import requests
+import threading
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple
 from fastapi import HTTPException
 from dotenv import load_dotenv
 
+from app import metrics
+from app.cache import TTLCache
+from app.config import HUBSPOT_SCHEMA_TTL, HUBSPOT_SCHEMA_VALIDATION, HUBSPOT_TIMEOUT
+from app.instrumentation import track
+from app.registry import registry
+from app.resilience import dependency
+
+if TYPE_CHECKING:
+    import requests
+
 load_dotenv()
 
 HUBSPOT_TOKEN = os.getenv("CLAVE_API_HUBSPOT")
 
-if not HUBSPOT_TOKEN:
-    raise RuntimeError("HUBSPOT_TOKEN no está definido en las variables de entorno")
+BASE_URL = os.getenv("HUBSPOT_BASE_URL", "https://api.hubapi.com").rstrip("/")
 
-HEADERS = {
-    "Authorization": f"Bearer {HUBSPOT_TOKEN}"
-}
 
-BASE_URL = "https://api.hubapi.com"
+class HubSpotError(HTTPException):
+    """
+    Respuesta no 2xx de HubSpot. Al cliente se le responde 500, pero
+    `upstream_status` conserva el estado original para clasificar el fallo
+    (un 400 de validación no se arregla reintentando; un 429 o 5xx sí).
+    """
 
-def _hubspot_get_all(object_type: str, properties: str):
+    def __init__(self, upstream_status: int, detail: str):
+        super().__init__(status_code=500, detail=detail)
+        self.upstream_status = upstream_status
+
+
+def create_hubspot_session() -> "requests.Session":
     """
-    object_type: 'companies' o 'contacts'
+    Sesión HTTP autenticada (reutiliza conexiones). El token se valida aquí y
+    no al importar, para que las rutas que no usan HubSpot arranquen sin él.
+    """
+    if not HUBSPOT_TOKEN:
+        raise HTTPException(
+            status_code=500,
+            detail="CLAVE_API_HUBSPOT no está definido en las variables de entorno"
+        )
+    import requests
+    session = requests.Session()
+    session.headers["Authorization"] = f"Bearer {HUBSPOT_TOKEN}"
+    return session
+
+
+def _request(method: str, url: str, operation: str, **kwargs) -> "requests.Response":
+    """
+    Petición a HubSpot con timeout, circuit breaker/bulkhead y métricas de
+    latencia y estado por operación. Lanza UpstreamUnavailable si el circuito
+    está abierto o no hay capacidad.
+    """
+    session = registry.get("hubspot")
+    kwargs.setdefault("timeout", HUBSPOT_TIMEOUT)
+    with dependency("hubspot").call() as attempt:
+        with track("hubspot", operation) as call:
+            r = session.request(method, url, **kwargs)
+            call.status = attempt.status = r.status_code
+    return r
+
+def iterar_paginas(object_type: str, properties: str, associations: Optional[str] = None):
+    """
+    Recorrer todos los objetos de HubSpot página a página (100 por página)
+    sin acumularlos en memoria. object_type: 'companies' o 'contacts'
     """
     url = f"{BASE_URL}/crm/v3/objects/{object_type}"
-    all_items = []
     after = None
 
     while True:
@@ -30,16 +77,20 @@ def _hubspot_get_all(object_type: str, properties: str):
             "limit": 100,
             "properties": properties
         }
+        if associations:
+            params["associations"] = associations
         if after:
             params["after"] = after
 
-        r = requests.get(url, headers=HEADERS, params=params)
+        r = _request("GET", url, f"list_{object_type}", params=params)
         if r.status_code != 200:
-            raise HTTPException(status_code=500,
-                                detail=f"Error al obtener {object_type}: {r.status_code} - {r.text}")
+            raise HubSpotError(
+                r.status_code,
+                f"Error al obtener {object_type}: {r.status_code} - {r.text}"
+            )
 
         data = r.json()
-        all_items.extend(data.get("results", []))
+        yield data.get("results", [])
 
         paging = data.get("paging", {})
         next_page = paging.get("next")
@@ -48,37 +99,230 @@ def _hubspot_get_all(object_type: str, properties: str):
         else:
             break
 
-    return all_items
+
+# Se incrementa con cada escritura en HubSpot desde este proceso; sirve para
+# invalidar los listados cacheados
+LIST_VERSION: Dict[str, int] = {"companies": 0, "contacts": 0}
+
+
+def _marcar_cambio(object_type: str) -> None:
+    LIST_VERSION[object_type] = LIST_VERSION.get(object_type, 0) + 1
+
+
+def _hubspot_get_all(object_type: str, properties: str):
+    """
+    object_type: 'companies' o 'contacts'
+    """
+    return [item for page in iterar_paginas(object_type, properties) for item in page]
+
+
+# ------- BÚSQUEDA (CRM v3 /search) -------
+SEARCH_OPERATORS = {
+    "EQ", "NEQ", "LT", "LTE", "GT", "GTE", "BETWEEN", "IN", "NOT_IN",
+    "HAS_PROPERTY", "NOT_HAS_PROPERTY", "CONTAINS_TOKEN", "NOT_CONTAINS_TOKEN",
+}
+SEARCH_MAX_LIMIT = 200
+SEARCH_MAX_FILTERS = 6
+
+
+def parse_filtro(expr: str) -> dict:
+    """
+    `propiedad:OPERADOR[:valor]` → filtro de HubSpot. IN/NOT_IN aceptan valores
+    separados por comas y BETWEEN `desde,hasta`. Ej.: `country:EQ:Peru`,
+    `email:CONTAINS_TOKEN:*@empresa.com`, `annualrevenue:BETWEEN:1000,5000`.
+    """
+    prop, _, rest = expr.partition(":")
+    operator, _, value = rest.partition(":")
+    operator = operator.upper()
+    if not prop or operator not in SEARCH_OPERATORS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Filtro inválido '{expr}': use propiedad:OPERADOR:valor con OPERADOR en {sorted(SEARCH_OPERATORS)}"
+        )
+    filtro = {"propertyName": prop, "operator": operator}
+    if operator in ("HAS_PROPERTY", "NOT_HAS_PROPERTY"):
+        return filtro
+    if not value:
+        raise HTTPException(status_code=400, detail=f"Filtro inválido '{expr}': falta el valor")
+    if operator in ("IN", "NOT_IN"):
+        filtro["values"] = [v for v in value.split(",") if v]
+    elif operator == "BETWEEN":
+        low, _, high = value.partition(",")
+        filtro.update(value=low, highValue=high)
+    else:
+        filtro["value"] = value
+    return filtro
+
+
+def parse_orden(expr: str) -> dict:
+    """`propiedad` (ascendente) o `-propiedad` (descendente)"""
+    if expr.startswith("-"):
+        return {"propertyName": expr[1:], "direction": "DESCENDING"}
+    return {"propertyName": expr, "direction": "ASCENDING"}
+
+
+def buscar_objetos(object_type: str, properties: str, filtros: Optional[List[str]] = None,
+                   query: Optional[str] = None, orden: Optional[List[str]] = None,
+                   limit: int = 100, after: Optional[str] = None) -> dict:
+    """
+    Buscar en HubSpot con filtros (AND), texto libre, orden y paginación en una
+    sola llamada. Devuelve {"results", "total", "after"}; `after` es None en la
+    última página.
+    """
+    filtros = filtros or []
+    if len(filtros) > SEARCH_MAX_FILTERS:
+        raise HTTPException(status_code=400, detail=f"Máximo {SEARCH_MAX_FILTERS} filtros por búsqueda")
+    payload = {
+        "limit": max(1, min(limit, SEARCH_MAX_LIMIT)),
+        "properties": [p for p in properties.split(",") if p],
+    }
+    if filtros:
+        payload["filterGroups"] = [{"filters": [parse_filtro(f) for f in filtros]}]
+    if query:
+        payload["query"] = query
+    if orden:
+        payload["sorts"] = [parse_orden(o) for o in orden]
+    if after:
+        payload["after"] = after
+
+    url = f"{BASE_URL}/crm/v3/objects/{object_type}/search"
+    r = _request("POST", url, f"search_{object_type}", json=payload)
+    if r.status_code == 400:
+        # Propiedad u operador que HubSpot no acepta: error del cliente
+        raise HTTPException(status_code=400, detail=f"Búsqueda inválida en HubSpot: {r.text}")
+    if r.status_code != 200:
+        raise HubSpotError(
+            r.status_code,
+            f"Error al buscar {object_type}: {r.status_code} - {r.text}"
+        )
+    data = r.json()
+    next_page = (data.get("paging") or {}).get("next") or {}
+    return {
+        "results": data.get("results", []),
+        "total": data.get("total"),
+        "after": next_page.get("after"),
+    }
 
 
 # ------- EMPRESAS --------
+PROPIEDADES_EMPRESA_SIMPLE = "hs_object_id,name,city,country"
+
+
 def obtener_empresas_simple():
-    props = "hs_object_id,name,city,country"
-    return _hubspot_get_all("companies", props)
+    return _hubspot_get_all("companies", PROPIEDADES_EMPRESA_SIMPLE)
 
 
 # ------- CONTACTOS --------
+PROPIEDADES_CONTACTO_SIMPLE = "hs_object_id,email,firstname,lastname,phone"
+
+
 def obtener_contactos_simple():
-    props = "hs_object_id,email,firstname,lastname,phone"
-    return _hubspot_get_all("contacts", props)
+    return _hubspot_get_all("contacts", PROPIEDADES_CONTACTO_SIMPLE)
 
 
-# ------- SINCRONIZACIÓN DE EMPRESAS -------
-def sincronizar_empresa_a_hubspot(empresa_data: dict):
+# ------- ESQUEMA DE PROPIEDADES -------
+# Definiciones de propiedades del portal por tipo de objeto: {nombre: definición}
+_esquemas = TTLCache(ttl=HUBSPOT_SCHEMA_TTL, max_entries=16)
+_esquemas_lock = threading.Lock()
+_SIN_ESQUEMA = object()
+SCHEMA_RETRY = 60  # segundos hasta reintentar si no se pudo leer el esquema
+
+DROPPED_PROPERTIES = metrics.counter(
+    "hubspot_properties_dropped_total", "Properties removed before sending to HubSpot", ("object_type", "reason")
+)
+
+
+def esquema_propiedades(object_type: str) -> Optional[Dict[str, dict]]:
     """
-    Sincroniza una empresa de Supabase a HubSpot.
-    Si tiene hubspot_id, actualiza; sino, crea nueva.
-    
-    Campos sincronizados:
-    - name → name
-    - country → country
-    - total_revenue → annualrevenue
-    - net_profit → net_profit (campo personalizado)
-    - sector → industry
-    - lead_status → hs_lead_status
+    Definiciones de propiedades del portal (`/crm/v3/properties/{tipo}`),
+    cacheadas HUBSPOT_SCHEMA_TTL segundos. None si no se pudieron leer.
     """
-    hubspot_id = empresa_data.get("hubspot_id")
-    
+    esquema = _esquemas.get(object_type, _SIN_ESQUEMA)
+    if esquema is not _SIN_ESQUEMA:
+        return esquema
+    with _esquemas_lock:
+        # Otro hilo pudo leerlo mientras se esperaba el lock
+        esquema = _esquemas.get(object_type, _SIN_ESQUEMA)
+        if esquema is not _SIN_ESQUEMA:
+            return esquema
+        url = f"{BASE_URL}/crm/v3/properties/{object_type}"
+        try:
+            r = _request("GET", url, f"properties_{object_type}")
+            if r.status_code != 200:
+                raise RuntimeError(f"{r.status_code} - {r.text}")
+            esquema = {p["name"]: p for p in r.json().get("results") or [] if p.get("name")}
+        except Exception as e:
+            # Sin esquema se envía sin validar; se reintenta en SCHEMA_RETRY segundos
+            print(f"[WARN] No se pudo leer el esquema de {object_type} en HubSpot: {getattr(e, 'detail', e)}")
+            _esquemas.set(object_type, None, ttl=SCHEMA_RETRY)
+            return None
+        _esquemas.set(object_type, esquema)
+        return esquema
+
+
+def invalidar_esquema(object_type: str) -> None:
+    """Olvidar el esquema cacheado (p. ej. tras un 400 de validación de HubSpot)"""
+    _esquemas.pop(object_type)
+
+
+def _motivo_invalido(definicion: Optional[dict], valor) -> Optional[str]:
+    """Motivo por el que HubSpot rechazaría el valor, o None si es válido"""
+    if definicion is None:
+        return "unknown_property"
+    if definicion.get("calculated") or (definicion.get("modificationMetadata") or {}).get("readOnlyValue"):
+        return "read_only"
+    texto = "" if valor is None else str(valor)
+    if texto == "":
+        # Vaciar una propiedad siempre es válido
+        return None
+    tipo = definicion.get("type")
+    if tipo == "enumeration":
+        opciones = {o.get("value") for o in definicion.get("options") or []}
+        # Las casillas múltiples separan los valores con ';'
+        valores = texto.split(";") if definicion.get("fieldType") == "checkbox" else [texto]
+        if any(v not in opciones for v in valores):
+            return "invalid_option"
+    elif tipo == "number":
+        try:
+            float(texto)
+        except ValueError:
+            return "invalid_number"
+    elif tipo == "bool" and texto.lower() not in ("true", "false"):
+        return "invalid_bool"
+    return None
+
+
+def validar_propiedades(object_type: str, properties: dict) -> Tuple[dict, Dict[str, str]]:
+    """
+    Quitar las propiedades que HubSpot rechazaría (inexistentes, de solo
+    lectura o con un valor fuera de sus opciones) antes de enviarlas.
+    Devuelve (propiedades válidas, {propiedad omitida: motivo}).
+    """
+    if not HUBSPOT_SCHEMA_VALIDATION:
+        return properties, {}
+    esquema = esquema_propiedades(object_type)
+    if esquema is None:
+        return properties, {}
+    validas, omitidas = {}, {}
+    for nombre, valor in properties.items():
+        motivo = _motivo_invalido(esquema.get(nombre), valor)
+        if motivo:
+            omitidas[nombre] = motivo
+            DROPPED_PROPERTIES.inc(object_type=object_type, reason=motivo)
+        else:
+            validas[nombre] = valor
+    return validas, omitidas
+
+
+def _avisar_omitidas(object_type: str, omitidas: Dict[str, str], cuantos: int = 1) -> None:
+    if omitidas:
+        detalle = ", ".join(f"{k} ({v})" for k, v in sorted(omitidas.items()))
+        print(f"[WARN] HubSpot {object_type}: se omiten propiedades no válidas en {cuantos} registro(s): {detalle}")
+
+
+# ------- MAPEO DE PROPIEDADES -------
+def propiedades_empresa(empresa_data: dict) -> dict:
+    """Propiedades de HubSpot para una empresa de Supabase"""
     # Mapeo de campos de Supabase a HubSpot (SOLO los campos especificados)
     properties = {
         "name": empresa_data.get("name", ""),
@@ -93,7 +337,104 @@ def sincronizar_empresa_a_hubspot(empresa_data: dict):
         properties["net_profit"] = str(empresa_data.get("net_profit"))
     
     # Limpiar valores None y vacíos
-    properties = {k: v for k, v in properties.items() if v is not None and v != ""}
+    return {k: v for k, v in properties.items() if v is not None and v != ""}
+
+
+def propiedades_contacto(contacto_data: dict) -> dict:
+    """Propiedades de HubSpot para un contacto de Supabase"""
+    # Determinar first_name y last_name
+    first_name = contacto_data.get("first_name") or contacto_data.get("nombre", "").split()[0] if contacto_data.get("nombre") else ""
+    last_name = contacto_data.get("last_name") or " ".join(contacto_data.get("nombre", "").split()[1:]) if contacto_data.get("nombre") else ""
+    
+    # Mapeo de campos de Supabase a HubSpot (SOLO los campos especificados)
+    properties = {
+        "firstname": first_name,
+        "lastname": last_name,
+        "country": contacto_data.get("country", ""),
+        "jobtitle": contacto_data.get("cargo", ""),
+        "email": contacto_data.get("email", ""),
+        "phone": contacto_data.get("telefono", ""),
+        "hs_lead_status": _map_lead_status_to_hubspot_internal(contacto_data.get("estado")),
+    }
+    
+    # Limpiar valores None y vacíos
+    return {k: v for k, v in properties.items() if v is not None and v != ""}
+
+
+# Propiedades que se leen de HubSpot al importar
+PROPIEDADES_IMPORT_EMPRESA = "name,country,annualrevenue,industry,hs_lead_status,net_profit"
+PROPIEDADES_IMPORT_CONTACTO = "firstname,lastname,email,phone,jobtitle,country,hs_lead_status"
+
+
+def _numero(value) -> Optional[float]:
+    try:
+        return float(value) if value not in (None, "") else None
+    except (TypeError, ValueError):
+        return None
+
+
+def empresa_desde_hubspot(obj: dict) -> dict:
+    """Fila de `companies` a partir de una empresa de HubSpot (inverso de propiedades_empresa)"""
+    props = obj.get("properties") or {}
+    row = {
+        "hubspot_id": str(obj.get("id") or props.get("hs_object_id")),
+        "name": props.get("name") or f"HubSpot {obj.get('id')}",
+        "country": props.get("country"),
+        "sector": props.get("industry"),
+        "total_revenue": _numero(props.get("annualrevenue")),
+        "net_profit": _numero(props.get("net_profit")),
+        "lead_status": _map_lead_status_from_hubspot_internal(props.get("hs_lead_status")),
+    }
+    # Sin valor en HubSpot no se pisa el de Supabase
+    return {k: v for k, v in row.items() if v is not None and v != ""}
+
+
+def contacto_desde_hubspot(obj: dict) -> dict:
+    """Fila de `contacts` a partir de un contacto de HubSpot (inverso de propiedades_contacto)"""
+    props = obj.get("properties") or {}
+    first_name = props.get("firstname") or ""
+    last_name = props.get("lastname") or ""
+    nombre = " ".join(p for p in (first_name, last_name) if p) or props.get("email") or f"HubSpot {obj.get('id')}"
+    row = {
+        "hubspot_id": str(obj.get("id") or props.get("hs_object_id")),
+        "nombre": nombre,
+        "first_name": first_name,
+        "last_name": last_name,
+        "email": props.get("email"),
+        "telefono": props.get("phone"),
+        "cargo": props.get("jobtitle"),
+        "country": props.get("country"),
+        "estado": _map_lead_status_from_hubspot_internal(props.get("hs_lead_status")),
+    }
+    return {k: v for k, v in row.items() if v is not None and v != ""}
+
+
+def empresa_asociada(obj: dict) -> Optional[str]:
+    """hs_object_id de la primera empresa asociada a un contacto (listado con associations=companies)"""
+    results = ((obj.get("associations") or {}).get("companies") or {}).get("results") or []
+    return str(results[0]["id"]) if results else None
+
+
+# ------- SINCRONIZACIÓN DE EMPRESAS -------
+def sincronizar_empresa_a_hubspot(empresa_data: dict):
+    """
+    Sincroniza una empresa de Supabase a HubSpot.
+    Si tiene hubspot_id, actualiza; sino, crea nueva.
+    
+    Campos sincronizados:
+    - name → name
+    - country → country
+    - total_revenue → annualrevenue
+    - net_profit → net_profit (campo personalizado)
+    - sector → industry
+    - lead_status → hs_lead_status
+
+    Las propiedades que el portal rechazaría se omiten y se listan en `omitted`.
+    """
+    hubspot_id = empresa_data.get("hubspot_id")
+    properties = propiedades_empresa(empresa_data)
+    properties, omitidas = validar_propiedades("companies", properties)
+    _avisar_omitidas("companies", omitidas)
     
     if hubspot_id:
         # Verificar que el registro existe en HubSpot
@@ -107,28 +448,35 @@ def sincronizar_empresa_a_hubspot(empresa_data: dict):
         url = f"{BASE_URL}/crm/v3/objects/companies/{hubspot_id}"
         payload = {"properties": properties}
         
-        r = requests.patch(url, headers=HEADERS, json=payload)
+        r = _request("PATCH", url, "update_company", json=payload)
+        _marcar_cambio("companies")
         if r.status_code not in [200, 201]:
-            raise HTTPException(
-                status_code=500,
-                detail=f"Error actualizando empresa en HubSpot: {r.status_code} - {r.text}"
+            if r.status_code == 400:
+                invalidar_esquema("companies")
+            raise HubSpotError(
+                r.status_code,
+                f"Error actualizando empresa en HubSpot: {r.status_code} - {r.text}"
             )
         
         return {
             "hubspot_id": hubspot_id,
             "action": "updated",
-            "data": r.json()
+            "data": r.json(),
+            "omitted": omitidas
         }
     else:
         # CREAR nueva empresa
         url = f"{BASE_URL}/crm/v3/objects/companies"
         payload = {"properties": properties}
         
-        r = requests.post(url, headers=HEADERS, json=payload)
+        r = _request("POST", url, "create_company", json=payload)
+        _marcar_cambio("companies")
         if r.status_code not in [200, 201]:
-            raise HTTPException(
-                status_code=500,
-                detail=f"Error creando empresa en HubSpot: {r.status_code} - {r.text}"
+            if r.status_code == 400:
+                invalidar_esquema("companies")
+            raise HubSpotError(
+                r.status_code,
+                f"Error creando empresa en HubSpot: {r.status_code} - {r.text}"
             )
         
         response_data = r.json()
@@ -138,7 +486,8 @@ def sincronizar_empresa_a_hubspot(empresa_data: dict):
         return {
             "hubspot_id": new_hubspot_id,
             "action": "created",
-            "data": response_data
+            "data": response_data,
+            "omitted": omitidas
         }
 
 
@@ -156,26 +505,13 @@ def sincronizar_contacto_a_hubspot(contacto_data: dict, company_hubspot_id: str
     - email → email
     - telefono → phone
     - estado → hs_lead_status (con valores internos de HubSpot)
+
+    Las propiedades que el portal rechazaría se omiten y se listan en `omitted`.
     """
     hubspot_id = contacto_data.get("hubspot_id")
-    
-    # Determinar first_name y last_name
-    first_name = contacto_data.get("first_name") or contacto_data.get("nombre", "").split()[0] if contacto_data.get("nombre") else ""
-    last_name = contacto_data.get("last_name") or " ".join(contacto_data.get("nombre", "").split()[1:]) if contacto_data.get("nombre") else ""
-    
-    # Mapeo de campos de Supabase a HubSpot (SOLO los campos especificados)
-    properties = {
-        "firstname": first_name,
-        "lastname": last_name,
-        "country": contacto_data.get("country", ""),
-        "jobtitle": contacto_data.get("cargo", ""),
-        "email": contacto_data.get("email", ""),
-        "phone": contacto_data.get("telefono", ""),
-        "hs_lead_status": _map_lead_status_to_hubspot_internal(contacto_data.get("estado")),
-    }
-    
-    # Limpiar valores None y vacíos
-    properties = {k: v for k, v in properties.items() if v is not None and v != ""}
+    properties = propiedades_contacto(contacto_data)
+    properties, omitidas = validar_propiedades("contacts", properties)
+    _avisar_omitidas("contacts", omitidas)
     
     if hubspot_id:
         # Verificar que el registro existe en HubSpot
@@ -189,28 +525,35 @@ def sincronizar_contacto_a_hubspot(contacto_data: dict, company_hubspot_id: str
         url = f"{BASE_URL}/crm/v3/objects/contacts/{hubspot_id}"
         payload = {"properties": properties}
         
-        r = requests.patch(url, headers=HEADERS, json=payload)
+        r = _request("PATCH", url, "update_contact", json=payload)
+        _marcar_cambio("contacts")
         if r.status_code not in [200, 201]:
-            raise HTTPException(
-                status_code=500,
-                detail=f"Error actualizando contacto en HubSpot: {r.status_code} - {r.text}"
+            if r.status_code == 400:
+                invalidar_esquema("contacts")
+            raise HubSpotError(
+                r.status_code,
+                f"Error actualizando contacto en HubSpot: {r.status_code} - {r.text}"
             )
         
         result = {
             "hubspot_id": hubspot_id,
             "action": "updated",
-            "data": r.json()
+            "data": r.json(),
+            "omitted": omitidas
         }
     else:
         # CREAR nuevo contacto
         url = f"{BASE_URL}/crm/v3/objects/contacts"
         payload = {"properties": properties}
         
-        r = requests.post(url, headers=HEADERS, json=payload)
+        r = _request("POST", url, "create_contact", json=payload)
+        _marcar_cambio("contacts")
         if r.status_code not in [200, 201]:
-            raise HTTPException(
-                status_code=500,
-                detail=f"Error creando contacto en HubSpot: {r.status_code} - {r.text}"
+            if r.status_code == 400:
+                invalidar_esquema("contacts")
+            raise HubSpotError(
+                r.status_code,
+                f"Error creando contacto en HubSpot: {r.status_code} - {r.text}"
             )
         
         response_data = r.json()
@@ -220,7 +563,8 @@ def sincronizar_contacto_a_hubspot(contacto_data: dict, company_hubspot_id: str
         result = {
             "hubspot_id": new_hubspot_id,
             "action": "created",
-            "data": response_data
+            "data": response_data,
+            "omitted": omitidas
         }
     
     # Si hay company_hubspot_id, asociar el contacto con la empresa
@@ -230,25 +574,35 @@ def sincronizar_contacto_a_hubspot(contacto_data: dict, company_hubspot_id: str
     return result
 
 
+LEAD_STATUS_HUBSPOT = {
+    "Nuevo": "NEW",
+    "Abierto": "OPEN",
+    "En curso": "IN_PROGRESS",
+    "Negocio abierto": "OPEN_DEAL",
+    "Sin calificar": "UNQUALIFIED",
+    "Intento de contacto": "ATTEMPTED_TO_CONTACT",
+    "Conectado": "CONNECTED",
+    "Mal momento": "BAD_TIMING"
+}
+LEAD_STATUS_SUPABASE = {v: k for k, v in LEAD_STATUS_HUBSPOT.items()}
+
+
 def _map_lead_status_to_hubspot_internal(lead_status: str) -> str:
     """Mapea el lead_status de Supabase a los valores internos de hs_lead_status en HubSpot"""
-    mapping = {
-        "Nuevo": "NEW",
-        "Abierto": "OPEN",
-        "En curso": "IN_PROGRESS",
-        "Negocio abierto": "OPEN_DEAL",
-        "Sin calificar": "UNQUALIFIED",
-        "Intento de contacto": "ATTEMPTED_TO_CONTACT",
-        "Conectado": "CONNECTED",
-        "Mal momento": "BAD_TIMING"
-    }
-    return mapping.get(lead_status, "NEW")
+    return LEAD_STATUS_HUBSPOT.get(lead_status, "NEW")
+
+
+def _map_lead_status_from_hubspot_internal(hs_lead_status: Optional[str]) -> Optional[str]:
+    """Inverso de _map_lead_status_to_hubspot_internal (None si HubSpot no tiene valor)"""
+    if not hs_lead_status:
+        return None
+    return LEAD_STATUS_SUPABASE.get(hs_lead_status, hs_lead_status)
 
 
 def _verificar_registro_existe(object_type: str, object_id: str) -> bool:
     """Verifica si un registro existe en HubSpot usando su hs_object_id"""
     url = f"{BASE_URL}/crm/v3/objects/{object_type}/{object_id}"
-    r = requests.get(url, headers=HEADERS)
+    r = _request("GET", url, f"get_{object_type}")
     return r.status_code == 200
 
 
@@ -266,9 +620,106 @@ def asociar_contacto_empresa(contact_hubspot_id: str, company_hubspot_id: str):
         }
     ]
     
-    r = requests.put(url, headers=HEADERS, json=payload)
+    r = _request("PUT", url, "associate_contact_company", json=payload)
     if r.status_code not in [200, 201, 204]:
         # No lanzar error, solo registrar
         print(f"Advertencia: No se pudo asociar contacto {contact_hubspot_id} con empresa {company_hubspot_id}: {r.text}")
     
     return r.status_code in [200, 201, 204]
+
+
+# ------- OPERACIONES EN LOTE -------
+BATCH_LIMIT = 100  # máximo de entradas por llamada batch de HubSpot
+
+
+def _batch(object_type: str, action: str, payload: dict) -> List[dict]:
+    """POST a /crm/v3/objects/{type}/batch/{action}; devuelve `results`"""
+    url = f"{BASE_URL}/crm/v3/objects/{object_type}/batch/{action}"
+    r = _request("POST", url, f"batch_{action}_{object_type}", json=payload)
+    if action != "read":
+        _marcar_cambio(object_type)
+    # 207: éxito parcial; los errores vienen en `errors`
+    if r.status_code not in [200, 201, 207]:
+        if r.status_code == 400:
+            invalidar_esquema(object_type)
+        raise HubSpotError(
+            r.status_code,
+            f"Error en batch/{action} de {object_type} en HubSpot: {r.status_code} - {r.text}"
+        )
+    data = r.json()
+    for error in data.get("errors") or []:
+        print(f"Advertencia: batch/{action} de {object_type}: {error.get('message')}")
+    return data.get("results") or []
+
+
+def _validar_lote(object_type: str, lote: List[dict]) -> List[dict]:
+    """validar_propiedades para cada registro; un campo inválido no tumba el lote"""
+    validados, omitidas = [], {}
+    for props in lote:
+        props, omitidas_registro = validar_propiedades(object_type, props)
+        validados.append(props)
+        omitidas.update(omitidas_registro)
+    _avisar_omitidas(object_type, omitidas, sum(1 for a, b in zip(lote, validados) if a != b))
+    return validados
+
+
+def crear_en_lote(object_type: str, inputs: List[Tuple[str, dict]]) -> Dict[str, str]:
+    """
+    Crear objetos en HubSpot. `inputs` son pares (clave, propiedades); devuelve
+    {clave: hs_object_id}. La clave viaja como `objectWriteTraceId`.
+    """
+    ids: Dict[str, str] = {}
+    for start in range(0, len(inputs), BATCH_LIMIT):
+        chunk = inputs[start:start + BATCH_LIMIT]
+        validados = _validar_lote(object_type, [props for _, props in chunk])
+        results = _batch(object_type, "create", {"inputs": [
+            {"properties": props, "objectWriteTraceId": key} for (key, _), props in zip(chunk, validados)
+        ]})
+        for index, result in enumerate(results):
+            # Si HubSpot no devuelve la traza, los resultados siguen el orden de entrada
+            key = result.get("objectWriteTraceId") or (chunk[index][0] if len(results) == len(chunk) else None)
+            if key is not None:
+                ids[key] = result.get("id")
+    return ids
+
+
+def actualizar_en_lote(object_type: str, inputs: List[Tuple[str, dict]]) -> List[str]:
+    """Actualizar objetos existentes: pares (hs_object_id, propiedades); devuelve los ids actualizados"""
+    updated: List[str] = []
+    for start in range(0, len(inputs), BATCH_LIMIT):
+        chunk = inputs[start:start + BATCH_LIMIT]
+        validados = _validar_lote(object_type, [props for _, props in chunk])
+        results = _batch(object_type, "update", {"inputs": [
+            {"id": hubspot_id, "properties": props} for (hubspot_id, _), props in zip(chunk, validados)
+        ]})
+        updated.extend(result.get("id") for result in results)
+    return updated
+
+
+def upsert_contactos_por_email(inputs: List[dict]) -> Dict[str, str]:
+    """Crear o actualizar contactos usando el email como clave; devuelve {email: hs_object_id}"""
+    ids: Dict[str, str] = {}
+    for start in range(0, len(inputs), BATCH_LIMIT):
+        chunk = inputs[start:start + BATCH_LIMIT]
+        validados = _validar_lote("contacts", chunk)
+        results = _batch("contacts", "upsert", {"inputs": [
+            {"id": original["email"], "idProperty": "email", "properties": props}
+            for original, props in zip(chunk, validados)
+        ]})
+        for result in results:
+            email = (result.get("properties") or {}).get("email")
+            if email:
+                ids[email.lower()] = result.get("id")
+    return ids
+
+
+def asociar_contactos_empresas(pares: List[Tuple[str, str]]) -> None:
+    """Asociar contactos con empresas en lote: pares (contact_hubspot_id, company_hubspot_id)"""
+    url = f"{BASE_URL}/crm/v4/associations/contacts/companies/batch/associate/default"
+    for start in range(0, len(pares), BATCH_LIMIT):
+        chunk = pares[start:start + BATCH_LIMIT]
+        payload = {"inputs": [{"from": {"id": c}, "to": {"id": e}} for c, e in chunk]}
+        r = _request("POST", url, "associate_contacts_companies", json=payload)
+        if r.status_code not in [200, 201, 204, 207]:
+            # No lanzar error, solo registrar (igual que asociar_contacto_empresa)
+            print(f"Advertencia: No se pudieron asociar {len(chunk)} contactos con empresas: {r.text}")
@@ -0,0 +1,150 @@
+"""
+Importación masiva HubSpot → Supabase.
+Recorre las empresas y contactos de HubSpot página a página (memoria acotada),
+los convierte a columnas de `companies`/`contacts` y los guarda con upserts
+por bloques usando `hubspot_id` como clave (requiere un índice único en esa
+columna). Los contactos se enlazan con su empresa por la asociación de HubSpot.
+El progreso se consulta mientras corre.
+"""
+import asyncio
+import uuid
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List, Optional
+
+from app import events, metrics
+from app.cache import TTLCache
+from app.config import HUBSPOT_IMPORT_CHUNK_SIZE
+from app.hubspot_api import (
+    PROPIEDADES_IMPORT_CONTACTO,
+    PROPIEDADES_IMPORT_EMPRESA,
+    contacto_desde_hubspot,
+    empresa_asociada,
+    empresa_desde_hubspot,
+    iterar_paginas,
+)
+
+OBJECTS = ("companies", "contacts")
+
+IMPORTED_ROWS = metrics.counter(
+    "hubspot_import_rows_total", "Rows upserted into Supabase by HubSpot imports", ("entity",)
+)
+
+# Progreso de importaciones recientes (en memoria)
+imports = TTLCache(ttl=24 * 3600, max_entries=50)
+_running: Dict[asyncio.Task, dict] = {}
+
+
+def _now_iso() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+class ImportJob:
+    def __init__(self, db, objects: Iterable[str], chunk_size: int = HUBSPOT_IMPORT_CHUNK_SIZE):
+        self.id = uuid.uuid4().hex
+        self.db = db
+        self.objects = [o for o in OBJECTS if o in set(objects)]
+        self.chunk_size = chunk_size
+        self.progress = {
+            "id": self.id,
+            "status": "running",
+            "objects": {o: {"read": 0, "upserted": 0, "pages": 0} for o in self.objects},
+            "errors": [],
+            "started_at": _now_iso(),
+            "finished_at": None,
+        }
+
+    # ---- Escritura ----
+    def _upsert(self, table: str, rows: List[dict]) -> None:
+        """
+        Upsert por `hubspot_id`. Las filas se agrupan por columnas: las que no
+        traen un campo no lo envían, así no se pisa con NULL el valor de Supabase.
+        """
+        groups: Dict[tuple, List[dict]] = {}
+        for row in rows:
+            groups.setdefault(tuple(sorted(row)), []).append(row)
+        for group in groups.values():
+            self.db.table(table).upsert(group, on_conflict="hubspot_id", returning="minimal").execute()
+            # Sin filas devueltas no hay eventos por fila: basta con invalidar la caché
+            events.touch(table)
+        self.progress["objects"][table]["upserted"] += len(rows)
+        IMPORTED_ROWS.inc(len(rows), entity=table)
+
+    def _link_companies(self, rows: List[dict], company_hubspot_ids: List[Optional[str]]) -> None:
+        """Poner `company_id` a los contactos cuya empresa de HubSpot ya está en Supabase"""
+        wanted = sorted({h for h in company_hubspot_ids if h})
+        if not wanted:
+            return
+        resp = self.db.table("companies").select("id,hubspot_id").in_("hubspot_id", wanted).execute()
+        by_hubspot = {str(c["hubspot_id"]): c["id"] for c in getattr(resp, "data", None) or []}
+        for row, hubspot_id in zip(rows, company_hubspot_ids):
+            if hubspot_id in by_hubspot:
+                row["company_id"] = by_hubspot[hubspot_id]
+
+    # ---- Lectura ----
+    def _pages(self, object_type: str):
+        if object_type == "companies":
+            return iterar_paginas("companies", PROPIEDADES_IMPORT_EMPRESA)
+        return iterar_paginas("contacts", PROPIEDADES_IMPORT_CONTACTO, associations="companies")
+
+    def _flush(self, object_type: str, buffer: List[dict], companies: List[Optional[str]]) -> None:
+        if object_type == "contacts":
+            self._link_companies(buffer, companies)
+        self._upsert(object_type, buffer)
+
+    async def _import(self, object_type: str) -> None:
+        stats = self.progress["objects"][object_type]
+        try:
+            await self._read_and_upsert(object_type, stats)
+        finally:
+            # Los clientes de /events recargan la tabla una vez, no por bloque
+            if stats["upserted"]:
+                events.reset(object_type, "hubspot_import")
+
+    async def _read_and_upsert(self, object_type: str, stats: dict) -> None:
+        pages = self._pages(object_type)
+        buffer: List[dict] = []
+        companies: List[Optional[str]] = []
+        while True:
+            page = await asyncio.to_thread(next, pages, None)
+            if page is None:
+                break
+            stats["pages"] += 1
+            stats["read"] += len(page)
+            for obj in page:
+                if object_type == "companies":
+                    buffer.append(empresa_desde_hubspot(obj))
+                else:
+                    buffer.append(contacto_desde_hubspot(obj))
+                    companies.append(empresa_asociada(obj))
+            if len(buffer) >= self.chunk_size:
+                await asyncio.to_thread(self._flush, object_type, buffer, companies)
+                buffer, companies = [], []
+        if buffer:
+            await asyncio.to_thread(self._flush, object_type, buffer, companies)
+
+    async def run(self) -> None:
+        try:
+            # Primero las empresas, para enlazar los contactos con ellas
+            for object_type in self.objects:
+                await self._import(object_type)
+            self.progress["status"] = "completed"
+        except Exception as e:
+            self.progress["status"] = "error"
+            self.progress["errors"].append({"error": str(getattr(e, "detail", e))})
+        finally:
+            self.progress["finished_at"] = _now_iso()
+
+
+def running_import() -> Optional[dict]:
+    """Progreso de la importación en curso, si hay una"""
+    return next(iter(_running.values()), None)
+
+
+def start_import(db, objects: Iterable[str] = OBJECTS) -> dict:
+    """Crear la importación y ejecutarla en segundo plano; devuelve su progreso"""
+    job = ImportJob(db, objects)
+    imports.set(job.id, job.progress)
+    task = asyncio.get_running_loop().create_task(job.run())
+    _running[task] = job.progress
+    task.add_done_callback(lambda t: _running.pop(t, None))
+    return job.progress
@@ -0,0 +1,350 @@
+"""
+Sincronización incremental Supabase → HubSpot en segundo plano.
+Cada `interval` segundos se leen las filas de `companies` y `contacts`
+modificadas desde la última marca (`cursor_column`, id), se envían a HubSpot
+en lotes con el mismo mapeo de propiedades que `/sync/*` y los `hubspot_id`
+nuevos se guardan en Supabase (solo esa columna). La marca se persiste en
+disco tras cada lote, así que el trabajo es proporcional a los cambios y no al
+tamaño de las tablas. Si HubSpot rechaza un lote por registros inválidos (4xx),
+el lote se parte para aislarlos; esos se omiten (se reportan en `status`) y la
+marca avanza, para que un registro malo no bloquee a los siguientes. Las filas
+que HubSpot no devuelve en una respuesta parcial (207) pasan a la cola de dead
+letters, que las reenvía con `/hubspot/dead-letters/replay`.
+"""
+import asyncio
+import json
+import os
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+from app import database, metrics
+from app.config import (
+    HUBSPOT_SYNC_BATCH_SIZE,
+    HUBSPOT_SYNC_CURSOR_COLUMN,
+    HUBSPOT_SYNC_INTERVAL,
+    HUBSPOT_SYNC_STATE_PATH,
+)
+from app.dead_letters import error_status, is_retryable, record_sync_failure, write_hubspot_ids
+from app.hubspot_api import (
+    actualizar_en_lote,
+    asociar_contactos_empresas,
+    crear_en_lote,
+    propiedades_contacto,
+    propiedades_empresa,
+    upsert_contactos_por_email,
+)
+
+SYNC_ROWS = metrics.counter(
+    "hubspot_sync_rows_total", "Rows pushed to HubSpot by the sync worker", ("entity", "action")
+)
+SYNC_ERRORS = metrics.counter(
+    "hubspot_sync_errors_total", "Sync batches that failed and will be retried", ("entity",)
+)
+SYNC_REJECTED = metrics.counter(
+    "hubspot_sync_rejected_total", "Rows HubSpot rejected (4xx) and the sync skipped", ("entity",)
+)
+
+# Filas rechazadas que se muestran en `status` (las más recientes)
+MAX_REJECTED_SHOWN = 50
+
+
+class _Entity:
+    def __init__(self, table: str, properties: Callable[[dict], dict]):
+        self.table = table
+        self.properties = properties
+
+
+ENTITIES = (
+    _Entity("companies", propiedades_empresa),
+    _Entity("contacts", propiedades_contacto),
+)
+
+
+class HubSpotSyncWorker:
+    def __init__(self, interval: float, batch_size: int, cursor_column: str, state_path: str):
+        self.interval = interval
+        self.batch_size = batch_size
+        self.cursor_column = cursor_column
+        self.state_path = state_path
+        self.state = self._load_state()
+        self.last_run: Dict[str, object] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._running = threading.Lock()
+        # Marcas que produjo nuestro propio upsert de hubspot_id: {tabla: {id: cursor}}
+        self._echoes: Dict[str, Dict[int, str]] = {e.table: {} for e in ENTITIES}
+        # hubspot_id ya creados cuyo guardado en Supabase falló: {tabla: {id: hubspot_id}}
+        self._unwritten: Dict[str, Dict[int, str]] = {e.table: {} for e in ENTITIES}
+        # Filas que HubSpot rechazó y se omitieron: se reenvían cuando se vuelvan a editar
+        self.rejected: List[dict] = []
+
+    # ---- Marca persistida ----
+    def _load_state(self) -> dict:
+        try:
+            with open(self.state_path, "r", encoding="utf-8") as fh:
+                state = json.load(fh)
+        except FileNotFoundError:
+            state = {}
+        return {e.table: state.get(e.table) or {"cursor": None, "id": 0} for e in ENTITIES}
+
+    def _save_state(self) -> None:
+        directory = os.path.dirname(self.state_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp = self.state_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as fh:
+            json.dump(self.state, fh)
+            fh.flush()
+            os.fsync(fh.fileno())
+        os.replace(tmp, self.state_path)
+
+    # ---- Lectura de cambios ----
+    def _changed(self, db, table: str, mark: dict) -> List[dict]:
+        """Siguiente lote ordenado por (cursor, id) después de la marca"""
+        column = self.cursor_column
+        rows: List[dict] = []
+        if mark["cursor"] is not None:
+            # Filas con el mismo cursor que la marca y id mayor (empates)
+            resp = (
+                db.table(table).select("*")
+                .eq(column, mark["cursor"]).gt("id", mark["id"])
+                .order("id").limit(self.batch_size).execute()
+            )
+            rows = resp.data or []
+        if len(rows) < self.batch_size:
+            query = db.table(table).select("*").not_.is_(column, "null")
+            if mark["cursor"] is not None:
+                query = query.gt(column, mark["cursor"])
+            resp = query.order(column).order("id").limit(self.batch_size - len(rows)).execute()
+            rows += resp.data or []
+        return rows
+
+    # ---- Envío a HubSpot ----
+    def _push(self, entity: _Entity, rows: List[dict], new_ids: Dict[int, str]) -> List[dict]:
+        """
+        Enviar un lote; anota en `new_ids` {id de Supabase: hubspot_id} de los
+        objetos nuevos. Devuelve las filas que HubSpot no incluyó en la
+        respuesta (207: éxito parcial).
+        """
+        updates, creates, upserts = [], [], []
+        for row in rows:
+            properties = entity.properties(row)
+            if row.get("hubspot_id"):
+                updates.append((row, properties))
+            elif entity.table == "contacts" and properties.get("email"):
+                # El email identifica al contacto en HubSpot: evita duplicados
+                upserts.append((row, properties))
+            else:
+                creates.append((row, properties))
+
+        missing: List[dict] = []
+        if updates:
+            updated = set(actualizar_en_lote(
+                entity.table, [(str(row["hubspot_id"]), props) for row, props in updates]
+            ))
+            missing += [row for row, _ in updates if str(row["hubspot_id"]) not in updated]
+            SYNC_ROWS.inc(len(updated), entity=entity.table, action="updated")
+        if creates:
+            created = crear_en_lote(entity.table, [(str(row["id"]), props) for row, props in creates])
+            new_ids.update({int(key): hubspot_id for key, hubspot_id in created.items()})
+            missing += [row for row, _ in creates if str(row["id"]) not in created]
+            SYNC_ROWS.inc(len(created), entity=entity.table, action="created")
+        if upserts:
+            by_email = upsert_contactos_por_email([props for _, props in upserts])
+            for row, props in upserts:
+                hubspot_id = by_email.get(props["email"].lower())
+                if hubspot_id:
+                    new_ids[row["id"]] = hubspot_id
+                else:
+                    missing.append(row)
+            SYNC_ROWS.inc(len(by_email), entity=entity.table, action="upserted")
+        return missing
+
+    def _send(self, entity: _Entity, rows: List[dict], new_ids: Dict[int, str],
+              rejected: Dict[int, Exception], missing: Dict[int, dict]) -> None:
+        """
+        `_push` de un lote. Si HubSpot lo rechaza por un error del cliente
+        (4xx que no es 429: un email inválido, emails repetidos en un upsert),
+        se parte en mitades hasta aislar las filas culpables, que quedan en
+        `rejected`; un fallo reintentable se propaga y la marca no avanza.
+        Las filas que faltan en una respuesta parcial quedan en `missing`.
+        """
+        pending = [r for r in rows if r["id"] not in new_ids]
+        if not pending:
+            return
+        try:
+            missing.update({row["id"]: row for row in self._push(entity, pending, new_ids)})
+        except Exception as e:
+            if is_retryable(e):
+                raise
+            if len(pending) == 1:
+                rejected[pending[0]["id"]] = e
+                return
+            middle = len(pending) // 2
+            self._send(entity, pending[:middle], new_ids, rejected, missing)
+            self._send(entity, pending[middle:], new_ids, rejected, missing)
+
+    def _reject(self, entity: _Entity, rows: List[dict], rejected: Dict[int, Exception]) -> None:
+        SYNC_REJECTED.inc(len(rejected), entity=entity.table)
+        for row in rows:
+            e = rejected.get(row["id"])
+            if e is None:
+                continue
+            error = str(getattr(e, "detail", e))
+            print(f"[WARN] HubSpot rejected {entity.table} {row['id']}, skipped: {error}")
+            self.rejected.append({
+                "table": entity.table,
+                "id": row["id"],
+                "cursor": row.get(self.cursor_column),
+                "status_code": error_status(e),
+                "error": error,
+            })
+        del self.rejected[:-MAX_REJECTED_SHOWN]
+
+    def _associate(self, db, rows: List[dict], new_ids: Dict[int, str]) -> None:
+        """Asociar los contactos nuevos con su empresa, si ya está en HubSpot"""
+        company_ids = {row["company_id"] for row in rows if row["id"] in new_ids and row.get("company_id")}
+        if not company_ids:
+            return
+        resp = db.table("companies").select("id,hubspot_id").in_("id", list(company_ids)).execute()
+        company_hubspot = {c["id"]: c["hubspot_id"] for c in resp.data or [] if c.get("hubspot_id")}
+        pairs = [
+            (new_ids[row["id"]], str(company_hubspot[row["company_id"]]))
+            for row in rows
+            if row["id"] in new_ids and row.get("company_id") in company_hubspot
+        ]
+        if pairs:
+            asociar_contactos_empresas(pairs)
+
+    def _write_back(self, db, entity: _Entity, new_ids: Dict[int, str]) -> None:
+        """
+        Guardar los hubspot_id nuevos en una escritura por lote. Solo se escribe
+        `hubspot_id` (y solo si sigue vacío): reescribir otras columnas con lo
+        leído al inicio del ciclo desharía un cambio hecho mientras tanto.
+        """
+        echoes = self._echoes[entity.table]
+        # La escritura cambia el cursor de esas filas: no volver a enviarlas por eso
+        for row in write_hubspot_ids(db, entity.table, new_ids):
+            if row.get(self.cursor_column) is not None:
+                echoes[row["id"]] = row[self.cursor_column]
+
+    def _dead_letter(self, entity: _Entity, rows: List[dict]) -> None:
+        """Filas que HubSpot no devolvió (207): a la cola de dead letters en lugar de perderse"""
+        for row in rows:
+            print(f"[WARN] HubSpot did not return {entity.table} {row['id']} in the batch response")
+            record_sync_failure(
+                entity.table, row, RuntimeError("HubSpot did not return this record in the batch response")
+            )
+
+    def _sync_entity(self, db, entity: _Entity) -> int:
+        mark = self.state[entity.table]
+        echoes = self._echoes[entity.table]
+        unwritten = self._unwritten[entity.table]
+        pushed = 0
+        while True:
+            rows = self._changed(db, entity.table, mark)
+            if not rows:
+                return pushed
+            pending = [r for r in rows if echoes.pop(r["id"], None) != r.get(self.cursor_column)]
+            if pending:
+                # Si ya se crearon en un intento anterior, actualizar en lugar de duplicar
+                recovered = {}
+                for row in pending:
+                    if not row.get("hubspot_id") and row["id"] in unwritten:
+                        row["hubspot_id"] = recovered[row["id"]] = unwritten[row["id"]]
+                new_ids: Dict[int, str] = {}
+                rejected: Dict[int, Exception] = {}
+                missing: Dict[int, dict] = {}
+                try:
+                    self._send(entity, pending, new_ids, rejected, missing)
+                finally:
+                    # Lo ya creado no se vuelve a crear aunque el lote falle a medias
+                    unwritten.update(new_ids)
+                to_write = {**recovered, **new_ids}
+                if to_write:
+                    if entity.table == "contacts":
+                        self._associate(db, pending, to_write)
+                    self._write_back(db, entity, to_write)
+                    for row_id in to_write:
+                        unwritten.pop(row_id, None)
+                if rejected:
+                    self._reject(entity, pending, rejected)
+                if missing:
+                    self._dead_letter(entity, list(missing.values()))
+                pushed += len(pending) - len(rejected) - len(missing)
+            last = rows[-1]
+            mark.update(cursor=last[self.cursor_column], id=last["id"])
+            self._save_state()
+            if len(rows) < self.batch_size:
+                return pushed
+
+    def run_once(self) -> dict:
+        """Un ciclo de sincronización (bloqueante); no se solapa con otro en curso"""
+        if not self._running.acquire(blocking=False):
+            return {"ok": False, "reason": "already_running"}
+        started = time.time()
+        result: Dict[str, object] = {"ok": True, "started_at": started, "pushed": {}}
+        try:
+            db = database.get_client()
+            if db is None:
+                raise RuntimeError("Supabase client not configured")
+            for entity in ENTITIES:
+                try:
+                    result["pushed"][entity.table] = self._sync_entity(db, entity)
+                except Exception as e:
+                    # La marca no avanza: el lote se reintenta en el siguiente ciclo
+                    SYNC_ERRORS.inc(entity=entity.table)
+                    result["ok"] = False
+                    result.setdefault("errors", {})[entity.table] = str(getattr(e, "detail", e))
+                    print(f"[WARN] HubSpot sync of {entity.table} failed: {e}")
+        except Exception as e:
+            result.update(ok=False, errors={"all": str(e)})
+        finally:
+            self._running.release()
+        result["seconds"] = round(time.time() - started, 3)
+        self.last_run = result
+        return result
+
+    # ---- Ciclo en segundo plano ----
+    async def _loop(self) -> None:
+        while True:
+            await asyncio.to_thread(self.run_once)
+            await asyncio.sleep(self.interval)
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def status(self) -> dict:
+        return {
+            "running": self._task is not None,
+            "interval": self.interval,
+            "cursor_column": self.cursor_column,
+            "watermarks": self.state,
+            "last_run": self.last_run,
+            "rejected": self.rejected,
+        }
+
+
+_worker: Optional[HubSpotSyncWorker] = None
+
+
+def get_hubspot_sync() -> HubSpotSyncWorker:
+    global _worker
+    if _worker is None:
+        _worker = HubSpotSyncWorker(
+            HUBSPOT_SYNC_INTERVAL,
+            batch_size=HUBSPOT_SYNC_BATCH_SIZE,
+            cursor_column=HUBSPOT_SYNC_CURSOR_COLUMN,
+            state_path=HUBSPOT_SYNC_STATE_PATH,
+        )
+    return _worker
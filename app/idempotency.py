@@ -0,0 +1,243 @@
+"""
+Claves de idempotencia (`Idempotency-Key`) para los endpoints que crean
+recursos o envían correos. La primera petición con una clave se ejecuta y su
+respuesta se guarda durante `ttl` segundos; los reintentos con la misma clave
+reciben la misma respuesta (cabecera `Idempotent-Replayed: true`) y los
+duplicados concurrentes esperan a que termine la primera en lugar de repetir
+el trabajo en HubSpot o SMTP.
+"""
+import asyncio
+import hashlib
+import re
+import tempfile
+from typing import Any, Collection, Dict, Iterable, List, Tuple
+
+from starlette.datastructures import Headers
+from starlette.responses import JSONResponse
+
+from app import metrics
+from app.admission import client_key
+from app.cache import TTLCache
+
+IDEMPOTENCY_HEADER = "idempotency-key"
+MAX_KEY_LENGTH = 255
+
+BOUNDARY_RE = re.compile(r'boundary="?([^";]+)"?', re.IGNORECASE)
+# Multipart: hasta este tamaño el cuerpo se guarda en memoria, después en disco
+SPOOL_MAX_MEMORY = 1024 * 1024
+SPOOL_CHUNK_SIZE = 64 * 1024
+
+# Cabeceras que dependen de cada petición y no se repiten al reproducir
+PER_REQUEST_HEADERS = {b"server-timing", b"timing-allow-origin", b"date"}
+
+IDEMPOTENT_REQUESTS = metrics.counter(
+    "idempotent_requests_total", "Requests carrying an Idempotency-Key, by outcome", ("route", "outcome")
+)
+
+
+class _StoredResponse:
+    def __init__(self, fingerprint: str, status: int, headers: List[Tuple[bytes, bytes]], body: bytes):
+        self.fingerprint = fingerprint
+        self.status = status
+        self.headers = headers
+        self.body = body
+
+
+class _BoundaryStrippingHash:
+    """sha256 de un cuerpo multipart sin su boundary, que el navegador cambia en cada envío"""
+
+    def __init__(self, boundary: bytes):
+        self.hash = hashlib.sha256()
+        self.boundary = boundary
+        self.tail = b""
+
+    def update(self, chunk: bytes) -> None:
+        data = (self.tail + chunk).replace(self.boundary, b"")
+        # Un boundary puede quedar partido entre dos bloques: se guarda la cola
+        split = max(len(data) - len(self.boundary) + 1, 0)
+        self.hash.update(data[:split])
+        self.tail = data[split:]
+
+    def digest(self) -> bytes:
+        self.hash.update(self.tail)
+        self.tail = b""
+        return self.hash.digest()
+
+
+class _InFlight:
+    def __init__(self, fingerprint: str):
+        self.fingerprint = fingerprint
+        self.done = asyncio.Event()
+
+
+class IdempotencyMiddleware:
+    """
+    Middleware ASGI para las rutas POST de `paths`. Las peticiones sin la
+    cabecera pasan sin cambios. La huella (método, ruta, query y cuerpo) evita
+    reutilizar una clave con otra petición: en ese caso responde 422. En
+    multipart el cuerpo (campos y adjuntos) se copia a un archivo temporal y
+    entra en la huella sin el boundary. Las claves son por cliente (`X-API-Key`
+    permitida o IP, como en la admisión): dos clientes que repiten la misma
+    clave no reciben la respuesta del otro.
+    """
+
+    def __init__(self, app, paths: Iterable[str], ttl: float = 86400, max_entries: int = 10000,
+                 trust_forwarded: bool = False, api_keys: Collection[str] = ()):
+        self.app = app
+        self.paths = set(paths)
+        self.trust_forwarded = trust_forwarded
+        self.api_keys = frozenset(api_keys)
+        self.completed = TTLCache(ttl, max_entries)
+        self.in_flight: Dict[Tuple[str, str, str], _InFlight] = {}
+
+    async def _read_body(self, receive) -> bytes:
+        chunks = []
+        while True:
+            message = await receive()
+            chunks.append(message.get("body", b""))
+            if not message.get("more_body"):
+                return b"".join(chunks)
+
+    async def _spool_multipart(self, receive, boundary: bytes) -> Tuple[Any, bytes]:
+        """Copiar el cuerpo multipart a un archivo temporal; devuelve (archivo, hash sin boundary)"""
+        spool = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_MEMORY)
+        digest = _BoundaryStrippingHash(boundary)
+        try:
+            while True:
+                message = await receive()
+                chunk = message.get("body", b"")
+                if chunk:
+                    digest.update(chunk)
+                    await asyncio.to_thread(spool.write, chunk)
+                if not message.get("more_body"):
+                    break
+            spool.seek(0)
+        except BaseException:
+            spool.close()
+            raise
+        return spool, digest.digest()
+
+    @staticmethod
+    def _fingerprint(scope, body_digest: bytes) -> str:
+        h = hashlib.sha256()
+        h.update(scope["method"].encode() + b"\0" + scope["path"].encode() + b"\0")
+        h.update(scope.get("query_string", b"") + b"\0")
+        h.update(body_digest)
+        return h.hexdigest()
+
+    @staticmethod
+    def _conflict(message: str) -> JSONResponse:
+        return JSONResponse(status_code=422, content={"detail": message})
+
+    async def _replay(self, stored: _StoredResponse, send) -> None:
+        await send({
+            "type": "http.response.start",
+            "status": stored.status,
+            "headers": stored.headers + [(b"idempotent-replayed", b"true")],
+        })
+        await send({"type": "http.response.body", "body": stored.body})
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "POST" or scope["path"] not in self.paths:
+            await self.app(scope, receive, send)
+            return
+        headers = Headers(scope=scope)
+        key = headers.get(IDEMPOTENCY_HEADER)
+        if key is None:
+            await self.app(scope, receive, send)
+            return
+
+        route = scope["path"]
+        if not key or len(key) > MAX_KEY_LENGTH:
+            await JSONResponse(
+                status_code=400, content={"detail": f"Idempotency-Key must be 1-{MAX_KEY_LENGTH} characters"}
+            )(scope, receive, send)
+            return
+
+        spool = None
+        content_type = headers.get("content-type", "")
+        boundary = BOUNDARY_RE.search(content_type) if content_type.startswith("multipart/") else None
+        if boundary:
+            spool, body_digest = await self._spool_multipart(receive, boundary.group(1).encode("latin-1"))
+            body_done = False
+
+            async def receive_buffered():
+                nonlocal body_done
+                if body_done:
+                    return await receive()
+                chunk = await asyncio.to_thread(spool.read, SPOOL_CHUNK_SIZE)
+                body_done = len(chunk) < SPOOL_CHUNK_SIZE
+                return {"type": "http.request", "body": chunk, "more_body": not body_done}
+        else:
+            body = await self._read_body(receive)
+            body_digest = hashlib.sha256(body).digest()
+            replayed_body = {"type": "http.request", "body": body, "more_body": False}
+
+            async def receive_buffered():
+                nonlocal replayed_body
+                if replayed_body is not None:
+                    message, replayed_body = replayed_body, None
+                    return message
+                return await receive()
+
+        try:
+            await self._handle(scope, receive_buffered, send, route, key, self._fingerprint(scope, body_digest))
+        finally:
+            if spool is not None:
+                spool.close()
+
+    async def _handle(self, scope, receive, send, route: str, key: str, fingerprint: str) -> None:
+        store_key = (route, client_key(scope, self.trust_forwarded, self.api_keys), key)
+
+        outcome = "replayed"
+        while True:
+            stored = self.completed.get(store_key)
+            pending = self.in_flight.get(store_key)
+            current = stored or pending
+            if current is not None and current.fingerprint != fingerprint:
+                IDEMPOTENT_REQUESTS.inc(route=route, outcome="mismatch")
+                await self._conflict("Idempotency-Key was already used with a different request")(
+                    scope, receive, send
+                )
+                return
+            if stored is not None:
+                IDEMPOTENT_REQUESTS.inc(route=route, outcome=outcome)
+                await self._replay(stored, send)
+                return
+            if pending is None:
+                break
+            # Duplicado concurrente: esperar a la primera petición y reproducir
+            # su respuesta; si falló (no se guardó), ejecutar esta
+            outcome = "waited"
+            await pending.done.wait()
+
+        IDEMPOTENT_REQUESTS.inc(route=route, outcome="new")
+        pending = self.in_flight[store_key] = _InFlight(fingerprint)
+        response = {"status": 500, "headers": [], "body": []}
+        complete = False
+
+        async def send_capturing(message):
+            nonlocal complete
+            if message["type"] == "http.response.start":
+                response["status"] = message["status"]
+                response["headers"] = [
+                    (name, value) for name, value in message.get("headers", [])
+                    if name.lower() not in PER_REQUEST_HEADERS
+                ]
+            elif message["type"] == "http.response.body":
+                response["body"].append(message.get("body", b""))
+                complete = not message.get("more_body", False)
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_capturing)
+        finally:
+            status = response["status"]
+            # Solo se guardan respuestas exitosas: tras un 4xx/5xx no se creó
+            # nada y el cliente puede corregir la petición o reintentar
+            if complete and status < 400:
+                self.completed.set(store_key, _StoredResponse(
+                    fingerprint, status, response["headers"], b"".join(response["body"])
+                ))
+            del self.in_flight[store_key]
+            pending.done.set()
@@ -0,0 +1,106 @@
+"""
+Instrumentación de llamadas a servicios externos (HubSpot, Supabase, Gemini,
+SMTP) y de la latencia por ruta. Todo se publica en `/metrics`.
+Los transportes httpx instrumentados están en `app/http_instrumentation.py`.
+"""
+import time
+from typing import Optional
+
+from app import metrics, timing
+
+UPSTREAM_SECONDS = metrics.histogram(
+    "upstream_request_duration_seconds", "Upstream call latency", ("upstream", "operation")
+)
+UPSTREAM_REQUESTS = metrics.counter(
+    "upstream_requests_total", "Upstream calls by status", ("upstream", "operation", "status")
+)
+UPSTREAM_ERRORS = metrics.counter(
+    "upstream_errors_total", "Upstream calls that raised, by exception type", ("upstream", "operation", "error")
+)
+UPSTREAM_IN_FLIGHT = metrics.gauge(
+    "upstream_in_flight", "Upstream calls in progress", ("upstream", "operation")
+)
+
+HTTP_SECONDS = metrics.histogram(
+    "http_request_duration_seconds", "Request latency by route", ("method", "route", "status")
+)
+HTTP_IN_FLIGHT = metrics.gauge("http_requests_in_flight", "Requests in progress")
+
+class UpstreamCall:
+    """
+    Context manager (sync o async) que mide una llamada externa.
+    Asignar `status` dentro del bloque (p. ej. el código HTTP); si el bloque
+    lanza una excepción se cuenta como `error` con el tipo de la excepción.
+    """
+
+    def __init__(self, upstream: str, operation: str):
+        self.upstream = upstream
+        self.operation = operation
+        self.status: Optional[object] = None
+        self._started = 0.0
+
+    def __enter__(self) -> "UpstreamCall":
+        UPSTREAM_IN_FLIGHT.inc(upstream=self.upstream, operation=self.operation)
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> bool:
+        elapsed = time.perf_counter() - self._started
+        labels = {"upstream": self.upstream, "operation": self.operation}
+        UPSTREAM_IN_FLIGHT.dec(**labels)
+        UPSTREAM_SECONDS.observe(elapsed, **labels)
+        timing.add(self.upstream, elapsed)
+        if exc_type is not None:
+            UPSTREAM_ERRORS.inc(error=exc_type.__name__, **labels)
+            status = getattr(exc, "smtp_code", None) or self.status or "error"
+        else:
+            status = self.status if self.status is not None else "ok"
+        UPSTREAM_REQUESTS.inc(status=str(status), **labels)
+        return False
+
+    async def __aenter__(self) -> "UpstreamCall":
+        return self.__enter__()
+
+    async def __aexit__(self, exc_type, exc, tb) -> bool:
+        return self.__exit__(exc_type, exc, tb)
+
+
+def track(upstream: str, operation: str) -> UpstreamCall:
+    return UpstreamCall(upstream, operation)
+
+
+# ---- Latencia por ruta ----
+class RouteMetricsMiddleware:
+    """
+    Middleware ASGI que registra la latencia de cada petición etiquetada con la
+    plantilla de la ruta (`/companies/{company_id}`), incluido el cuerpo en streaming.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = {"code": 500}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        HTTP_IN_FLIGHT.inc()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            HTTP_IN_FLIGHT.dec()
+            route = scope.get("route")
+            HTTP_SECONDS.observe(
+                time.perf_counter() - started,
+                method=scope["method"],
+                route=getattr(route, "path", None) or "unmatched",
+                status=str(status["code"]),
+            )
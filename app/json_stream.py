@@ -0,0 +1,91 @@
+"""
+Parser incremental de JSON para respuestas en streaming de Gemini.
+Extrae cada objeto completo del arreglo "items" a medida que llega el texto.
+"""
+import json
+from typing import List
+
+
+class ItemsStreamParser:
+    """
+    Recibe fragmentos de texto con `feed()` y devuelve los objetos del arreglo
+    `items` (o de un arreglo de nivel superior) en cuanto se cierran.
+
+    Solo analiza los caracteres nuevos de cada fragmento; el texto acumulado
+    queda disponible en `text` para un parseo completo de respaldo.
+    """
+
+    def __init__(self, key: str = "items"):
+        self._key = key
+        self._text = ""
+        self._pos = 0
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._string_start = 0
+        self._pending_key = None
+        self._items_depth = None
+        self._item_start = None
+        self.done = False
+
+    @property
+    def text(self) -> str:
+        return self._text
+
+    def feed(self, chunk: str) -> List[dict]:
+        """Agregar un fragmento y devolver los items que quedaron completos"""
+        if not chunk:
+            return []
+        self._text += chunk
+        items: List[dict] = []
+        text = self._text
+
+        for i in range(self._pos, len(text)):
+            ch = text[i]
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                    if self._depth == 1 and self._items_depth is None:
+                        try:
+                            self._pending_key = json.loads(text[self._string_start:i + 1])
+                        except ValueError:
+                            self._pending_key = None
+                continue
+
+            if ch == '"':
+                self._in_string = True
+                self._string_start = i
+            elif ch in "{[":
+                if (
+                    ch == "["
+                    and self._items_depth is None
+                    and not self.done
+                    and (self._depth == 0 or (self._depth == 1 and self._pending_key == self._key))
+                ):
+                    self._items_depth = self._depth + 1
+                elif ch == "{" and self._items_depth is not None and self._depth == self._items_depth:
+                    self._item_start = i
+                self._depth += 1
+            elif ch in "}]":
+                self._depth -= 1
+                if ch == "}" and self._item_start is not None and self._depth == self._items_depth:
+                    try:
+                        obj = json.loads(text[self._item_start:i + 1])
+                        if isinstance(obj, dict):
+                            items.append(obj)
+                    except ValueError:
+                        pass
+                    self._item_start = None
+                elif ch == "]" and self._items_depth is not None and self._depth == self._items_depth - 1:
+                    self._items_depth = None
+                    self.done = True
+            elif ch == "," and self._depth == 1:
+                self._pending_key = None
+
+        self._pos = len(text)
+        return items
@@ -0,0 +1,243 @@
+"""
+Envío masivo (mail-merge) a partir de una plantilla.
+La plantilla se compila una sola vez y se renderiza por contacto con los datos
+de `contacts`/`companies`; los contactos se recorren por páginas (memoria
+acotada), la entrega pasa por el pool SMTP con límite de tasa y el resultado
+de cada destinatario se registra en `emails` con un insert por página. Un
+fallo transitorio de SMTP no marca el envío como `fallido`: el mensaje pasa al
+outbox, que lo reintenta con backoff.
+"""
+import asyncio
+import re
+import uuid
+from datetime import datetime, timezone
+from email.message import EmailMessage
+from email.utils import make_msgid
+from typing import Callable, Dict, List, Optional
+
+from app import events
+from app.cache import TTLCache
+from app.config import EMAIL_BULK_PAGE_SIZE, EMAIL_BULK_RATE, GMAIL_USER
+from app.outbox import get_outbox, is_permanent
+from app.ratelimit import TokenBucket
+from app.registry import registry
+from app.resilience import UpstreamUnavailable
+
+PLACEHOLDER_RE = re.compile(r"\{\{\s*([\w.]+)\s*\}\}")
+
+# Columnas de contacts que se aceptan como filtro
+CONTACT_FILTER_COLUMNS = {"company_id", "estado", "country", "role", "fuente", "propietario", "cargo"}
+
+# Progreso de campañas recientes (en memoria)
+campaigns = TTLCache(ttl=24 * 3600, max_entries=200)
+_running = set()
+
+
+class CompiledTemplate:
+    """Plantilla con marcadores `{{campo}}` o `{{company.campo}}`, precompilada"""
+
+    def __init__(self, source: str):
+        self.source = source or ""
+        self._parts: List[Callable[[dict], str]] = []
+        pos = 0
+        for m in PLACEHOLDER_RE.finditer(self.source):
+            literal = self.source[pos:m.start()]
+            self._parts.append(lambda _ctx, s=literal: s)
+            self._parts.append(self._getter(m.group(1).split(".")))
+            pos = m.end()
+        tail = self.source[pos:]
+        self._parts.append(lambda _ctx, s=tail: s)
+
+    @staticmethod
+    def _getter(path: List[str]) -> Callable[[dict], str]:
+        def get(ctx: dict) -> str:
+            value = ctx
+            for key in path:
+                if not isinstance(value, dict):
+                    return ""
+                value = value.get(key)
+            return "" if value is None else str(value)
+        return get
+
+    def render(self, ctx: dict) -> str:
+        return "".join(part(ctx) for part in self._parts)
+
+
+def contact_context(contact: dict, company: Optional[dict], extra: Optional[dict] = None) -> dict:
+    """Variables disponibles en la plantilla para un destinatario"""
+    ctx = dict(contact)
+    nombre = contact.get("nombre") or " ".join(
+        p for p in (contact.get("first_name"), contact.get("last_name")) if p
+    )
+    ctx["nombre"] = nombre
+    ctx.setdefault("first_name", nombre.split()[0] if nombre else "")
+    ctx["company"] = company or {}
+    ctx["empresa"] = (company or {}).get("name", "")
+    if extra:
+        ctx.update(extra)
+    return ctx
+
+
+def _now_iso() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+def validate_filters(filters: Optional[dict]) -> dict:
+    """
+    Filtro de contactos de una campaña: debe tener al menos una columna y
+    todas en `CONTACT_FILTER_COLUMNS`. Un filtro vacío o con una columna mal
+    escrita no puede convertirse en "todos los contactos".
+    """
+    if not filters:
+        raise ValueError("filter must include at least one of: " + ", ".join(sorted(CONTACT_FILTER_COLUMNS)))
+    unknown = sorted(k for k in filters if k not in CONTACT_FILTER_COLUMNS)
+    if unknown:
+        raise ValueError(
+            f"Unknown filter columns: {', '.join(unknown)} "
+            f"(allowed: {', '.join(sorted(CONTACT_FILTER_COLUMNS))})"
+        )
+    return dict(filters)
+
+
+class Campaign:
+    def __init__(self, db, asunto: str, body: str, plantilla: Optional[str],
+                 responsable: Optional[str], recipients: Optional[List[dict]],
+                 filters: Optional[dict]):
+        self.id = uuid.uuid4().hex
+        self.db = db
+        self.subject = CompiledTemplate(asunto)
+        self.body = CompiledTemplate(body)
+        self.plantilla = plantilla
+        self.responsable = responsable
+        self.recipients = recipients
+        self.filters = validate_filters(filters) if recipients is None else {}
+        self.limiter = TokenBucket(EMAIL_BULK_RATE)
+        self.companies: Dict[int, dict] = {}
+        self.progress = {
+            "id": self.id,
+            "status": "running",
+            "sent": 0,
+            "failed": 0,
+            "retrying": 0,
+            "recorded": 0,
+            "errors": [],
+            "started_at": _now_iso(),
+            "finished_at": None,
+        }
+
+    # ---- Destinatarios por páginas ----
+    def _contact_pages(self):
+        if self.recipients is not None:
+            for i in range(0, len(self.recipients), EMAIL_BULK_PAGE_SIZE):
+                yield self.recipients[i:i + EMAIL_BULK_PAGE_SIZE]
+            return
+        last_id = 0
+        while True:
+            query = self.db.table("contacts").select("*")
+            for k, v in self.filters.items():
+                query = query.eq(k, v)
+            resp = (
+                query.not_.is_("email", "null")
+                .gt("id", last_id)
+                .order("id")
+                .limit(EMAIL_BULK_PAGE_SIZE)
+                .execute()
+            )
+            page = getattr(resp, "data", None) or []
+            if not page:
+                return
+            yield page
+            if len(page) < EMAIL_BULK_PAGE_SIZE:
+                return
+            last_id = page[-1]["id"]
+
+    def _load_companies(self, page: List[dict]) -> None:
+        missing = sorted({
+            c["company_id"] for c in page
+            if c.get("company_id") is not None and c["company_id"] not in self.companies
+        })
+        if not missing:
+            return
+        resp = self.db.table("companies").select("*").in_("id", missing).execute()
+        for row in getattr(resp, "data", None) or []:
+            self.companies[row["id"]] = row
+
+    # ---- Envío ----
+    def _build(self, ctx: dict, to_addr: str) -> EmailMessage:
+        msg = EmailMessage()
+        msg["From"] = GMAIL_USER
+        msg["To"] = to_addr
+        msg["Subject"] = self.subject.render(ctx)
+        msg["Message-Id"] = make_msgid()
+        msg.set_content(self.body.render(ctx))
+        return msg
+
+    async def _send_one(self, contact: dict) -> Optional[dict]:
+        to_addr = (contact.get("email") or "").strip()
+        ctx = contact_context(contact, self.companies.get(contact.get("company_id")), contact.get("vars"))
+        row = {
+            "asunto": self.subject.render(ctx),
+            "para": to_addr,
+            "plantilla": self.plantilla,
+            "responsable": self.responsable,
+            "fecha_hora": _now_iso(),
+        }
+        if not to_addr:
+            self.progress["failed"] += 1
+            return {**row, "estado": "fallido"}
+        await self.limiter.acquire()
+        msg = self._build(ctx, to_addr)
+        try:
+            await registry.get("smtp").send_message(msg)
+        except Exception as e:
+            if not is_permanent(e):
+                # Transitorio: el outbox registra la fila como pendiente y reintenta
+                try:
+                    # Con el circuito abierto no se llegó a intentar: no cuenta como intento
+                    failure = None if isinstance(e, UpstreamUnavailable) else e
+                    await get_outbox().enqueue(self.db, msg, [to_addr], row, failure=failure)
+                    self.progress["retrying"] += 1
+                    return None
+                except Exception as enqueue_error:
+                    e = enqueue_error
+            self.progress["failed"] += 1
+            if len(self.progress["errors"]) < 50:
+                self.progress["errors"].append({"para": to_addr, "error": str(e)})
+            return {**row, "estado": "fallido"}
+        self.progress["sent"] += 1
+        return {**row, "estado": "enviado"}
+
+    async def run(self) -> None:
+        try:
+            pages = self._contact_pages()
+            while True:
+                page = await asyncio.to_thread(next, pages, None)
+                if page is None:
+                    break
+                await asyncio.to_thread(self._load_companies, page)
+                rows = [r for r in await asyncio.gather(*(self._send_one(c) for c in page)) if r]
+                if not rows:
+                    continue
+                try:
+                    resp = await asyncio.to_thread(lambda: self.db.table("emails").insert(list(rows)).execute())
+                    events.publish("emails", events.CREATED, getattr(resp, "data", None))
+                    self.progress["recorded"] += len(rows)
+                except Exception as e:
+                    self.progress["errors"].append({"error": f"emails insert failed: {e}"})
+            self.progress["status"] = "completed"
+        except Exception as e:
+            self.progress["status"] = "error"
+            self.progress["errors"].append({"error": str(e)})
+        finally:
+            self.progress["finished_at"] = _now_iso()
+
+
+def start_campaign(db, asunto: str, body: str, plantilla: Optional[str], responsable: Optional[str],
+                   recipients: Optional[List[dict]], filters: Optional[dict]) -> dict:
+    """Crear la campaña y ejecutarla en segundo plano; devuelve su progreso"""
+    campaign = Campaign(db, asunto, body, plantilla, responsable, recipients, filters)
+    campaigns.set(campaign.id, campaign.progress)
+    task = asyncio.get_running_loop().create_task(campaign.run())
+    _running.add(task)
+    task.add_done_callback(_running.discard)
+    return campaign.progress
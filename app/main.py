@@ -2,24 +2,129 @@
 API principal de instrategy-sales-flow
 Organizado con arquitectura modular
 """
-from fastapi import FastAPI, HTTPException
+import asyncio
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Query, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.exception_handlers import http_exception_handler
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse
 from pydantic import BaseModel
-from typing import Optional
+from typing import List, Optional
 
-from app.config import ALLOWED_ORIGINS, CORS_ORIGIN
+from app import metrics
+from app.config import (
+    ADMISSION_API_KEYS,
+    ADMISSION_ENABLED,
+    ADMISSION_GROUPS,
+    ADMISSION_MAX_QUEUE,
+    ADMISSION_MAX_QUEUE_TOTAL,
+    ADMISSION_QUEUE_TIMEOUT,
+    ADMISSION_TRUST_FORWARDED,
+    ADMIN_TOKEN,
+    ALLOWED_ORIGINS,
+    COMPRESSION_ENABLED,
+    COMPRESSION_MIN_SIZE,
+    CORS_ORIGIN,
+    HUBSPOT_LIST_CACHE_TTL,
+    HUBSPOT_SYNC_ENABLED,
+    IDEMPOTENCY_MAX_ENTRIES,
+    IDEMPOTENCY_TTL,
+    PROFILE_SAMPLE_INTERVAL,
+    SNAPSHOT_INTERVAL,
+    WARMUP_CLIENTS,
+    WARMUP_ON_STARTUP,
+)
 from app.routes import api_router
-from app.database import supabase_client
+from app.admission import AdmissionMiddleware, RouteGroup
+from app.cache import TTLCache
+from app.database import get_client
+from app.dead_letters import record_sync_failure
+from app.hubspot_sync import get_hubspot_sync
+from app.idempotency import IdempotencyMiddleware
+from app.instrumentation import RouteMetricsMiddleware
+from app.timing import ServerTimingMiddleware, TimedRoute
+from app.outbox import get_outbox
+from app.registry import registry
+from app.resilience import UpstreamUnavailable, upstream_health
+from app.serialization import CompressionMiddleware, FastJSONResponse, PrecomputedJSON
+from app.snapshots import available as snapshots_available, get_snapshots
 
 from app.hubspot_api import (
+    LIST_VERSION,
+    PROPIEDADES_CONTACTO_SIMPLE,
+    PROPIEDADES_EMPRESA_SIMPLE,
+    buscar_objetos,
     obtener_empresas_simple, 
     obtener_contactos_simple,
     sincronizar_empresa_a_hubspot,
     sincronizar_contacto_a_hubspot
 )
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Arranque y cierre de los workers en segundo plano. Los clientes externos
+    se calientan en paralelo sin bloquear el arranque: la app queda lista de
+    inmediato y la primera petición espera solo al cliente que necesita.
+    """
+    outbox = get_outbox()
+    await outbox.start()
+    warmup = asyncio.create_task(registry.warm_up(WARMUP_CLIENTS)) if WARMUP_ON_STARTUP else None
+    if HUBSPOT_SYNC_ENABLED:
+        get_hubspot_sync().start()
+    if SNAPSHOT_INTERVAL > 0 and snapshots_available():
+        get_snapshots().start()
+    try:
+        yield
+    finally:
+        if warmup is not None and not warmup.done():
+            warmup.cancel()
+        await get_hubspot_sync().stop()
+        await get_snapshots().stop()
+        await outbox.stop()
+        await registry.close()
+
+
 # Crear aplicación FastAPI
-app = FastAPI(title="instrategy-sales-flow API (Python)")
+app = FastAPI(
+    title="instrategy-sales-flow API (Python)",
+    lifespan=lifespan,
+    default_response_class=FastJSONResponse,
+)
+app.router.route_class = TimedRoute
+
+# Límites por cliente en /parse*, /sync/* y /emails/send|bulk (429 + Retry-After al saturarse).
+# Va por dentro de Idempotency-Key: las respuestas reproducidas no consumen turno
+if ADMISSION_ENABLED:
+    app.add_middleware(
+        AdmissionMiddleware,
+        groups=[RouteGroup(name, **spec) for name, spec in ADMISSION_GROUPS.items()],
+        max_queue=ADMISSION_MAX_QUEUE,
+        queue_timeout=ADMISSION_QUEUE_TIMEOUT,
+        max_queue_total=ADMISSION_MAX_QUEUE_TOTAL,
+        trust_forwarded=ADMISSION_TRUST_FORWARDED,
+        api_keys=ADMISSION_API_KEYS,
+    )
+
+# Idempotency-Key en los endpoints que crean en HubSpot o envían correos
+# (por cliente: la misma identidad que usa la admisión)
+app.add_middleware(
+    IdempotencyMiddleware,
+    paths=("/sync/empresa", "/sync/contacto", "/emails/send", "/emails/bulk", "/hubspot/import"),
+    ttl=IDEMPOTENCY_TTL,
+    max_entries=IDEMPOTENCY_MAX_ENTRIES,
+    trust_forwarded=ADMISSION_TRUST_FORWARDED,
+    api_keys=ADMISSION_API_KEYS,
+)
+
+# Server-Timing por petición y ?profile=1 para administradores
+app.add_middleware(
+    ServerTimingMiddleware,
+    admin_token=ADMIN_TOKEN,
+    profile_interval=PROFILE_SAMPLE_INTERVAL,
+    allowed_origins=ALLOWED_ORIGINS,
+)
 
 # Configurar CORS
 app.add_middleware(
@@ -30,16 +135,108 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# gzip/brotli para respuestas grandes (no para streams)
+if COMPRESSION_ENABLED:
+    app.add_middleware(CompressionMiddleware, minimum_size=COMPRESSION_MIN_SIZE)
+
+# Latencia por ruta (se publica en /metrics)
+app.add_middleware(RouteMetricsMiddleware)
+
 # Incluir todas las rutas
 app.include_router(api_router)
 
+
+# ------- UPSTREAM NO DISPONIBLE (circuito abierto / bulkhead lleno) -------
+def upstream_unavailable_response(exc: UpstreamUnavailable) -> JSONResponse:
+    return JSONResponse(
+        status_code=503,
+        content={"detail": str(exc), "upstream": exc.upstream, "reason": exc.reason},
+        headers={"Retry-After": str(max(int(exc.retry_after + 0.999), 1))},
+    )
+
+
+@app.exception_handler(UpstreamUnavailable)
+async def handle_upstream_unavailable(request: Request, exc: UpstreamUnavailable):
+    return upstream_unavailable_response(exc)
+
+
+@app.exception_handler(HTTPException)
+async def handle_http_exception(request: Request, exc: HTTPException):
+    # Las rutas convierten cualquier excepción en HTTPException(500); si la
+    # causa fue un upstream no disponible se responde 503 con Retry-After
+    if exc.status_code == 500 and isinstance(exc.__context__, UpstreamUnavailable):
+        return upstream_unavailable_response(exc.__context__)
+    return await http_exception_handler(request, exc)
+
+
+FILTER_HELP = "propiedad:OPERADOR:valor, repetible (AND). Ej.: country:EQ:Peru, email:CONTAINS_TOKEN:*@empresa.com"
+SORT_HELP = "propiedad o -propiedad (descendente), repetible"
+
+
+# Listados completos de HubSpot ya codificados: {(tipo, versión): PrecomputedJSON}
+_listados = TTLCache(ttl=HUBSPOT_LIST_CACHE_TTL, max_entries=4)
+
+
+def _listado_completo(object_type: str, listar, accept_encoding: str):
+    """
+    Lista completa servida desde memoria durante HUBSPOT_LIST_CACHE_TTL
+    segundos, sin volver a serializarla ni comprimirla. Una escritura en
+    HubSpot desde esta API cambia la versión y la invalida.
+    """
+    key = (object_type, LIST_VERSION[object_type])
+    listado = _listados.get(key)
+    if listado is None:
+        listado = PrecomputedJSON(listar())
+        _listados.set(key, listado)
+    return listado.response(accept_encoding)
+
+
+def _buscar_o_listar(request: Request, object_type: str, default_properties: str, listar,
+                     filtros: List[str], q: Optional[str], sort: List[str], properties: Optional[str],
+                     limit: Optional[int], after: Optional[str]):
+    """
+    Sin parámetros devuelve la lista completa (comportamiento original). Con
+    filtros, búsqueda, orden, propiedades o paginación usa `/search` de HubSpot
+    y devuelve una página: {"results", "total", "after"}.
+    """
+    if not (filtros or q or sort or properties or limit or after):
+        return _listado_completo(object_type, listar, request.headers.get("accept-encoding", ""))
+    return FastJSONResponse(buscar_objetos(
+        object_type,
+        properties or default_properties,
+        filtros=filtros,
+        query=q,
+        orden=sort,
+        limit=limit or 100,
+        after=after,
+    ))
+
+
 @app.get("/empresas")
-def listar_empresas():
-    return obtener_empresas_simple()
+def listar_empresas(
+    request: Request,
+    filtros: List[str] = Query([], alias="filter", description=FILTER_HELP),
+    q: Optional[str] = Query(None, description="Búsqueda de texto libre"),
+    sort: List[str] = Query([], description=SORT_HELP),
+    properties: Optional[str] = Query(None, description="Propiedades separadas por comas"),
+    limit: Optional[int] = Query(None, ge=1, le=200),
+    after: Optional[str] = Query(None, description="Cursor de la página siguiente"),
+):
+    return _buscar_o_listar(request, "companies", PROPIEDADES_EMPRESA_SIMPLE, obtener_empresas_simple,
+                            filtros, q, sort, properties, limit, after)
 
 @app.get("/contactos")
-def listar_contactos():
-    return obtener_contactos_simple()
+def listar_contactos(
+    request: Request,
+    filtros: List[str] = Query([], alias="filter", description=FILTER_HELP),
+    q: Optional[str] = Query(None, description="Búsqueda de texto libre"),
+    sort: List[str] = Query([], description=SORT_HELP),
+    properties: Optional[str] = Query(None, description="Propiedades separadas por comas"),
+    limit: Optional[int] = Query(None, ge=1, le=200),
+    after: Optional[str] = Query(None, description="Cursor de la página siguiente"),
+):
+    return _buscar_o_listar(request, "contacts", PROPIEDADES_CONTACTO_SIMPLE, obtener_contactos_simple,
+                            filtros, q, sort, properties, limit, after)
 
 
 # ------- MODELOS PARA SINCRONIZACIÓN -------
@@ -76,12 +273,13 @@ async def sincronizar_empresa(empresa: EmpresaSyncRequest):
     Retorna el hubspot_id para actualizar en Supabase.
     """
     try:
-        resultado = sincronizar_empresa_a_hubspot(empresa.dict())
+        resultado = await run_in_threadpool(sincronizar_empresa_a_hubspot, empresa.dict())
         
         # Registrar en activity_log
-        if supabase_client:
+        db = get_client()
+        if db:
             try:
-                supabase_client.table("activity_log").insert({
+                db.table("activity_log").insert({
                     "event_type": "hubspot_sync",
                     "entity_type": "company",
                     "entity_id": empresa.id,
@@ -101,9 +299,12 @@ async def sincronizar_empresa(empresa: EmpresaSyncRequest):
             "success": True,
             "hubspot_id": resultado["hubspot_id"],
             "action": resultado["action"],
+            "omitted": resultado.get("omitted") or {},
             "message": f"Empresa {resultado['action']} en HubSpot exitosamente"
         }
     except Exception as e:
+        # Guardar el fallo para reenviarlo en bloque (/hubspot/dead-letters/replay)
+        await run_in_threadpool(record_sync_failure, "companies", empresa.dict(), e)
         raise HTTPException(status_code=500, detail=str(e))
 
 
@@ -115,12 +316,15 @@ async def sincronizar_contacto(contacto: ContactoSyncRequest, company_hubspot_id
     Retorna el hubspot_id para actualizar en Supabase.
     """
     try:
-        resultado = sincronizar_contacto_a_hubspot(contacto.dict(), company_hubspot_id)
+        resultado = await run_in_threadpool(
+            sincronizar_contacto_a_hubspot, contacto.dict(), company_hubspot_id
+        )
         
         # Registrar en activity_log
-        if supabase_client:
+        db = get_client()
+        if db:
             try:
-                supabase_client.table("activity_log").insert({
+                db.table("activity_log").insert({
                     "event_type": "hubspot_sync",
                     "entity_type": "contact",
                     "entity_id": contacto.id,
@@ -141,11 +345,30 @@ async def sincronizar_contacto(contacto: ContactoSyncRequest, company_hubspot_id
             "success": True,
             "hubspot_id": resultado["hubspot_id"],
             "action": resultado["action"],
+            "omitted": resultado.get("omitted") or {},
             "message": f"Contacto {resultado['action']} en HubSpot exitosamente"
         }
     except Exception as e:
+        await run_in_threadpool(record_sync_failure, "contacts", contacto.dict(), e, company_hubspot_id)
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/metrics", include_in_schema=False)
+async def prometheus_metrics():
+    """Métricas en formato de texto de Prometheus"""
+    return PlainTextResponse(metrics.render_prometheus(), media_type=metrics.CONTENT_TYPE)
+
+
+@app.get("/health")
+async def health():
+    """
+    Estado de los servicios externos (circuit breaker y bulkhead). Responde 200
+    aunque alguno esté caído: la API sigue sirviendo lo que no depende de él.
+    """
+    upstreams = upstream_health()
+    degraded = any(u["state"] != "closed" for u in upstreams.values())
+    return {"status": "degraded" if degraded else "ok", "upstreams": upstreams}
+
+
 # Endpoint raíz
 @app.get("/")
 async def root():
@@ -157,6 +380,9 @@ async def root():
             "contacts": "/contacts",
             "calls": "/calls",
             "emails": "/emails",
-            "parse": "/parse"
+            "parse": "/parse",
+            "hubspot": "/hubspot/sync",
+            "snapshots": "/snapshots",
+            "health": "/health"
         }
     }
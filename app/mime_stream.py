@@ -0,0 +1,137 @@
+"""
+Construcción de mensajes MIME en streaming.
+Los adjuntos se codifican en base64 por bloques directamente al archivo de
+destino, sin cargar el archivo completo en memoria. Cada adjunto se limita por
+su tamaño original y el mensaje completo por su tamaño codificado (lo que se
+envía por SMTP).
+"""
+import base64
+import mimetypes
+from email import policy
+from email.message import EmailMessage, MIMEPart
+from email.utils import make_msgid
+from typing import BinaryIO, List, Optional
+
+CRLF = b"\r\n"
+# 57 bytes de entrada → 76 caracteres base64 por línea
+B64_LINE_INPUT = 57
+READ_CHUNK = B64_LINE_INPUT * 1024
+
+
+class AttachmentTooLarge(Exception):
+    """Un adjunto o el mensaje completo supera el límite configurado"""
+
+
+class Attachment:
+    def __init__(self, fileobj: BinaryIO, filename: str, content_type: str):
+        self.fileobj = fileobj
+        self.filename = filename
+        self.content_type = content_type
+
+
+def encoded_size(raw_bytes: int) -> int:
+    """Bytes que ocupa un adjunto de `raw_bytes` en base64 con líneas de 76 + CRLF"""
+    lines = -(-raw_bytes // B64_LINE_INPUT)
+    return -(-raw_bytes // 3) * 4 + lines * len(CRLF)
+
+
+class _CountingWriter:
+    """Cuenta los bytes escritos y corta al superar `limit`"""
+
+    def __init__(self, out: BinaryIO, limit: int):
+        self.out = out
+        self.limit = limit
+        self.written = 0
+
+    def write(self, data: bytes) -> None:
+        self.written += len(data)
+        if self.written > self.limit:
+            raise AttachmentTooLarge(f"Encoded message exceeds {self.limit} bytes")
+        self.out.write(data)
+
+
+def guess_content_type(filename: Optional[str], declared: Optional[str] = None) -> str:
+    """Tipo MIME declarado por el cliente o, si es genérico, deducido del nombre"""
+    if declared and declared != "application/octet-stream" and "/" in declared:
+        return declared
+    guessed, _ = mimetypes.guess_type(filename or "")
+    return guessed or "application/octet-stream"
+
+
+def _headers_bytes(part: MIMEPart) -> bytes:
+    """Solo las cabeceras de una parte (terminadas en línea vacía) con saltos CRLF"""
+    return b"".join(policy.SMTP.fold_binary(k, v) for k, v in part.items()) + CRLF
+
+
+def write_mime(
+    out: BinaryIO,
+    from_addr: str,
+    to_addrs: List[str],
+    subject: str,
+    body: str,
+    attachments: List[Attachment],
+    max_attachment_bytes: int,
+    max_encoded_bytes: int,
+) -> str:
+    """
+    Escribir en `out` un multipart/mixed con el texto y los adjuntos.
+    Devuelve el Message-Id. Lanza AttachmentTooLarge si un adjunto supera
+    `max_attachment_bytes` (tamaño original) o el mensaje `max_encoded_bytes`
+    (tamaño codificado, cabeceras incluidas).
+    """
+    out = _CountingWriter(out, max_encoded_bytes)
+    message_id = make_msgid()
+    text = EmailMessage(policy=policy.SMTP)
+    text.set_content(body or "")
+
+    if not attachments:
+        text["From"] = from_addr
+        text["To"] = ", ".join(to_addrs)
+        text["Subject"] = subject
+        text["Message-Id"] = message_id
+        out.write(text.as_bytes())
+        return message_id
+
+    boundary = "=_" + make_msgid(domain="boundary")[1:-1].replace("@", "_")
+    root = MIMEPart(policy=policy.SMTP)
+    root["From"] = from_addr
+    root["To"] = ", ".join(to_addrs)
+    root["Subject"] = subject
+    root["Message-Id"] = message_id
+    root["MIME-Version"] = "1.0"
+    root["Content-Type"] = f'multipart/mixed; boundary="{boundary}"'
+    out.write(_headers_bytes(root))
+
+    delimiter = b"--" + boundary.encode("ascii")
+    del text["MIME-Version"]
+    out.write(delimiter + CRLF)
+    out.write(text.as_bytes())
+
+    for att in attachments:
+        part = MIMEPart(policy=policy.SMTP)
+        maintype, _, subtype = att.content_type.partition("/")
+        part["Content-Type"] = f"{maintype}/{subtype or 'octet-stream'}"
+        part.add_header("Content-Disposition", "attachment", filename=att.filename)
+        part["Content-Transfer-Encoding"] = "base64"
+        out.write(CRLF + delimiter + CRLF)
+        out.write(_headers_bytes(part))
+
+        size = 0
+        carry = b""
+        while True:
+            chunk = att.fileobj.read(READ_CHUNK)
+            if not chunk:
+                break
+            size += len(chunk)
+            if size > max_attachment_bytes:
+                raise AttachmentTooLarge(f"Attachment '{att.filename}' exceeds {max_attachment_bytes} bytes")
+            data = carry + chunk
+            cut = len(data) - len(data) % B64_LINE_INPUT
+            for i in range(0, cut, B64_LINE_INPUT):
+                out.write(base64.b64encode(data[i:i + B64_LINE_INPUT]) + CRLF)
+            carry = data[cut:]
+        if carry:
+            out.write(base64.b64encode(carry) + CRLF)
+
+    out.write(CRLF + delimiter + b"--" + CRLF)
+    return message_id
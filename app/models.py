@@ -2,9 +2,9 @@
 Modelos Pydantic para validación de datos
 Basados en la estructura de las tablas de Supabase
 """
-from typing import Optional
+from typing import List, Literal, Optional
 from datetime import datetime, date
-from pydantic import BaseModel, EmailStr, Field
+from pydantic import BaseModel, ConfigDict, EmailStr, Field
 
 
 # ============ Companies Models ============
@@ -20,13 +20,17 @@ class CompanyBase(BaseModel):
     country: Optional[str] = None
     sector: Optional[str] = None
     lead_status: Optional[str] = "No contactada"
+    hubspot_id: Optional[str] = None
 
 
+# Altas y modificaciones rechazan columnas desconocidas (422) antes de llegar a PostgREST
 class CompanyCreate(CompanyBase):
-    pass
+    model_config = ConfigDict(extra="forbid")
 
 
 class CompanyUpdate(BaseModel):
+    model_config = ConfigDict(extra="forbid")
+
     name: Optional[str] = None
     contacto_principal: Optional[str] = None
     interacciones_hoy: Optional[int] = None
@@ -38,6 +42,7 @@ class CompanyUpdate(BaseModel):
     country: Optional[str] = None
     sector: Optional[str] = None
     lead_status: Optional[str] = None
+    hubspot_id: Optional[str] = None
 
 
 class Company(CompanyBase):
@@ -63,13 +68,16 @@ class ContactBase(BaseModel):
     last_name: Optional[str] = None
     country: Optional[str] = None
     role: Optional[str] = None
+    hubspot_id: Optional[str] = None
 
 
 class ContactCreate(ContactBase):
-    pass
+    model_config = ConfigDict(extra="forbid")
 
 
 class ContactUpdate(BaseModel):
+    model_config = ConfigDict(extra="forbid")
+
     company_id: Optional[int] = None
     nombre: Optional[str] = None
     cargo: Optional[str] = None
@@ -83,6 +91,7 @@ class ContactUpdate(BaseModel):
     last_name: Optional[str] = None
     country: Optional[str] = None
     role: Optional[str] = None
+    hubspot_id: Optional[str] = None
 
 
 class Contact(ContactBase):
@@ -106,10 +115,12 @@ class CallBase(BaseModel):
 
 
 class CallCreate(CallBase):
-    pass
+    model_config = ConfigDict(extra="forbid")
 
 
 class CallUpdate(BaseModel):
+    model_config = ConfigDict(extra="forbid")
+
     contact_id: Optional[int] = None
     company_id: Optional[int] = None
     duracion: Optional[int] = None
@@ -165,6 +176,18 @@ class ParseRequest(BaseModel):
     type: Optional[str] = "contacts"
 
 
+class BatchParseItem(BaseModel):
+    id: str
+    type: Optional[str] = "contacts"
+    text: str
+
+
+class BatchParseRequest(BaseModel):
+    items: List[BatchParseItem]
+    stream: bool = False
+    usage: bool = False
+
+
 class ParseResponse(BaseModel):
     ok: bool
     parsed: Optional[dict] = None
@@ -180,3 +203,31 @@ class EmailSendRequest(BaseModel):
     plantilla: Optional[str] = None
     body: Optional[str] = ""
     responsable: Optional[str] = None
+
+
+class BulkRecipient(BaseModel):
+    email: str
+    nombre: Optional[str] = None
+    company_id: Optional[int] = None
+    vars: Optional[dict] = None
+
+
+class BulkEmailRequest(BaseModel):
+    asunto: str
+    body: Optional[str] = None
+    plantilla: Optional[str] = None
+    responsable: Optional[str] = None
+    recipients: Optional[List[BulkRecipient]] = None
+    filter: Optional[dict] = None
+
+
+# ============ HubSpot Import Models ============
+class HubSpotImportRequest(BaseModel):
+    objects: List[Literal["companies", "contacts"]] = ["companies", "contacts"]
+
+
+# ============ Snapshot Models ============
+class SnapshotRunRequest(BaseModel):
+    tables: List[Literal["companies", "contacts", "calls", "emails"]] = ["companies", "contacts", "calls", "emails"]
+    full: bool = False
+    partition: Optional[Literal["month", "none"]] = None
@@ -0,0 +1,349 @@
+"""
+Outbox persistente de emails con workers de entrega en segundo plano.
+Cada mensaje se registra en la tabla `emails` como `pendiente` y se guarda
+en disco (con sus adjuntos) antes de responder; los workers lo entregan con
+reintentos y backoff exponencial y actualizan `estado` a `enviado` o `fallido`.
+Si solo algunos destinatarios lo rechazan para siempre queda `enviado` y el
+detalle (entregados y rechazados con su código) en `failed/<id>.json`, que
+devuelve `delivery_report`.
+"""
+import asyncio
+import json
+import os
+import random
+import smtplib
+import time
+import uuid
+from datetime import datetime, timezone
+from email import policy
+from email.message import EmailMessage
+from typing import Any, BinaryIO, Callable, Dict, List, Optional, Tuple
+
+from app import database, events
+from app.config import (
+    OUTBOX_DIR,
+    OUTBOX_MAX_ATTEMPTS,
+    OUTBOX_RETRY_BASE,
+    OUTBOX_RETRY_MAX,
+    OUTBOX_WORKERS,
+)
+from app.registry import registry
+from app.resilience import UpstreamUnavailable
+
+ESTADO_PENDIENTE = "pendiente"
+ESTADO_ENVIADO = "enviado"
+ESTADO_FALLIDO = "fallido"
+
+
+def _now_iso() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+def is_permanent(error: Exception) -> bool:
+    """
+    Errores 5xx, o destinatarios rechazados todos con 5xx: reintentar no sirve.
+    Un rechazo 4xx (greylisting 450/451, buzón lleno temporal) sí se reintenta.
+    """
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        return bool(error.recipients) and all(code >= 500 for code, _ in error.recipients.values())
+    code = getattr(error, "smtp_code", None)
+    return isinstance(code, int) and code >= 500
+
+
+def _reason(code: int, message) -> str:
+    if isinstance(message, bytes):
+        message = message.decode("utf-8", "replace")
+    return f"{code} {message}"
+
+
+class EmailOutbox:
+    def __init__(self, directory: str, workers: int, max_attempts: int,
+                 retry_base: float, retry_max: float):
+        self.directory = directory
+        self.failed_directory = os.path.join(directory, "failed")
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.retry_base = retry_base
+        self.retry_max = retry_max
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+        self._queued = set()
+
+    # ---- Spool en disco ----
+    def _paths(self, email_id) -> tuple:
+        base = os.path.join(self.directory, str(email_id))
+        return base + ".eml", base + ".json"
+
+    @staticmethod
+    def _write_atomic(path: str, data: bytes) -> None:
+        tmp = path + ".tmp"
+        with open(tmp, "wb") as fh:
+            fh.write(data)
+            fh.flush()
+            os.fsync(fh.fileno())
+        os.replace(tmp, path)
+
+    def _load_meta(self, email_id) -> Optional[dict]:
+        _, meta_path = self._paths(email_id)
+        try:
+            with open(meta_path, "r", encoding="utf-8") as fh:
+                return json.load(fh)
+        except FileNotFoundError:
+            return None
+
+    def _save_meta(self, email_id, meta: dict) -> None:
+        _, meta_path = self._paths(email_id)
+        self._write_atomic(meta_path, json.dumps(meta).encode("utf-8"))
+
+    def _write_part(self, writer: Callable[[BinaryIO], Any]) -> tuple:
+        """Escribir el mensaje en un archivo temporal del spool; devuelve (ruta, resultado)"""
+        os.makedirs(self.directory, exist_ok=True)
+        tmp_path = os.path.join(self.directory, f"{uuid.uuid4().hex}.part")
+        try:
+            with open(tmp_path, "wb") as fh:
+                result = writer(fh)
+                fh.flush()
+                os.fsync(fh.fileno())
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        return tmp_path, result
+
+    def _commit_part(self, email_id, tmp_path: str, meta: dict) -> None:
+        eml_path, _ = self._paths(email_id)
+        # Primero la metadata: al arrancar se reencola a partir de los .eml
+        self._save_meta(email_id, meta)
+        os.replace(tmp_path, eml_path)
+
+    def _discard(self, email_id, failed: bool = False) -> None:
+        for path in self._paths(email_id):
+            if not os.path.exists(path):
+                continue
+            if failed:
+                os.makedirs(self.failed_directory, exist_ok=True)
+                os.replace(path, os.path.join(self.failed_directory, os.path.basename(path)))
+            else:
+                os.remove(path)
+
+    # ---- API ----
+    async def enqueue(self, db, msg: EmailMessage, recipients: List[str], row: dict,
+                      failure: Optional[Exception] = None) -> dict:
+        """
+        Encolar un EmailMessage ya construido en memoria. Con `failure` (un
+        primer intento ya fallido fuera del outbox) cuenta como intento y el
+        siguiente espera el backoff.
+        """
+        return await self.enqueue_stream(
+            db, str(msg["From"]), recipients, row,
+            lambda fh: fh.write(msg.as_bytes(policy=policy.SMTP)),
+            failure,
+        )
+
+    async def enqueue_stream(self, db, from_addr: str, recipients: List[str], row: dict,
+                             writer: Callable[[BinaryIO], Any],
+                             failure: Optional[Exception] = None) -> dict:
+        """
+        Escribir el mensaje al spool con `writer` (en un hilo), registrarlo en
+        `emails` como pendiente y encolarlo. Si `writer` falla, no se registra nada.
+        Devuelve la fila insertada.
+        """
+        tmp_path, _ = await asyncio.to_thread(self._write_part, writer)
+        try:
+            row = {**row, "estado": ESTADO_PENDIENTE, "fecha_hora": _now_iso()}
+            resp = await asyncio.to_thread(lambda: db.table("emails").insert(row).execute())
+            data = getattr(resp, "data", None) or []
+            if not data or data[0].get("id") is None:
+                raise RuntimeError("Could not register email in outbox")
+            inserted = data[0]
+            meta = {
+                "from": from_addr,
+                "to": recipients,
+                "attempts": 1 if failure else 0,
+                "next_attempt": time.time() + (self._backoff(1) if failure else 0),
+                "last_error": str(failure) if failure else None,
+            }
+            try:
+                await asyncio.to_thread(self._commit_part, inserted["id"], tmp_path, meta)
+            except BaseException:
+                # Sin spool nadie lo entregaría: no dejar la fila `pendiente` huérfana
+                await self._delete_row(db, inserted["id"])
+                raise
+            events.publish("emails", events.CREATED, inserted)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        self._put(inserted["id"])
+        return inserted
+
+    @staticmethod
+    async def _delete_row(db, email_id) -> None:
+        try:
+            await asyncio.to_thread(lambda: db.table("emails").delete().eq("id", email_id).execute())
+        except Exception as e:
+            print(f"[WARN] Could not delete orphaned email {email_id}: {e}")
+
+    def delivery_report(self, email_id) -> Optional[dict]:
+        """Destinatarios entregados y rechazados de un email con rechazos; None si no los hubo"""
+        path = os.path.join(self.failed_directory, f"{email_id}.json")
+        try:
+            with open(path, "r", encoding="utf-8") as fh:
+                meta = json.load(fh)
+        except (FileNotFoundError, ValueError):
+            return None
+        if "refused" not in meta:
+            return None
+        return {"delivered": meta.get("delivered", []), "refused": meta["refused"]}
+
+    def _put(self, email_id) -> None:
+        email_id = str(email_id)
+        if self._queue is not None and email_id not in self._queued:
+            self._queued.add(email_id)
+            self._queue.put_nowait(email_id)
+
+    async def start(self) -> None:
+        """Iniciar los workers y reencolar lo que haya quedado en disco"""
+        if self._tasks:
+            return
+        self._queue = asyncio.Queue()
+        if os.path.isdir(self.directory):
+            for name in sorted(os.listdir(self.directory)):
+                if name.endswith(".eml"):
+                    self._put(name[:-4])
+                elif name.endswith(".part"):
+                    os.remove(os.path.join(self.directory, name))
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._queue = None
+        self._queued.clear()
+
+    def pending(self) -> int:
+        return self._queue.qsize() if self._queue is not None else 0
+
+    # ---- Entrega ----
+    async def _worker(self) -> None:
+        while True:
+            email_id = await self._queue.get()
+            self._queued.discard(email_id)
+            try:
+                await self._deliver(email_id)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"[WARN] Outbox worker error for email {email_id}: {e}")
+            finally:
+                self._queue.task_done()
+
+    async def _set_estado(self, email_id, estado: str) -> None:
+        db = database.get_client()
+        if not db:
+            return
+        try:
+            resp = await asyncio.to_thread(
+                lambda: db.table("emails")
+                .update({"estado": estado, "fecha_hora": _now_iso()})
+                .eq("id", int(email_id))
+                .execute()
+            )
+            events.publish("emails", events.UPDATED, getattr(resp, "data", None))
+        except Exception as e:
+            print(f"[WARN] Could not update estado of email {email_id}: {e}")
+
+    def _backoff(self, attempts: int) -> float:
+        delay = min(self.retry_base * (2 ** (attempts - 1)), self.retry_max)
+        return delay * random.uniform(0.8, 1.2)
+
+    def _retry_later(self, email_id, delay: float) -> None:
+        asyncio.get_running_loop().call_later(delay, self._put, email_id)
+
+    async def _deliver(self, email_id) -> None:
+        meta = await asyncio.to_thread(self._load_meta, email_id)
+        if meta is None:
+            return
+        wait = meta.get("next_attempt", 0) - time.time()
+        if wait > 0:
+            self._retry_later(email_id, wait)
+            return
+
+        eml_path, _ = self._paths(email_id)
+        try:
+            refused = await registry.get("smtp").send_file(meta["from"], meta["to"], eml_path)
+        except smtplib.SMTPRecipientsRefused as e:
+            # Ningún destinatario aceptado: mismo tratamiento que un rechazo parcial
+            refused = e.recipients
+        except UpstreamUnavailable as e:
+            # Circuito SMTP abierto: no se llegó a intentar, no cuenta como intento
+            self._retry_later(email_id, max(e.retry_after, 1.0))
+            return
+        except Exception as e:
+            meta["attempts"] += 1
+            meta["last_error"] = str(e)
+            if is_permanent(e) or meta["attempts"] >= self.max_attempts:
+                await asyncio.to_thread(self._save_meta, email_id, meta)
+                await asyncio.to_thread(self._discard, email_id, True)
+                await self._set_estado(email_id, ESTADO_FALLIDO)
+                return
+            delay = self._backoff(meta["attempts"])
+            meta["next_attempt"] = time.time() + delay
+            await asyncio.to_thread(self._save_meta, email_id, meta)
+            self._retry_later(email_id, delay)
+            return
+
+        if refused:
+            await self._refused(email_id, meta, refused)
+            return
+        await asyncio.to_thread(self._discard, email_id)
+        await self._set_estado(email_id, ESTADO_ENVIADO)
+
+    async def _refused(self, email_id, meta: dict, refused: Dict[str, Tuple[int, Any]]) -> None:
+        """
+        Algunos (o todos los) destinatarios rechazados. Los 4xx se reintentan
+        solo a ellos con backoff; los 5xx se anotan en `meta["refused"]`. Al
+        terminar, `enviado` si alguien lo recibió y `fallido` si nadie; el
+        detalle queda en el spool de fallidos (`delivery_report`).
+        """
+        meta.setdefault("refused", {})
+        accepted = [addr for addr in meta["to"] if addr not in refused]
+        meta["delivered"] = meta.get("delivered", []) + accepted
+        temporary = [addr for addr, (code, _) in refused.items() if code < 500]
+        for addr, (code, message) in refused.items():
+            if code >= 500:
+                meta["refused"][addr] = _reason(code, message)
+        meta["last_error"] = "; ".join(f"{addr}: {_reason(*refused[addr])}" for addr in refused)
+        if temporary:
+            meta["attempts"] += 1
+            if meta["attempts"] < self.max_attempts:
+                delay = self._backoff(meta["attempts"])
+                meta["to"] = temporary
+                meta["next_attempt"] = time.time() + delay
+                await asyncio.to_thread(self._save_meta, email_id, meta)
+                self._retry_later(email_id, delay)
+                return
+            for addr in temporary:
+                meta["refused"][addr] = _reason(*refused[addr])
+        print(f"[WARN] Email {email_id} refused for {', '.join(sorted(meta['refused']))}")
+        await asyncio.to_thread(self._save_meta, email_id, meta)
+        await asyncio.to_thread(self._discard, email_id, True)
+        await self._set_estado(email_id, ESTADO_ENVIADO if meta["delivered"] else ESTADO_FALLIDO)
+
+
+_outbox: Optional[EmailOutbox] = None
+
+
+def get_outbox() -> EmailOutbox:
+    global _outbox
+    if _outbox is None:
+        _outbox = EmailOutbox(
+            OUTBOX_DIR,
+            workers=OUTBOX_WORKERS,
+            max_attempts=OUTBOX_MAX_ATTEMPTS,
+            retry_base=OUTBOX_RETRY_BASE,
+            retry_max=OUTBOX_RETRY_MAX,
+        )
+    return _outbox
@@ -0,0 +1,67 @@
+"""
+Profiler por muestreo basado en la biblioteca estándar.
+Un hilo toma periódicamente las pilas de los demás hilos y las acumula en
+formato "collapsed" (una línea `marco;marco;marco cuenta`), listo para
+flamegraph.pl, speedscope o inferno.
+"""
+import sys
+import threading
+from collections import Counter
+from typing import Optional
+
+# Hojas de hilos ociosos (event loop sin trabajo, workers sin tareas)
+IDLE_LEAVES = {"selectors:select", "threading:wait", "concurrent.futures.thread:_worker"}
+MAX_DEPTH = 128
+
+
+def _frame_label(frame) -> str:
+    return f"{frame.f_globals.get('__name__', '?')}:{frame.f_code.co_name}"
+
+
+class SamplingProfiler:
+    """
+    Muestrea cada `interval` segundos mientras está activo. Se muestrean todos
+    los hilos (event loop y threadpool), así que bajo carga también aparecen
+    otras peticiones concurrentes.
+    """
+
+    def __init__(self, interval: float = 0.005):
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _sample(self) -> None:
+        own = threading.get_ident()
+        names = {t.ident: t.name for t in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            if ident == own or _frame_label(frame) in IDLE_LEAVES:
+                continue
+            labels = []
+            while frame is not None and len(labels) < MAX_DEPTH:
+                labels.append(_frame_label(frame))
+                frame = frame.f_back
+            labels.append(names.get(ident, str(ident)))
+            self.stacks[";".join(reversed(labels))] += 1
+        self.samples += 1
+
+    def _run(self) -> None:
+        # Primera muestra inmediata para no perder peticiones muy cortas
+        self._sample()
+        while not self._stop.wait(self.interval):
+            self._sample()
+
+    def start(self) -> "SamplingProfiler":
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def collapsed(self) -> str:
+        """Pilas en formato collapsed, de la más a la menos frecuente"""
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
@@ -0,0 +1,126 @@
+"""
+Registro de clientes externos (Supabase, HubSpot, Gemini, SMTP) con
+inicialización perezosa. Cada cliente se crea una sola vez, en su primer uso
+o durante el calentamiento que lanza el lifespan; los imports pesados
+(supabase, httpx, requests, smtplib) viven dentro de las fábricas.
+"""
+import asyncio
+import inspect
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+_MISSING = object()
+
+
+class ClientRegistry:
+    def __init__(self):
+        self._factories: Dict[str, Callable[[], Any]] = {}
+        self._warmers: Dict[str, Callable[[Any], Any]] = {}
+        self._closers: Dict[str, Callable[[Any], Any]] = {}
+        self._instances: Dict[str, Any] = {}
+        self._locks: Dict[str, threading.Lock] = {}
+        self.warmup_report: Dict[str, dict] = {}
+
+    def register(self, name: str, factory: Callable[[], Any],
+                 warm: Optional[Callable[[Any], Any]] = None,
+                 close: Optional[Callable[[Any], Any]] = None) -> None:
+        self._factories[name] = factory
+        self._locks[name] = threading.Lock()
+        if warm is not None:
+            self._warmers[name] = warm
+        if close is not None:
+            self._closers[name] = close
+
+    def names(self) -> List[str]:
+        return list(self._factories)
+
+    def get(self, name: str) -> Any:
+        """Instancia de `name`, creándola si hace falta. Si la fábrica falla no se guarda nada."""
+        instance = self._instances.get(name, _MISSING)
+        if instance is not _MISSING:
+            return instance
+        with self._locks[name]:
+            instance = self._instances.get(name, _MISSING)
+            if instance is _MISSING:
+                instance = self._factories[name]()
+                self._instances[name] = instance
+        return instance
+
+    def peek(self, name: str) -> Any:
+        """Instancia ya creada o None, sin crearla"""
+        instance = self._instances.get(name, _MISSING)
+        return None if instance is _MISSING else instance
+
+    def _warm(self, name: str) -> None:
+        instance = self.get(name)
+        warmer = self._warmers.get(name)
+        if instance is not None and warmer is not None:
+            warmer(instance)
+
+    async def warm_up(self, names: Optional[Iterable[str]] = None) -> Dict[str, dict]:
+        """Crear y calentar los clientes en paralelo (en hilos); los errores solo se registran"""
+        names = [n for n in (names if names is not None else self.names()) if n in self._factories]
+
+        async def warm(name: str):
+            started = time.perf_counter()
+            try:
+                await asyncio.to_thread(self._warm, name)
+                result = {"ok": True}
+            except Exception as e:
+                print(f"[WARN] Warm-up of {name} failed: {e}")
+                result = {"ok": False, "error": str(e)}
+            result["ms"] = round((time.perf_counter() - started) * 1000, 1)
+            self.warmup_report[name] = result
+
+        await asyncio.gather(*(warm(n) for n in names))
+        return self.warmup_report
+
+    async def close(self) -> None:
+        """Cerrar los clientes creados; el siguiente `get` los vuelve a crear"""
+        for name in list(self._instances):
+            instance = self._instances.pop(name)
+            closer = self._closers.get(name)
+            if instance is None or closer is None:
+                continue
+            try:
+                result = closer(instance)
+                if inspect.isawaitable(result):
+                    await result
+            except Exception as e:
+                print(f"[WARN] Could not close {name}: {e}")
+
+
+registry = ClientRegistry()
+
+
+# ---- Fábricas (imports diferidos) ----
+def _create_supabase():
+    from app.database import create_supabase_client
+    return create_supabase_client()
+
+
+def _create_hubspot():
+    from app.hubspot_api import create_hubspot_session
+    return create_hubspot_session()
+
+
+def _create_gemini():
+    import httpx
+    from app.config import GEMINI_TIMEOUT
+    from app.http_instrumentation import AsyncInstrumentedTransport, gemini_operation
+    return httpx.AsyncClient(
+        timeout=httpx.Timeout(GEMINI_TIMEOUT, connect=5.0),
+        transport=AsyncInstrumentedTransport("gemini", gemini_operation),
+    )
+
+
+def _create_smtp():
+    from app.smtp_pool import create_smtp_pool
+    return create_smtp_pool()
+
+
+registry.register("supabase", _create_supabase)
+registry.register("hubspot", _create_hubspot, close=lambda session: session.close())
+registry.register("gemini", _create_gemini, close=lambda client: client.aclose())
+registry.register("smtp", _create_smtp, warm=lambda pool: pool.prewarm(), close=lambda pool: pool.close())
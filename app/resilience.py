@@ -0,0 +1,252 @@
+"""
+Circuit breakers y bulkheads por servicio externo.
+Cuando un upstream falla de forma repetida el circuito se abre y las llamadas
+fallan de inmediato (503) en lugar de esperar el timeout; pasado
+`reset_timeout` se deja pasar una llamada de prueba (half-open). Cada upstream
+tiene además su propio límite de llamadas concurrentes, para que una caída de
+HubSpot o Gemini no acapare la capacidad que necesitan las demás rutas.
+"""
+import asyncio
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager, nullcontext
+from typing import Dict, Optional
+
+from app import metrics
+from app.config import (
+    BREAKER_FAILURE_THRESHOLD,
+    BREAKER_RESET_TIMEOUT,
+    BULKHEAD_LIMITS,
+    BULKHEAD_MAX_WAIT,
+)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+UPSTREAMS = ("supabase", "hubspot", "gemini", "smtp")
+
+CIRCUIT_STATE = metrics.gauge(
+    "upstream_circuit_state", "Circuit breaker state (0 closed, 1 half-open, 2 open)", ("upstream",)
+)
+REJECTIONS = metrics.counter(
+    "upstream_rejections_total", "Calls rejected without reaching the upstream", ("upstream", "reason")
+)
+
+
+class UpstreamUnavailable(Exception):
+    """El upstream no se llama: circuito abierto o sin capacidad en su bulkhead"""
+
+    def __init__(self, upstream: str, reason: str, retry_after: float = 1.0):
+        super().__init__(f"{upstream} unavailable ({reason})")
+        self.upstream = upstream
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+def is_failure_status(status: Optional[int]) -> bool:
+    """5xx y 429 cuentan como fallos del upstream; 4xx no"""
+    return status is not None and (status >= 500 or status == 429)
+
+
+class CircuitBreaker:
+    def __init__(self, name: str, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+        CIRCUIT_STATE.set(0, upstream=name)
+
+    def _set_state(self, state: str) -> None:
+        if state != self.state:
+            print(f"[WARN] Circuit {self.name}: {self.state} -> {state}")
+        self.state = state
+        CIRCUIT_STATE.set(STATE_VALUES[state], upstream=self.name)
+
+    def retry_after(self) -> float:
+        return max(self.opened_at + self.reset_timeout - time.monotonic(), 0.0)
+
+    def before_call(self) -> None:
+        """Lanza UpstreamUnavailable si el circuito no admite la llamada"""
+        with self._lock:
+            if self.state == OPEN:
+                if self.retry_after() > 0:
+                    raise UpstreamUnavailable(self.name, "circuit_open", self.retry_after())
+                self._set_state(HALF_OPEN)
+            if self.state == HALF_OPEN:
+                # Una sola llamada de prueba a la vez
+                if self._probing:
+                    raise UpstreamUnavailable(self.name, "circuit_half_open", 1.0)
+                self._probing = True
+
+    def release(self) -> None:
+        """La llamada no llegó al upstream: liberar la prueba sin contar resultado"""
+        with self._lock:
+            self._probing = False
+
+    def record(self, ok: bool) -> None:
+        with self._lock:
+            self._probing = False
+            if ok:
+                self.failures = 0
+                self._set_state(CLOSED)
+                return
+            self.failures += 1
+            if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+                self._set_state(OPEN)
+
+    def snapshot(self) -> dict:
+        return {
+            "state": self.state,
+            "failures": self.failures,
+            "retry_after": round(self.retry_after(), 1) if self.state == OPEN else 0,
+        }
+
+
+class Bulkhead:
+    """Límite de llamadas concurrentes; espera hasta `max_wait` segundos por un turno"""
+
+    def __init__(self, name: str, limit: int, max_wait: float = 2.0):
+        self.name = name
+        self.limit = limit
+        self.max_wait = max_wait
+        self.in_flight = 0
+        self._slots = threading.BoundedSemaphore(limit)
+        self._async_slots: Optional[asyncio.Semaphore] = None
+        self._count_lock = threading.Lock()
+
+    def _count(self, delta: int) -> None:
+        with self._count_lock:
+            self.in_flight += delta
+
+    @contextmanager
+    def slot(self):
+        if not self._slots.acquire(timeout=self.max_wait):
+            raise UpstreamUnavailable(self.name, "bulkhead_full", 1.0)
+        self._count(1)
+        try:
+            yield
+        finally:
+            self._count(-1)
+            self._slots.release()
+
+    @asynccontextmanager
+    async def async_slot(self):
+        if self._async_slots is None:
+            self._async_slots = asyncio.Semaphore(self.limit)
+        acquire = asyncio.ensure_future(self._async_slots.acquire())
+        try:
+            await asyncio.wait_for(asyncio.shield(acquire), self.max_wait)
+        except BaseException as e:
+            # Sin turno o cancelada mientras esperaba: si el turno se concedió
+            # justo entonces, devolverlo para no perder capacidad
+            if not acquire.cancel() and not acquire.cancelled():
+                self._async_slots.release()
+            if isinstance(e, asyncio.TimeoutError):
+                raise UpstreamUnavailable(self.name, "bulkhead_full", 1.0)
+            raise
+        self._count(1)
+        try:
+            yield
+        finally:
+            self._count(-1)
+            self._async_slots.release()
+
+
+class Attempt:
+    """Resultado de una llamada: asignar `status` con el código HTTP si lo hay"""
+
+    def __init__(self):
+        self.status: Optional[int] = None
+
+
+class Dependency:
+    """Breaker + bulkhead de un upstream; sin `limit` solo se aplica el breaker"""
+
+    def __init__(self, name: str, limit: Optional[int]):
+        self.name = name
+        self.breaker = CircuitBreaker(name, BREAKER_FAILURE_THRESHOLD, BREAKER_RESET_TIMEOUT)
+        self.bulkhead = Bulkhead(name, limit, BULKHEAD_MAX_WAIT) if limit else None
+
+    def _admit(self) -> None:
+        try:
+            self.breaker.before_call()
+        except UpstreamUnavailable as e:
+            REJECTIONS.inc(upstream=self.name, reason=e.reason)
+            raise
+
+    def _rejected(self, error: UpstreamUnavailable) -> None:
+        # No se llegó a llamar al upstream: no cuenta como éxito ni como fallo
+        self.breaker.release()
+        REJECTIONS.inc(upstream=self.name, reason=error.reason)
+
+    @contextmanager
+    def call(self):
+        """Proteger una llamada síncrona (hilos)"""
+        self._admit()
+        attempt = Attempt()
+        try:
+            with self.bulkhead.slot() if self.bulkhead else nullcontext():
+                yield attempt
+        except UpstreamUnavailable as e:
+            self._rejected(e)
+            raise
+        except Exception:
+            self.breaker.record(False)
+            raise
+        except BaseException:
+            # Cancelada (desconexión, timeout) sin resultado: liberar la prueba
+            # del half-open sin contarla como éxito ni como fallo
+            self.breaker.release()
+            raise
+        self.breaker.record(not is_failure_status(attempt.status))
+
+    @asynccontextmanager
+    async def acall(self):
+        """Proteger una llamada asíncrona"""
+        self._admit()
+        attempt = Attempt()
+        try:
+            async with self.bulkhead.async_slot() if self.bulkhead else nullcontext():
+                yield attempt
+        except UpstreamUnavailable as e:
+            self._rejected(e)
+            raise
+        except Exception:
+            self.breaker.record(False)
+            raise
+        except BaseException:
+            # Cancelada (desconexión, timeout) sin resultado: liberar la prueba
+            # del half-open sin contarla como éxito ni como fallo
+            self.breaker.release()
+            raise
+        self.breaker.record(not is_failure_status(attempt.status))
+
+    def snapshot(self) -> dict:
+        snapshot = self.breaker.snapshot()
+        if self.bulkhead:
+            snapshot.update(in_flight=self.bulkhead.in_flight, limit=self.bulkhead.limit)
+        return snapshot
+
+
+_dependencies: Dict[str, Dependency] = {}
+_lock = threading.Lock()
+
+
+def dependency(name: str) -> Dependency:
+    with _lock:
+        dep = _dependencies.get(name)
+        if dep is None:
+            dep = _dependencies[name] = Dependency(name, BULKHEAD_LIMITS.get(name))
+        return dep
+
+
+def upstream_health() -> Dict[str, dict]:
+    """Estado de cada upstream conocido (para /health)"""
+    return {name: dependency(name).snapshot() for name in UPSTREAMS}
@@ -3,7 +3,7 @@ Archivo de inicialización para el módulo de rutas
 """
 from fastapi import APIRouter
 
-from app.routes import companies, contacts, calls, emails, gemini
+from app.routes import companies, contacts, calls, emails, events, gemini, hubspot, snapshots
 
 # Crear router principal que agrupa todas las rutas
 api_router = APIRouter()
@@ -13,4 +13,7 @@ api_router.include_router(companies.router)
 api_router.include_router(contacts.router)
 api_router.include_router(calls.router)
 api_router.include_router(emails.router)
+api_router.include_router(events.router)
 api_router.include_router(gemini.router)
+api_router.include_router(hubspot.router)
+api_router.include_router(snapshots.router)
@@ -0,0 +1,334 @@
+"""
+Fábrica de routers CRUD tipados para las tablas de Supabase.
+`crud_router` genera listado, detalle, alta, modificación y baja, sus
+variantes en lote (`/bulk`) y la exportación (`/export`) a partir de la
+tabla y sus modelos Pydantic. El cuerpo se valida con `TypeAdapter`
+directamente sobre los bytes recibidos, así que una fila inválida se
+rechaza con 422 sin gastar un viaje a PostgREST. Paginación, proyección
+(`select`), orden y caché se implementan una sola vez aquí.
+"""
+import csv
+import io
+from typing import Annotated, Any, Dict, List, Optional, Type, Union
+
+from fastapi import APIRouter, Depends, HTTPException, Path, Query, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.exceptions import RequestValidationError
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, ConfigDict, Field, TypeAdapter, ValidationError, create_model
+
+from app import events
+from app.cache import TTLCache
+from app.config import CRUD_BULK_CHUNK_SIZE, CRUD_BULK_MAX_ROWS, CRUD_CACHE_TTL, CRUD_EXPORT_PAGE_SIZE
+from app.database import Client, get_supabase
+from app.serialization import FastJSONResponse, PrecomputedJSON, dumps
+from app.timing import TimedRoute
+
+# Columnas que rellena la base de datos (no están en los modelos de alta)
+SERVER_COLUMNS = ("id", "created_at", "updated_at")
+# Parámetros del listado que no son filtros por columna
+RESERVED_PARAMS = {"limit", "offset", "select", "order", "format"}
+EXPORT_FORMATS = {"ndjson": "application/x-ndjson", "csv": "text/csv; charset=utf-8"}
+
+# Respuestas de listado/detalle ya codificadas: {(tabla, versión, url): PrecomputedJSON}.
+# La versión (`events.version`) cambia con cada evento publicado de la tabla,
+# venga de estas rutas, del outbox, de `/parse?commit=true` o de una importación
+_respuestas = TTLCache(ttl=CRUD_CACHE_TTL, max_entries=500 if CRUD_CACHE_TTL > 0 else 0)
+
+
+def _chunks(items: List[Any], size: int):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def _coerce(value: str) -> Any:
+    """Número si lo parece (los filtros llegan como texto)"""
+    try:
+        if value:
+            return float(value) if "." in value else int(value)
+    except ValueError:
+        pass
+    return value
+
+
+def _validate(adapter: TypeAdapter, body: bytes) -> Any:
+    """Validar el JSON crudo; los errores se devuelven como 422 con `loc` en `body`"""
+    try:
+        return adapter.validate_json(body)
+    except ValidationError as e:
+        errors = [{**err, "loc": ("body", *err["loc"])} for err in e.errors(include_url=False)]
+        raise RequestValidationError(errors, body=body)
+
+
+def _inline_refs(schema: Any, defs: Dict[str, Any]) -> Any:
+    if isinstance(schema, dict):
+        ref = schema.get("$ref")
+        if ref:
+            return _inline_refs(defs[ref.rsplit("/", 1)[-1]], defs)
+        return {k: _inline_refs(v, defs) for k, v in schema.items()}
+    if isinstance(schema, list):
+        return [_inline_refs(v, defs) for v in schema]
+    return schema
+
+
+def _body_docs(adapter: TypeAdapter) -> dict:
+    """Esquema del cuerpo para OpenAPI (el cuerpo se lee crudo, FastAPI no lo ve)"""
+    schema = adapter.json_schema()
+    defs = schema.pop("$defs", {})
+    return {"requestBody": {"required": True, "content": {
+        "application/json": {"schema": _inline_refs(schema, defs)},
+    }}}
+
+
+async def _execute(build) -> List[dict]:
+    """Ejecutar una consulta de PostgREST en un hilo; cualquier fallo es un 500"""
+    try:
+        resp = await run_in_threadpool(lambda: build().execute())
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    return getattr(resp, "data", None) or []
+
+
+def crud_router(
+    table: str,
+    create: Type[BaseModel],
+    update: Type[BaseModel],
+    id_param: str,
+    name: str,
+) -> APIRouter:
+    """
+    Router con prefijo `/{table}` para una tabla con clave `id` entera.
+    `id_param` es el nombre del parámetro de ruta (p. ej. `company_id`) y
+    `name` el nombre de la entidad en los errores ("Company not found").
+    """
+    router = APIRouter(prefix=f"/{table}", tags=[table], route_class=TimedRoute)
+    columns = tuple(dict.fromkeys((
+        "id", *create.model_fields, *update.model_fields, *SERVER_COLUMNS,
+    )))
+    known = set(columns)
+
+    one = TypeAdapter(create)
+    many = TypeAdapter(Annotated[List[create], Field(min_length=1, max_length=CRUD_BULK_MAX_ROWS)])
+    changes = TypeAdapter(update)
+    bulk_changes = TypeAdapter(create_model(
+        f"{update.__name__}Bulk",
+        __config__=ConfigDict(extra="forbid"),
+        ids=(Annotated[List[int], Field(min_length=1, max_length=CRUD_BULK_MAX_ROWS)], ...),
+        changes=(update, ...),
+    ))
+    item_path = "/{" + id_param + "}"
+
+    # ---- Consultas compartidas ----
+    def _projection(select: Optional[str]) -> str:
+        if not select:
+            return "*"
+        wanted = [c.strip() for c in select.split(",") if c.strip()]
+        unknown = [c for c in wanted if c not in known]
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"Unknown columns: {', '.join(unknown)}")
+        return ",".join(wanted) or "*"
+
+    def _filters(request: Request) -> List[tuple]:
+        filters = [(k, v) for k, v in request.query_params.multi_items() if k not in RESERVED_PARAMS]
+        unknown = sorted({k for k, _ in filters if k not in known})
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"Unknown columns: {', '.join(unknown)}")
+        return [(k, _coerce(v)) for k, v in filters]
+
+    def _select(db: Client, projection: str, filters: List[tuple], order: Optional[str]):
+        query = db.table(table).select(projection)
+        for column, value in filters:
+            query = query.eq(column, value)
+        if order:
+            column = order.lstrip("-")
+            if column not in known:
+                raise HTTPException(status_code=400, detail=f"Unknown columns: {column}")
+            query = query.order(column, desc=order.startswith("-"))
+        return query
+
+    def _changed(type_: str, rows: List[dict]) -> None:
+        events.publish(table, type_, rows)
+
+    async def _cached(request: Request, load) -> Any:
+        """Respuesta desde la caché si está activa (`CRUD_CACHE_TTL`)"""
+        accept_encoding = request.headers.get("accept-encoding", "")
+        if CRUD_CACHE_TTL <= 0:
+            return FastJSONResponse(await load())
+        key = (table, events.version(table), request.url.path, request.url.query)
+        cached = _respuestas.get(key)
+        if cached is None:
+            cached = PrecomputedJSON(await load())
+            _respuestas.set(key, cached)
+        return cached.response(accept_encoding)
+
+    async def _insert(db: Client, rows: List[BaseModel]) -> List[dict]:
+        payload = [row.model_dump(mode="json", exclude_unset=True) for row in rows]
+        created: List[dict] = []
+        try:
+            for chunk in _chunks(payload, CRUD_BULK_CHUNK_SIZE):
+                # Columnas omitidas en una fila toman el DEFAULT de la tabla, no NULL
+                created.extend(await _execute(lambda: db.table(table).insert(chunk, default_to_null=False)))
+        finally:
+            # Los bloques ya insertados se publican aunque falle uno posterior
+            _changed(events.CREATED, created)
+        return created
+
+    async def _update(db: Client, ids: List[int], values: BaseModel) -> List[dict]:
+        payload = values.model_dump(mode="json", exclude_unset=True)
+        if not payload:
+            raise HTTPException(status_code=400, detail="No fields to update")
+        updated: List[dict] = []
+        try:
+            for chunk in _chunks(ids, CRUD_BULK_CHUNK_SIZE):
+                updated.extend(await _execute(lambda: db.table(table).update(payload).in_("id", chunk)))
+        finally:
+            _changed(events.UPDATED, updated)
+        return updated
+
+    async def _delete(db: Client, ids: List[int]) -> List[dict]:
+        deleted: List[dict] = []
+        try:
+            for chunk in _chunks(ids, CRUD_BULK_CHUNK_SIZE):
+                deleted.extend(await _execute(lambda: db.table(table).delete().in_("id", chunk)))
+        finally:
+            _changed(events.DELETED, deleted)
+        return deleted
+
+    # ---- Listado y exportación ----
+    @router.get("")
+    async def list_rows(
+        request: Request,
+        limit: int = Query(100, ge=1, le=1000),
+        offset: int = Query(0, ge=0),
+        select: Optional[str] = Query(None, description="Comma-separated columns (default: all)"),
+        order: Optional[str] = Query(None, description="Column to sort by, `-column` for descending"),
+        db: Client = Depends(get_supabase),
+    ):
+        """Listar filas; los demás parámetros filtran por igualdad (`?country=Peru`)"""
+        projection, filters = _projection(select), _filters(request)
+
+        async def load():
+            query = _select(db, projection, filters, order)
+            return {"ok": True, "data": await _execute(lambda: query.range(offset, offset + limit - 1))}
+
+        return await _cached(request, load)
+
+    @router.get("/export")
+    async def export_rows(
+        request: Request,
+        format: str = Query("ndjson", pattern="^(ndjson|csv)$"),
+        select: Optional[str] = Query(None, description="Comma-separated columns (default: all)"),
+        db: Client = Depends(get_supabase),
+    ):
+        """
+        Todas las filas (con los mismos filtros que el listado) en NDJSON o CSV,
+        leídas por páginas de `CRUD_EXPORT_PAGE_SIZE` ordenadas por id (keyset)
+        y enviadas a medida que llegan.
+        """
+        projection, filters = _projection(select), _filters(request)
+        if projection != "*" and "id" not in projection.split(","):
+            projection = "id," + projection
+        header = list(columns) if projection == "*" else projection.split(",")
+
+        async def pages():
+            last_id = 0
+            while True:
+                query = _select(db, projection, filters, None).gt("id", last_id).order("id")
+                rows = await _execute(lambda: query.limit(CRUD_EXPORT_PAGE_SIZE))
+                if not rows:
+                    return
+                yield rows
+                if len(rows) < CRUD_EXPORT_PAGE_SIZE:
+                    return
+                last_id = rows[-1]["id"]
+
+        async def ndjson():
+            async for rows in pages():
+                yield b"".join(dumps(row) + b"\n" for row in rows)
+
+        async def csv_lines():
+            buffer = io.StringIO()
+            writer = csv.DictWriter(buffer, fieldnames=header, extrasaction="ignore")
+            writer.writeheader()
+            async for rows in pages():
+                writer.writerows(rows)
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+            if buffer.tell():
+                yield buffer.getvalue()
+
+        return StreamingResponse(
+            ndjson() if format == "ndjson" else csv_lines(),
+            media_type=EXPORT_FORMATS[format],
+            headers={"Content-Disposition": f'attachment; filename="{table}.{format}"'},
+        )
+
+    # ---- Operaciones en lote ----
+    @router.post("/bulk", openapi_extra=_body_docs(many))
+    async def create_rows(request: Request, db: Client = Depends(get_supabase)):
+        """Crear hasta `CRUD_BULK_MAX_ROWS` filas; si una no es válida no se inserta ninguna"""
+        rows = _validate(many, await request.body())
+        created = await _insert(db, rows)
+        return FastJSONResponse({"ok": True, "count": len(created), "data": created})
+
+    @router.patch("/bulk", openapi_extra=_body_docs(bulk_changes))
+    async def update_rows(request: Request, db: Client = Depends(get_supabase)):
+        """Aplicar los mismos cambios a varias filas: `{"ids": [...], "changes": {...}}`"""
+        body = _validate(bulk_changes, await request.body())
+        updated = await _update(db, body.ids, body.changes)
+        return FastJSONResponse({"ok": True, "count": len(updated), "data": updated})
+
+    @router.delete("/bulk")
+    async def delete_rows(
+        ids: List[int] = Query(..., description="Repeat for each id: ?ids=1&ids=2"),
+        db: Client = Depends(get_supabase),
+    ):
+        """Eliminar varias filas por id"""
+        if len(ids) > CRUD_BULK_MAX_ROWS:
+            raise HTTPException(status_code=400, detail=f"At most {CRUD_BULK_MAX_ROWS} ids per request")
+        deleted = await _delete(db, ids)
+        return FastJSONResponse({"ok": True, "count": len(deleted), "data": deleted})
+
+    # ---- Fila individual ----
+    @router.get(item_path)
+    async def get_row(
+        request: Request,
+        item_id: int = Path(..., alias=id_param),
+        db: Client = Depends(get_supabase),
+    ):
+        """Obtener una fila por ID"""
+        async def load():
+            rows = await _execute(lambda: db.table(table).select("*").eq("id", item_id).limit(1))
+            if not rows:
+                raise HTTPException(status_code=404, detail=f"{name} not found")
+            return {"ok": True, "data": rows[0]}
+
+        return await _cached(request, load)
+
+    @router.post("", openapi_extra=_body_docs(TypeAdapter(Union[create, List[create]])))
+    async def create_row(request: Request, db: Client = Depends(get_supabase)):
+        """Crear una fila (objeto) o varias (array, como `/bulk`)"""
+        body = await request.body()
+        if body.lstrip()[:1] == b"[":
+            rows = _validate(many, body)
+        else:
+            rows = [_validate(one, body)]
+        return FastJSONResponse({"ok": True, "data": await _insert(db, rows)})
+
+    @router.patch(item_path, openapi_extra=_body_docs(changes))
+    async def update_row(
+        request: Request,
+        item_id: int = Path(..., alias=id_param),
+        db: Client = Depends(get_supabase),
+    ):
+        """Actualizar solo los campos enviados"""
+        values = _validate(changes, await request.body())
+        return FastJSONResponse({"ok": True, "data": await _update(db, [item_id], values)})
+
+    @router.delete(item_path)
+    async def delete_row(item_id: int = Path(..., alias=id_param), db: Client = Depends(get_supabase)):
+        """Eliminar una fila"""
+        return FastJSONResponse({"ok": True, "data": await _delete(db, [item_id])})
+
+    return router
@@ -1,18 +1,26 @@
 """
 Rutas para el manejo de emails
 """
+import asyncio
 from typing import Optional, List
-from datetime import datetime, timezone
 from fastapi import APIRouter, HTTPException, Path, Query, Request, Body, Depends, UploadFile, File, Form
-import smtplib
-from email.message import EmailMessage
+from fastapi.responses import JSONResponse
 
-from app.models import Email
-from app.database import get_supabase
-from app.config import GMAIL_USER, GMAIL_PASSWORD_APP
-from supabase import Client
+from app.mail_merge import campaigns, start_campaign, validate_filters
+from app.models import BulkEmailRequest, Email
+from app.database import Client, get_supabase
+from app.config import (
+    EMAIL_MAX_ATTACHMENT_BYTES,
+    EMAIL_MAX_ENCODED_MESSAGE_BYTES,
+    GMAIL_PASSWORD_APP,
+    GMAIL_USER,
+)
+from app.mime_stream import Attachment, AttachmentTooLarge, encoded_size, guess_content_type, write_mime
+from app.outbox import get_outbox
+from app.serialization import FastJSONResponse
+from app.timing import TimedRoute
 
-router = APIRouter(prefix="/emails", tags=["emails"])
+router = APIRouter(prefix="/emails", tags=["emails"], route_class=TimedRoute)
 
 
 @router.get("/health")
@@ -31,7 +39,10 @@ async def send_email(
     files: List[UploadFile] = File(default_factory=list),
     db: Client = Depends(get_supabase)
 ):
-    """Enviar un email y registrarlo en la base de datos"""
+    """
+    Registrar un email como `pendiente` y encolarlo para su entrega.
+    Responde 202 con el id; el estado final queda en la tabla `emails`.
+    """
     if not GMAIL_USER or not GMAIL_PASSWORD_APP:
         raise HTTPException(
             status_code=500,
@@ -42,54 +53,100 @@ async def send_email(
     if not recipients:
         raise HTTPException(status_code=400, detail="Invalid 'para' recipients")
 
-    msg = EmailMessage()
-    msg["From"] = GMAIL_USER
-    msg["To"] = ", ".join(recipients)
-    msg["Subject"] = asunto
-    msg.set_content(body or "")
-
-    # Adjuntar archivos
+    # Validar tamaños declarados antes de leer nada (el del mensaje, ya codificado)
+    total = 0
     for f in files or []:
-        try:
-            content = await f.read()
-            maintype = "application"
-            subtype = "octet-stream"
-            filename = f.filename or "attachment"
-            msg.add_attachment(content, maintype=maintype, subtype=subtype, filename=filename)
-        except Exception:
-            pass
-
-    # Enviar email
+        size = getattr(f, "size", None) or 0
+        total += encoded_size(size)
+        if size > EMAIL_MAX_ATTACHMENT_BYTES:
+            raise HTTPException(
+                status_code=413,
+                detail=f"Attachment '{f.filename}' exceeds {EMAIL_MAX_ATTACHMENT_BYTES} bytes"
+            )
+    if total > EMAIL_MAX_ENCODED_MESSAGE_BYTES:
+        raise HTTPException(
+            status_code=413, detail=f"Encoded message exceeds {EMAIL_MAX_ENCODED_MESSAGE_BYTES} bytes"
+        )
+
+    # Los adjuntos se codifican por bloques desde el archivo temporal del upload
+    attachments = [
+        Attachment(f.file, f.filename or "attachment", guess_content_type(f.filename, f.content_type))
+        for f in files or []
+    ]
+    message_id: List[str] = []
+
+    def write_message(fh):
+        message_id.append(write_mime(
+            fh, GMAIL_USER, recipients, asunto, body or "", attachments,
+            EMAIL_MAX_ATTACHMENT_BYTES, EMAIL_MAX_ENCODED_MESSAGE_BYTES,
+        ))
+
+    # Registrar como pendiente y delegar la entrega al outbox
+    row = {
+        "asunto": asunto,
+        "para": ", ".join(recipients),
+        "plantilla": plantilla,
+        "responsable": responsable,
+    }
     try:
-        with smtplib.SMTP_SSL("smtp.gmail.com", 465) as smtp:
-            smtp.login(GMAIL_USER, GMAIL_PASSWORD_APP)
-            smtp.send_message(msg)
+        inserted = await get_outbox().enqueue_stream(db, GMAIL_USER, recipients, row, write_message)
+    except AttachmentTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-    # Registrar en la base de datos
-    db_result: Optional[dict] = None
-    try:
-        now_iso = datetime.now(timezone.utc).isoformat()
-        row = {
-            "asunto": asunto,
-            "para": ", ".join(recipients),
-            "plantilla": plantilla,
-            "estado": "enviado",
-            "fecha_hora": now_iso,
-            "responsable": responsable,
-        }
-        resp = db.table("emails").insert(row).execute()
-        db_result = {"inserted": True, "data": getattr(resp, "data", None)}
-    except Exception as e:
-        db_result = {"inserted": False, "error": str(e)}
+    return JSONResponse(
+        status_code=202,
+        content={
+            "success": True,
+            "ok": True,
+            "id": inserted.get("id"),
+            "estado": inserted.get("estado"),
+            "info": {"accepted": recipients, "messageId": message_id[0] if message_id else None},
+        },
+    )
+
+
+@router.post("/bulk")
+async def send_bulk(payload: BulkEmailRequest, db: Client = Depends(get_supabase)):
+    """
+    Envío masivo con plantilla: `body` (o `plantilla`) admite marcadores como
+    `{{nombre}}` o `{{company.name}}`. Los destinatarios salen de `recipients`
+    o de los contactos que cumplan `filter`. Responde 202 con el id de campaña.
+    """
+    if not GMAIL_USER or not GMAIL_PASSWORD_APP:
+        raise HTTPException(
+            status_code=500,
+            detail="GMAIL_USER or GMAIL_PASSWORD_APP not configured"
+        )
+    template = payload.body or payload.plantilla
+    if not template:
+        raise HTTPException(status_code=400, detail="body or plantilla is required")
+    if payload.recipients is None:
+        if payload.filter is None:
+            raise HTTPException(status_code=400, detail="recipients or filter is required")
+        try:
+            validate_filters(payload.filter)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
 
-    return {
-        "success": True,
-        "ok": True,
-        "info": {"accepted": recipients, "messageId": msg.get("Message-Id")},
-        "db": db_result
-    }
+    recipients = (
+        [r.model_dump() for r in payload.recipients] if payload.recipients is not None else None
+    )
+    progress = start_campaign(
+        db, payload.asunto, template, payload.plantilla, payload.responsable,
+        recipients, payload.filter,
+    )
+    return JSONResponse(status_code=202, content={"ok": True, "campaign": progress})
+
+
+@router.get("/bulk/{campaign_id}")
+async def get_bulk_status(campaign_id: str = Path(...)):
+    """Progreso de una campaña de envío masivo"""
+    progress = campaigns.get(campaign_id)
+    if progress is None:
+        raise HTTPException(status_code=404, detail="Campaign not found")
+    return {"ok": True, "campaign": progress}
 
 
 @router.get("")
@@ -118,7 +175,8 @@ async def get_all_emails(
             query = query.eq(k, val)
         
         resp = query.limit(limit).execute()
-        return {"ok": True, "data": getattr(resp, "data", None)}
+        # Filas de Supabase ya serializables: sin pasar por jsonable_encoder
+        return FastJSONResponse({"ok": True, "data": getattr(resp, "data", None)})
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -134,7 +192,12 @@ async def get_email(
         data = getattr(resp, "data", None) or []
         if not data:
             raise HTTPException(status_code=404, detail="Email not found")
-        return {"ok": True, "data": data[0]}
+        content = {"ok": True, "data": data[0]}
+        # Destinatarios rechazados (entrega parcial o fallida), si el outbox los registró
+        delivery = await asyncio.to_thread(get_outbox().delivery_report, email_id)
+        if delivery is not None:
+            content["delivery"] = delivery
+        return content
     except HTTPException:
         raise
     except Exception as e:
@@ -0,0 +1,47 @@
+"""
+Feed de cambios en tiempo real (Server-Sent Events)
+"""
+from typing import Optional
+
+from fastapi import APIRouter, Header, HTTPException, Query
+from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
+
+from app.config import EVENTS_HEARTBEAT
+from app.events import TABLES, TooManySubscribers, hub
+from app.timing import TimedRoute
+
+router = APIRouter(prefix="/events", tags=["events"], route_class=TimedRoute)
+
+
+@router.get("")
+async def stream_events(
+    tables: Optional[str] = Query(None, description=f"Comma-separated subset of: {', '.join(TABLES)}"),
+    last_event_id: Optional[str] = Query(None, description="Resume after this event (same as the Last-Event-ID header)"),
+    last_event_id_header: Optional[str] = Header(None, alias="Last-Event-ID"),
+):
+    """
+    Altas, modificaciones y bajas de companies, contacts, calls y emails como
+    eventos SSE (`created`, `updated`, `deleted`). Un evento `reset` indica
+    que se perdieron cambios (o hubo una importación, con `table`) y hay que
+    volver a pedir las listas.
+    """
+    wanted = [t.strip() for t in tables.split(",") if t.strip()] if tables else None
+    unknown = sorted(set(wanted or ()) - set(TABLES))
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown tables: {', '.join(unknown)}")
+    try:
+        subscriber = hub.subscribe(wanted)
+    except TooManySubscribers:
+        # EventSource reintenta solo tras errores de red: un 503 lo detiene y
+        # el frontend decide cuándo volver a conectar
+        raise HTTPException(
+            status_code=503, detail="Too many clients connected to /events", headers={"Retry-After": "30"}
+        )
+    return StreamingResponse(
+        hub.stream(subscriber, last_event_id_header or last_event_id, EVENTS_HEARTBEAT),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        # Se ejecuta aunque el cliente se desconecte antes de que empiece el stream
+        background=BackgroundTask(hub.unsubscribe, subscriber),
+    )
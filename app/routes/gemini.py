@@ -1,24 +1,107 @@
 """
 Rutas para el procesamiento con Gemini AI
 """
+import asyncio
 import json
-from typing import List, Optional
-from fastapi import APIRouter, HTTPException, Form, Body
-from fastapi.responses import JSONResponse
-import httpx
+import re
+import time
+from typing import TYPE_CHECKING, List, Optional, Tuple
+from fastapi import APIRouter, HTTPException, Form, Body, Query
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse, StreamingResponse
+from app import metrics
+from app.cache import TTLCache, text_key
+from app.config import (
+    GEMINI_BASE_URL,
+    GEMINI_KEY,
+    GEMINI_MODEL,
+    PARSE_BATCH_CONCURRENCY,
+    PARSE_BATCH_MAX_ITEMS,
+    PARSE_CACHE_MAX_ENTRIES,
+    PARSE_CACHE_TTL,
+    PREEXTRACT_ENABLED,
+    PREEXTRACT_MIN_CONFIDENCE,
+)
+from app.database import get_client, get_supabase
+from app.entity_resolution import commit_contacts
+from app.extraction import item_merger, merge_extraction, pre_extract
+from app.json_stream import ItemsStreamParser
+from app.models import BatchParseRequest
+from app.registry import registry
+from app.resilience import UpstreamUnavailable
+from app.timing import TimedRoute
 
-from app.config import GEMINI_KEY, GEMINI_MODEL
-from app.database import supabase_client
+if TYPE_CHECKING:
+    import httpx
 
-router = APIRouter(prefix="/parse", tags=["gemini"])
+router = APIRouter(prefix="/parse", tags=["gemini"], route_class=TimedRoute)
+
+JSON_BLOCK_RE = re.compile(r"\{[\s\S]*\}|\[[\s\S]*\]")
+
+# Resultados de parseo por (modelo, tipo, texto)
+parse_cache = TTLCache(ttl=PARSE_CACHE_TTL, max_entries=PARSE_CACHE_MAX_ENTRIES)
+
+# Métricas de uso y latencia de Gemini, etiquetadas por tipo y modelo
+GEMINI_REQUESTS = metrics.counter(
+    "gemini_parse_requests_total", "Parse requests by outcome", ("type", "model", "outcome")
+)
+GEMINI_TOKENS = metrics.counter(
+    "gemini_tokens_total", "Tokens reported by usageMetadata", ("type", "model", "kind")
+)
+GEMINI_CALL_TOKENS = metrics.histogram(
+    "gemini_call_tokens", "Tokens per Gemini call", ("type", "model", "kind"), metrics.TOKEN_BUCKETS
+)
+GEMINI_STAGE_SECONDS = metrics.histogram(
+    "gemini_stage_seconds",
+    "Time per parse stage (company_fetch, prompt_build, upstream, json_extract)",
+    ("type", "model", "stage"),
+)
+
+USAGE_FIELDS = {
+    "prompt": "promptTokenCount",
+    "output": "candidatesTokenCount",
+    "total": "totalTokenCount",
+}
+
+
+def record_stage(_type: str, stage: str, started: float, usage: Optional[dict] = None) -> None:
+    """Registrar la duración de una etapa desde `started` (perf_counter)"""
+    elapsed = time.perf_counter() - started
+    GEMINI_STAGE_SECONDS.observe(elapsed, type=_type, model=GEMINI_MODEL, stage=stage)
+    if usage is not None:
+        usage.setdefault("timings_ms", {})[stage] = round(elapsed * 1000, 3)
+
+
+def record_tokens(_type: str, usage_metadata: Optional[dict], usage: Optional[dict] = None) -> None:
+    """Registrar los tokens de usageMetadata de una respuesta de Gemini"""
+    if not usage_metadata:
+        return
+    for kind, field in USAGE_FIELDS.items():
+        count = usage_metadata.get(field)
+        if count is None:
+            continue
+        GEMINI_TOKENS.inc(count, type=_type, model=GEMINI_MODEL, kind=kind)
+        GEMINI_CALL_TOKENS.observe(count, type=_type, model=GEMINI_MODEL, kind=kind)
+        if usage is not None:
+            usage[f"{kind}_tokens"] = count
+
+
+def gemini_client() -> "httpx.AsyncClient":
+    """Cliente httpx compartido para Gemini (conexiones reutilizadas, con métricas)"""
+    return registry.get("gemini")
+
+
+def record_outcome(_type: str, outcome: str) -> None:
+    GEMINI_REQUESTS.inc(type=_type, model=GEMINI_MODEL, outcome=outcome)
 
 
 async def fetch_company_names() -> List[str]:
     """Obtener nombres de empresas de la base de datos"""
-    if not supabase_client:
+    db = get_client()
+    if not db:
         return []
     try:
-        resp = supabase_client.table("companies").select("name").limit(1000).execute()
+        resp = db.table("companies").select("name").limit(1000).execute()
         data = getattr(resp, "data", None) or []
         return [r.get("name") for r in data if r.get("name")]
     except Exception as e:
@@ -73,57 +156,153 @@ def build_prompt(_type: str, text: str, companies_list: Optional[List[str]] = No
     )
 
 
-async def call_gemini(_type: str, text: str) -> JSONResponse:
-    """Llamar a la API de Gemini para procesar texto"""
-    if not GEMINI_KEY:
-        return JSONResponse(
-            status_code=200,
-            content={
-                "ok": False,
-                "reason": "no_gemini_key",
-                "message": "GEMINI_KEY_API not configured on server",
-            },
-        )
-
-    try:
-        prompt: str
-        if _type == "contacts":
-            companies = []
+async def prepare_prompt(
+    _type: str,
+    text: str,
+    companies: Optional[List[str]] = None,
+    usage: Optional[dict] = None,
+) -> str:
+    """Construir el prompt, agregando las empresas conocidas para contactos"""
+    if _type == "contacts":
+        if companies is None:
+            started = time.perf_counter()
             try:
                 companies = await fetch_company_names()
             except Exception as e:
                 print("[WARN] Could not fetch company names:", e)
-            prompt = build_prompt(_type, text, (companies or [])[:200])
-        else:
-            prompt = build_prompt(_type, text)
+            record_stage(_type, "company_fetch", started, usage)
+        started = time.perf_counter()
+        prompt = build_prompt(_type, text, (companies or [])[:200])
+    else:
+        started = time.perf_counter()
+        prompt = build_prompt(_type, text)
+    record_stage(_type, "prompt_build", started, usage)
+    return prompt
+
+
+def gemini_url(method: str, query: str = "") -> str:
+    """URL del endpoint de Gemini para el método indicado (generateContent, streamGenerateContent)"""
+    return (
+        f"{GEMINI_BASE_URL}/v1beta/models/{GEMINI_MODEL}:{method}?{query}key={GEMINI_KEY}"
+    )
+
 
-        url = (
-            f"https://generativelanguage.googleapis.com/v1beta/models/{GEMINI_MODEL}:generateContent?key={GEMINI_KEY}"
+def gemini_body(prompt: str) -> dict:
+    """Cuerpo de la petición a Gemini"""
+    return {
+        "contents": [{"role": "user", "parts": [{"text": prompt}]}],
+        "generationConfig": {
+            "maxOutputTokens": 2048,
+            "temperature": 0.0,
+            "responseMimeType": "application/json",
+        },
+    }
+
+
+def no_gemini_key_response() -> JSONResponse:
+    return JSONResponse(
+        status_code=200,
+        content={
+            "ok": False,
+            "reason": "no_gemini_key",
+            "message": "GEMINI_KEY_API not configured on server",
+        },
+    )
+
+
+def local_result_ok(extraction: Optional[dict]) -> bool:
+    """La extracción local es suficiente para omitir la llamada a Gemini"""
+    return bool(
+        extraction
+        and extraction["items"]
+        and extraction["confidence"] >= PREEXTRACT_MIN_CONFIDENCE
+    )
+
+
+def local_content(extraction: dict) -> dict:
+    return {
+        "ok": True,
+        "parsed": {"items": extraction["items"]},
+        "source": "local",
+        "format": extraction["format"],
+        "confidence": extraction["confidence"],
+    }
+
+
+def _error(status_code: int, **content) -> Tuple[int, dict]:
+    return status_code, {"ok": False, **content}
+
+
+def _unavailable(e: UpstreamUnavailable) -> dict:
+    return {
+        "ok": False,
+        "reason": "upstream_unavailable",
+        "upstream": e.upstream,
+        "message": str(e),
+        "retry_after": round(e.retry_after, 1),
+    }
+
+
+async def gemini_parse(
+    _type: str,
+    text: str,
+    client: Optional["httpx.AsyncClient"] = None,
+    companies: Optional[List[str]] = None,
+    include_usage: bool = False,
+) -> Tuple[int, dict]:
+    """
+    Procesar texto con Gemini y devolver (status_code, contenido).
+    Los resultados exitosos se guardan en la caché de parseo.
+    `client` y `companies` permiten reutilizar conexión y contexto en lotes.
+    Las entradas estructuradas con alta confianza se resuelven localmente.
+    Con `include_usage` el contenido incluye tokens y tiempos por etapa.
+    """
+    usage = {"model": GEMINI_MODEL}
+    status_code, content, outcome = await _gemini_parse(_type, text, client, companies, usage)
+    record_outcome(_type, outcome)
+    if include_usage:
+        usage["outcome"] = outcome
+        content = {**content, "usage": usage}
+    return status_code, content
+
+
+async def _gemini_parse(
+    _type: str,
+    text: str,
+    client: Optional["httpx.AsyncClient"],
+    companies: Optional[List[str]],
+    usage: dict,
+) -> Tuple[int, dict, str]:
+    extraction = pre_extract(_type, text) if PREEXTRACT_ENABLED else None
+    if local_result_ok(extraction):
+        return 200, local_content(extraction), "local"
+
+    if not GEMINI_KEY:
+        status_code, content = _error(
+            200, reason="no_gemini_key", message="GEMINI_KEY_API not configured on server"
         )
-        body = {
-            "contents": [{"role": "user", "parts": [{"text": prompt}]}],
-            "generationConfig": {
-                "maxOutputTokens": 2048,
-                "temperature": 0.0,
-                "responseMimeType": "application/json",
-            },
-        }
-
-        async with httpx.AsyncClient(timeout=60) as client:
-            r = await client.post(url, json=body)
+        return status_code, content, "no_gemini_key"
+
+    cache_key = text_key(GEMINI_MODEL, _type, text)
+    cached = parse_cache.get(cache_key)
+    if cached is not None:
+        return 200, dict(cached), "cached"
+
+    try:
+        prompt = await prepare_prompt(_type, text, companies, usage)
+        url = gemini_url("generateContent")
+        body = gemini_body(prompt)
+
+        started = time.perf_counter()
+        r = await (client or gemini_client()).post(url, json=body)
+        record_stage(_type, "upstream", started, usage)
 
         if r.status_code < 200 or r.status_code >= 300:
-            return JSONResponse(
-                status_code=502,
-                content={
-                    "ok": False,
-                    "reason": "gemini_error",
-                    "status": r.status_code,
-                    "body": r.text,
-                },
-            )
+            status_code, content = _error(502, reason="gemini_error", status=r.status_code, body=r.text)
+            return status_code, content, "gemini_error"
 
         json_body = r.json()
+        record_tokens(_type, json_body.get("usageMetadata"), usage)
         parts = (
             json_body.get("candidates", [{}])[0]
             .get("content", {})
@@ -132,35 +311,199 @@ async def call_gemini(_type: str, text: str) -> JSONResponse:
         content_text = "\n".join([p.get("text", "") for p in parts if p.get("text")])
 
         if not content_text:
-            return JSONResponse(
-                status_code=200,
-                content={"ok": True, "parsed": None, "raw": json.dumps(json_body)}
-            )
+            return 200, {"ok": True, "parsed": None, "raw": json.dumps(json_body)}, "empty"
 
+        started = time.perf_counter()
         try:
-            import re
-            m = re.search(r"\{[\s\S]*\}|\[[\s\S]*\]", content_text)
+            m = JSON_BLOCK_RE.search(content_text)
             json_text = m.group(0) if m else content_text
             parsed = json.loads(json_text)
-            return JSONResponse(status_code=200, content={"ok": True, "parsed": parsed})
         except Exception:
-            return JSONResponse(
-                status_code=200,
-                content={"ok": True, "parsed": None, "raw": content_text}
-            )
+            return 200, {"ok": True, "parsed": None, "raw": content_text}, "unparsed"
+        finally:
+            record_stage(_type, "json_extract", started, usage)
+
+        if extraction:
+            parsed = merge_extraction(parsed, extraction)
+        content = {"ok": True, "parsed": parsed, "source": "gemini"}
+        parse_cache.set(cache_key, content)
+        return 200, dict(content), "ok"
+    except UpstreamUnavailable as e:
+        return 503, _unavailable(e), "unavailable"
     except Exception as e:
-        return JSONResponse(
-            status_code=500,
-            content={
-                "ok": False,
-                "reason": "exception",
-                "message": str(e),
-            },
+        status_code, content = _error(500, reason="exception", message=str(e))
+        return status_code, content, "exception"
+
+
+async def call_gemini(_type: str, text: str, include_usage: bool = False) -> JSONResponse:
+    """Llamar a la API de Gemini para procesar texto"""
+    status_code, content = await gemini_parse(_type, text, include_usage=include_usage)
+    return JSONResponse(status_code=status_code, content=content)
+
+
+def sse_event(event: str, data) -> str:
+    """Formatear un evento Server-Sent Events"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+def _candidate_text(chunk: dict) -> str:
+    parts = (
+        (chunk.get("candidates") or [{}])[0]
+        .get("content", {})
+        .get("parts", [])
+    )
+    return "".join(p.get("text", "") for p in parts if p.get("text"))
+
+
+async def stream_gemini(_type: str, text: str, extraction: Optional[dict] = None):
+    """
+    Llamar a streamGenerateContent y emitir cada item como evento SSE
+    en cuanto el parser incremental lo completa. Con `extraction` cada item
+    pasa por la misma validación que `/parse` (`merge_extraction`).
+    """
+    merge = item_merger(extraction) if extraction else (lambda item: item)
+    count = 0
+    usage_metadata = None
+    try:
+        prompt = await prepare_prompt(_type, text)
+        url = gemini_url("streamGenerateContent", "alt=sse&")
+        parser = ItemsStreamParser()
+
+        started = time.perf_counter()
+        async with gemini_client().stream("POST", url, json=gemini_body(prompt)) as r:
+            if r.status_code < 200 or r.status_code >= 300:
+                body = (await r.aread()).decode("utf-8", "replace")
+                record_outcome(_type, "gemini_error")
+                yield sse_event("error", {
+                    "ok": False,
+                    "reason": "gemini_error",
+                    "status": r.status_code,
+                    "body": body,
+                })
+                return
+
+            async for line in r.aiter_lines():
+                if not line.startswith("data:"):
+                    continue
+                try:
+                    chunk = json.loads(line[5:].strip())
+                except ValueError:
+                    continue
+                usage_metadata = chunk.get("usageMetadata") or usage_metadata
+                for item in parser.feed(_candidate_text(chunk)):
+                    count += 1
+                    yield sse_event("item", merge(item) if isinstance(item, dict) else item)
+        record_stage(_type, "upstream", started)
+        record_tokens(_type, usage_metadata)
+
+        # Respaldo: si el modelo no devolvió un arreglo "items", intentar el parseo completo
+        if count == 0 and parser.text:
+            try:
+                m = JSON_BLOCK_RE.search(parser.text)
+                parsed = json.loads(m.group(0) if m else parser.text)
+                items = parsed.get("items", []) if isinstance(parsed, dict) else parsed
+                for item in items or []:
+                    if isinstance(item, dict):
+                        count += 1
+                        yield sse_event("item", merge(item))
+            except Exception:
+                record_outcome(_type, "unparsed")
+                yield sse_event("error", {"ok": False, "reason": "unparsed", "raw": parser.text})
+                return
+
+        record_outcome(_type, "ok")
+        yield sse_event("done", {"ok": True, "count": count})
+    except UpstreamUnavailable as e:
+        record_outcome(_type, "unavailable")
+        yield sse_event("error", _unavailable(e))
+    except Exception as e:
+        record_outcome(_type, "exception")
+        yield sse_event("error", {"ok": False, "reason": "exception", "message": str(e)})
+
+
+async def stream_local(extraction: dict):
+    for item in extraction["items"]:
+        yield sse_event("item", item)
+    yield sse_event("done", {"ok": True, "count": len(extraction["items"]), "source": "local"})
+
+
+def stream_response(_type: str, text: str):
+    extraction = pre_extract(_type, text) if PREEXTRACT_ENABLED else None
+    if local_result_ok(extraction):
+        record_outcome(_type, "local")
+        return StreamingResponse(stream_local(extraction), media_type="text/event-stream")
+    if not GEMINI_KEY:
+        return no_gemini_key_response()
+    return StreamingResponse(
+        stream_gemini(_type, text, extraction),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.post("/batch")
+async def parse_batch(payload: BatchParseRequest):
+    """
+    Procesar varios textos en una sola petición, con concurrencia acotada.
+    Cada resultado incluye su propio `ok`; con `stream=true` se emiten como
+    NDJSON en el orden en que terminan.
+    """
+    if not payload.items:
+        raise HTTPException(status_code=400, detail="no items provided")
+    if len(payload.items) > PARSE_BATCH_MAX_ITEMS:
+        raise HTTPException(
+            status_code=413,
+            detail=f"too many items (max {PARSE_BATCH_MAX_ITEMS})"
         )
 
+    async def run_batch():
+        semaphore = asyncio.Semaphore(PARSE_BATCH_CONCURRENCY)
+        companies = None
+        if any(i.type != "companies" for i in payload.items):
+            started = time.perf_counter()
+            companies = await fetch_company_names()
+            record_stage("contacts", "company_fetch", started)
+
+        client = gemini_client()
+
+        async def run_item(index, item):
+            _type = "companies" if item.type == "companies" else "contacts"
+            if not item.text:
+                return index, {"id": item.id, "type": _type, "status": 400, "ok": False, "reason": "no text provided"}
+            async with semaphore:
+                status_code, content = await gemini_parse(
+                    _type, item.text, client, companies, payload.usage
+                )
+            return index, {"id": item.id, "type": _type, "status": status_code, **content}
+
+        tasks = [run_item(idx, item) for idx, item in enumerate(payload.items)]
+        for task in asyncio.as_completed(tasks):
+            yield await task
+
+    if payload.stream:
+        async def ndjson():
+            async for _, result in run_batch():
+                yield json.dumps(result, ensure_ascii=False) + "\n"
+        return StreamingResponse(ndjson(), media_type="application/x-ndjson")
+
+    results: List[dict] = [None] * len(payload.items)
+    async for index, result in run_batch():
+        results[index] = result
+    ok_count = sum(1 for r in results if r.get("ok"))
+    return {
+        "ok": True,
+        "results": results,
+        "summary": {"total": len(results), "ok": ok_count, "failed": len(results) - ok_count},
+    }
+
 
 @router.post("")
-async def parse(text: str = Form(None), type: str = Form(None), body: dict = None):
+async def parse(
+    text: str = Form(None),
+    type: str = Form(None),
+    body: dict = None,
+    usage: bool = Query(False),
+):
     """Procesar texto con Gemini (genérico)"""
     if body and not text:
         text = body.get("text")
@@ -168,22 +511,66 @@ async def parse(text: str = Form(None), type: str = Form(None), body: dict = Non
     if not text:
         raise HTTPException(status_code=400, detail="no text provided")
     _type = "companies" if type == "companies" else "contacts"
-    return await call_gemini(_type, text)
+    return await call_gemini(_type, text, usage)
 
 
 @router.post("/contacts")
-async def parse_contacts(body: dict = Body(...)):
-    """Extraer contactos de texto con Gemini"""
+async def parse_contacts(
+    body: dict = Body(...),
+    commit: bool = Query(False),
+    usage: bool = Query(False),
+):
+    """
+    Extraer contactos de texto con Gemini.
+    Con `commit=true` los contactos se resuelven contra los existentes y se guardan en lote.
+    """
     text = body.get("text")
     if not text:
         raise HTTPException(status_code=400, detail="no text provided")
-    return await call_gemini("contacts", text)
+    if not commit:
+        return await call_gemini("contacts", text, usage)
+
+    status_code, content = await gemini_parse("contacts", text, include_usage=usage)
+    parsed = content.get("parsed")
+    if status_code != 200 or not content.get("ok") or not isinstance(parsed, dict):
+        return JSONResponse(status_code=status_code, content=content)
+
+    db = get_supabase()
+    defaults = {"fuente": body.get("fuente"), "propietario": body.get("propietario")}
+    try:
+        content["commit"] = await run_in_threadpool(
+            commit_contacts, db, parsed.get("items") or [], defaults
+        )
+    except Exception as e:
+        content["ok"] = False
+        content["reason"] = "commit_error"
+        content["message"] = str(e)
+        return JSONResponse(status_code=500, content=content)
+    return JSONResponse(status_code=200, content=content)
 
 
 @router.post("/companies")
-async def parse_companies(body: dict = Body(...)):
+async def parse_companies(body: dict = Body(...), usage: bool = Query(False)):
     """Extraer empresas de texto con Gemini"""
     text = body.get("text")
     if not text:
         raise HTTPException(status_code=400, detail="no text provided")
-    return await call_gemini("companies", text)
+    return await call_gemini("companies", text, usage)
+
+
+@router.post("/contacts/stream")
+async def parse_contacts_stream(body: dict = Body(...)):
+    """Extraer contactos con Gemini emitiendo cada item como evento SSE"""
+    text = body.get("text")
+    if not text:
+        raise HTTPException(status_code=400, detail="no text provided")
+    return stream_response("contacts", text)
+
+
+@router.post("/companies/stream")
+async def parse_companies_stream(body: dict = Body(...)):
+    """Extraer empresas con Gemini emitiendo cada item como evento SSE"""
+    text = body.get("text")
+    if not text:
+        raise HTTPException(status_code=400, detail="no text provided")
+    return stream_response("companies", text)
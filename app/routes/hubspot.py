@@ -0,0 +1,91 @@
+"""
+Rutas de sincronización e importación con HubSpot
+"""
+from typing import Literal, Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Path, Query
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse
+
+from app import dead_letters
+from app.database import Client, get_supabase
+from app.hubspot_import import imports, running_import, start_import
+from app.hubspot_sync import get_hubspot_sync
+from app.models import HubSpotImportRequest
+from app.timing import TimedRoute
+
+router = APIRouter(prefix="/hubspot", tags=["hubspot"], route_class=TimedRoute)
+
+
+@router.get("/sync")
+async def get_sync_status():
+    """Marcas de agua y resultado del último ciclo de sincronización"""
+    return {"ok": True, "data": get_hubspot_sync().status()}
+
+
+@router.post("/sync/run")
+async def run_sync():
+    """Ejecutar un ciclo de sincronización ahora (sin esperar al intervalo)"""
+    result = await run_in_threadpool(get_hubspot_sync().run_once)
+    return {"ok": result.get("ok", False), "data": result}
+
+
+@router.post("/import")
+async def import_from_hubspot(
+    payload: HubSpotImportRequest = HubSpotImportRequest(),
+    db: Client = Depends(get_supabase),
+):
+    """
+    Importar empresas y contactos de HubSpot a Supabase en segundo plano.
+    Responde 202 con el id; el progreso se consulta en `/hubspot/import/{id}`.
+    """
+    current = running_import()
+    if current is not None:
+        raise HTTPException(status_code=409, detail=f"Import {current['id']} is already running")
+    progress = start_import(db, payload.objects)
+    return JSONResponse(status_code=202, content={"ok": True, "data": progress})
+
+
+@router.get("/import/{import_id}")
+async def get_import_status(import_id: str = Path(...)):
+    """Progreso de una importación"""
+    progress = imports.get(import_id)
+    if progress is None:
+        raise HTTPException(status_code=404, detail="Import not found")
+    return {"ok": True, "data": progress}
+
+
+@router.get("/dead-letters")
+async def list_dead_letters(
+    object_type: Optional[Literal["companies", "contacts"]] = None,
+    limit: int = Query(100, ge=1, le=1000),
+    offset: int = Query(0, ge=0),
+):
+    """Sincronizaciones fallidas pendientes de reenviar, con su payload y error"""
+    items, total = await run_in_threadpool(dead_letters.store.list, object_type, limit, offset)
+    counts = await run_in_threadpool(dead_letters.store.counts)
+    return {"ok": True, "data": {"total": total, "counts": counts, "items": items}}
+
+
+@router.post("/dead-letters/replay")
+async def replay_dead_letters(
+    object_type: Optional[Literal["companies", "contacts"]] = None,
+    limit: Optional[int] = Query(None, ge=1),
+):
+    """
+    Reenviar a HubSpot las sincronizaciones fallidas con llamadas batch
+    (`HUBSPOT_REPLAY_RATE` por segundo). Las que se envían se borran de la tabla.
+    """
+    object_types = [object_type] if object_type else dead_letters.OBJECT_TYPES
+    result = await run_in_threadpool(dead_letters.replay, object_types, limit)
+    if result.get("reason") == "already_running":
+        raise HTTPException(status_code=409, detail="A dead-letter replay is already running")
+    return {"ok": result["ok"], "data": result}
+
+
+@router.delete("/dead-letters/{letter_id}")
+async def discard_dead_letter(letter_id: int = Path(...)):
+    """Descartar una sincronización fallida sin reenviarla"""
+    if not await run_in_threadpool(dead_letters.store.delete, [letter_id]):
+        raise HTTPException(status_code=404, detail="Dead letter not found")
+    return {"ok": True, "data": {"id": letter_id}}
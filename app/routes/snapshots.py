@@ -0,0 +1,61 @@
+"""
+Rutas de snapshots columnares (Parquet/Arrow) para análisis
+"""
+from typing import Literal, Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+
+from app import snapshots
+from app.database import Client, get_supabase
+from app.models import SnapshotRunRequest
+from app.timing import TimedRoute
+
+router = APIRouter(prefix="/snapshots", tags=["snapshots"], route_class=TimedRoute)
+
+
+def _require_pyarrow() -> None:
+    if not snapshots.available():
+        raise HTTPException(status_code=501, detail="pyarrow is not installed (pip install pyarrow)")
+
+
+@router.get("")
+async def get_snapshot_status():
+    """Marcas de cada tabla y resultado del último snapshot"""
+    return {"ok": True, "data": snapshots.get_snapshots().status()}
+
+
+@router.post("/run")
+async def run_snapshot(payload: SnapshotRunRequest = SnapshotRunRequest()):
+    """
+    Escribir los snapshots Parquet ahora. Por defecto es incremental (añade lo
+    modificado desde la última marca); `full` reescribe el dataset completo.
+    """
+    _require_pyarrow()
+    result = await run_in_threadpool(
+        snapshots.get_snapshots().run_once, payload.tables, payload.full, payload.partition
+    )
+    if result.get("reason") == "already_running":
+        raise HTTPException(status_code=409, detail="A snapshot is already running")
+    return {"ok": result.get("ok", False), "data": result}
+
+
+@router.get("/{table}/arrow")
+async def stream_table(
+    table: Literal["companies", "contacts", "calls", "emails"],
+    month: Optional[str] = Query(None, pattern=r"^\d{4}-(0[1-9]|1[0-2])$", description="Mes de created_at (YYYY-MM)"),
+    db: Client = Depends(get_supabase),
+):
+    """
+    Tabla completa (o un mes de `created_at`) como stream IPC de Arrow, leída
+    de Supabase por páginas keyset: un RecordBatch tipado por página, sin JSON
+    intermedio para el cliente. Se lee con `pyarrow.ipc.open_stream`.
+    """
+    _require_pyarrow()
+    filename = f"{table}-{month}.arrows" if month else f"{table}.arrows"
+    return StreamingResponse(
+        snapshots.ipc_stream(db, table, month),
+        media_type=snapshots.ARROW_STREAM_TYPE,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
@@ -0,0 +1,169 @@
+"""
+Serialización JSON rápida y compresión de respuestas.
+Con orjson (`JSON_SERIALIZER=orjson`, si está instalado) las respuestas se
+codifican bastante más rápido que con `json`. `CompressionMiddleware`
+comprime con brotli o gzip según `Accept-Encoding` a partir de
+`COMPRESSION_MIN_SIZE` bytes, y `PrecomputedJSON` guarda un payload cacheado
+ya codificado (y comprimido) para servirlo sin volver a serializarlo.
+"""
+import gzip
+import json
+from typing import Any, Dict, Optional
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.responses import JSONResponse, Response
+
+from app.config import (
+    BROTLI_QUALITY,
+    COMPRESSION_ENABLED,
+    COMPRESSION_MIN_SIZE,
+    GZIP_LEVEL,
+    JSON_SERIALIZER,
+)
+
+try:
+    import orjson
+except ImportError:  # opcional: sin orjson se usa json de la biblioteca estándar
+    orjson = None
+
+try:
+    import brotli
+except ImportError:  # opcional: sin brotli solo se negocia gzip
+    brotli = None
+
+USE_ORJSON = orjson is not None and JSON_SERIALIZER == "orjson"
+
+# Orden de preferencia del servidor cuando el cliente acepta varias
+ENCODINGS = ("br", "gzip") if brotli is not None else ("gzip",)
+
+COMPRESSIBLE_TYPES = ("application/json", "application/x-ndjson", "text/", "application/javascript")
+# Streams que el cliente consume evento a evento: comprimirlos retrasa la entrega
+UNCOMPRESSED_TYPES = ("text/event-stream",)
+
+
+def dumps(content: Any) -> bytes:
+    """JSON compacto en UTF-8"""
+    if USE_ORJSON:
+        return orjson.dumps(content, default=str, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(
+        content, ensure_ascii=False, allow_nan=False, separators=(",", ":"), default=str
+    ).encode("utf-8")
+
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse codificada con `dumps` (orjson si está disponible)"""
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+def negotiate(accept_encoding: str) -> Optional[str]:
+    """Codificación a usar según `Accept-Encoding`; None para enviar sin comprimir"""
+    accepted: Dict[str, float] = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.partition(";")
+        name = name.strip().lower()
+        if not name:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        accepted[name] = q
+    best, best_q = None, 0.0
+    for encoding in ENCODINGS:
+        q = accepted.get(encoding, accepted.get("*", 0.0))
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+
+
+def _compressible(content_type: str) -> bool:
+    content_type = content_type.lower()
+    if content_type.startswith(UNCOMPRESSED_TYPES):
+        return False
+    return content_type.startswith(COMPRESSIBLE_TYPES)
+
+
+class PrecomputedJSON:
+    """Payload codificado una sola vez; cada variante comprimida se calcula al primer uso"""
+
+    def __init__(self, content: Any):
+        self.body = dumps(content)
+        self._compressed: Dict[str, bytes] = {}
+
+    def response(self, accept_encoding: str = "", status_code: int = 200) -> Response:
+        headers = {"Vary": "Accept-Encoding"}
+        encoding = None
+        if COMPRESSION_ENABLED and len(self.body) >= COMPRESSION_MIN_SIZE:
+            encoding = negotiate(accept_encoding)
+        if encoding is None:
+            return Response(self.body, status_code, headers=headers, media_type="application/json")
+        body = self._compressed.get(encoding)
+        if body is None:
+            body = self._compressed.setdefault(encoding, compress(self.body, encoding))
+        headers["Content-Encoding"] = encoding
+        return Response(body, status_code, headers=headers, media_type="application/json")
+
+
+class CompressionMiddleware:
+    """
+    Middleware ASGI que comprime las respuestas completas (no las de
+    streaming, como SSE o NDJSON) de tipo texto/JSON de al menos
+    `minimum_size` bytes, si el cliente acepta gzip o brotli.
+    """
+
+    def __init__(self, app, minimum_size: int = 1024):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = negotiate(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start: Optional[dict] = None
+        passthrough = False
+
+        async def send_compressed(message):
+            nonlocal start, passthrough
+            if message["type"] == "http.response.start":
+                # Las cabeceras se envían con el primer bloque del cuerpo
+                start = message
+                return
+            if passthrough or message["type"] != "http.response.body" or start is None:
+                await send(message)
+                return
+            headers = MutableHeaders(raw=list(start["headers"]))
+            body = message.get("body", b"")
+            if (
+                message.get("more_body", False)
+                or "content-encoding" in headers
+                or len(body) < self.minimum_size
+                or not _compressible(headers.get("content-type", ""))
+            ):
+                passthrough = True
+                await send(start)
+                await send(message)
+                return
+            compressed = compress(body, encoding)
+            headers["Content-Encoding"] = encoding
+            headers["Content-Length"] = str(len(compressed))
+            headers.add_vary_header("Accept-Encoding")
+            await send({**start, "headers": headers.raw})
+            await send({"type": "http.response.body", "body": compressed})
+
+        await self.app(scope, receive, send_compressed)
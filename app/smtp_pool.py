@@ -0,0 +1,267 @@
+"""
+Pool de conexiones SMTP autenticadas y persistentes.
+Las operaciones bloqueantes de smtplib se ejecutan fuera del event loop.
+"""
+import asyncio
+import queue
+import smtplib
+import ssl
+import threading
+import time
+from email.message import EmailMessage
+from typing import Callable, List, Optional
+
+from app.config import (
+    GMAIL_PASSWORD_APP,
+    GMAIL_USER,
+    SMTP_HOST,
+    SMTP_NOOP_INTERVAL,
+    SMTP_POOL_SIZE,
+    SMTP_PORT,
+    SMTP_SSL,
+    SMTP_STARTTLS,
+    SMTP_TIMEOUT,
+)
+from app.instrumentation import track
+from app.registry import registry
+from app.resilience import dependency
+
+
+def stream_file(smtp: smtplib.SMTP, from_addr: str, to_addrs: List[str], path: str,
+                chunk_size: int = 64 * 1024) -> dict:
+    """
+    Transacción SMTP (MAIL/RCPT/DATA) leyendo el mensaje de `path` por líneas,
+    con dot-stuffing, sin cargarlo completo en memoria.
+    """
+    smtp.ehlo_or_helo_if_needed()
+    code, resp = smtp.mail(from_addr)
+    if code != 250:
+        smtp.rset()
+        raise smtplib.SMTPSenderRefused(code, resp, from_addr)
+    refused = {}
+    for addr in to_addrs:
+        code, resp = smtp.rcpt(addr)
+        if code not in (250, 251):
+            refused[addr] = (code, resp)
+    if len(refused) == len(to_addrs):
+        smtp.rset()
+        raise smtplib.SMTPRecipientsRefused(refused)
+
+    code, resp = smtp.docmd("data")
+    if code != 354:
+        smtp.rset()
+        raise smtplib.SMTPDataError(code, resp)
+
+    buffer = bytearray()
+    last = b"\r\n"
+    with open(path, "rb") as fh:
+        for line in fh:
+            if line.startswith(b"."):
+                buffer += b"."
+            if line.endswith(b"\r\n"):
+                buffer += line
+            elif line.endswith(b"\n"):
+                buffer += line[:-1] + b"\r\n"
+            else:
+                buffer += line
+            last = bytes(buffer[-2:]) if len(buffer) >= 2 else last
+            if len(buffer) >= chunk_size:
+                smtp.send(bytes(buffer))
+                buffer.clear()
+    if last != b"\r\n":
+        buffer += b"\r\n"
+    buffer += b".\r\n"
+    smtp.send(bytes(buffer))
+    code, resp = smtp.getreply()
+    if code != 250:
+        raise smtplib.SMTPDataError(code, resp)
+    return refused
+
+
+class _PooledConnection:
+    def __init__(self, smtp: smtplib.SMTP):
+        self.smtp = smtp
+        self.last_used = time.monotonic()
+
+
+class SMTPPool:
+    """
+    Mantiene hasta `size` conexiones abiertas. Antes de reutilizar una conexión
+    inactiva se verifica con NOOP; si falla, se descarta y se abre otra.
+    """
+
+    def __init__(
+        self,
+        host: str,
+        port: int,
+        user: Optional[str] = None,
+        password: Optional[str] = None,
+        size: int = 4,
+        use_ssl: bool = True,
+        starttls: bool = False,
+        timeout: float = 30,
+        noop_interval: float = 30,
+    ):
+        self.host = host
+        self.port = port
+        self.user = user
+        self.password = password
+        self.size = size
+        self.use_ssl = use_ssl
+        self.starttls = starttls
+        self.timeout = timeout
+        self.noop_interval = noop_interval
+        self._idle: "queue.LifoQueue[_PooledConnection]" = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+        self._async_slots: Optional[asyncio.Semaphore] = None
+        self._closed = False
+
+    def _connect(self) -> smtplib.SMTP:
+        with track("smtp", "connect"):
+            return self._open()
+
+    def _open(self) -> smtplib.SMTP:
+        if self.use_ssl:
+            smtp = smtplib.SMTP_SSL(self.host, self.port, timeout=self.timeout,
+                                    context=ssl.create_default_context())
+        else:
+            smtp = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+            if self.starttls:
+                smtp.starttls(context=ssl.create_default_context())
+        if self.user and self.password:
+            smtp.login(self.user, self.password)
+        return smtp
+
+    @staticmethod
+    def _close(conn: _PooledConnection) -> None:
+        try:
+            conn.smtp.quit()
+        except Exception:
+            try:
+                conn.smtp.close()
+            except Exception:
+                pass
+
+    def _healthy(self, conn: _PooledConnection) -> bool:
+        if time.monotonic() - conn.last_used < self.noop_interval:
+            return True
+        try:
+            return conn.smtp.noop()[0] == 250
+        except Exception:
+            return False
+
+    def _acquire(self) -> _PooledConnection:
+        self._slots.acquire()
+        try:
+            while True:
+                try:
+                    conn = self._idle.get_nowait()
+                except queue.Empty:
+                    return _PooledConnection(self._connect())
+                if self._healthy(conn):
+                    return conn
+                self._close(conn)
+        except Exception:
+            self._slots.release()
+            raise
+
+    def _release(self, conn: Optional[_PooledConnection]) -> None:
+        if conn is not None:
+            if self._closed:
+                self._close(conn)
+            else:
+                conn.last_used = time.monotonic()
+                self._idle.put(conn)
+        self._slots.release()
+
+    def _run(self, send: Callable[[smtplib.SMTP], dict], operation: str = "send") -> dict:
+        """
+        Ejecutar `send` tras el circuit breaker de SMTP (el tamaño del pool ya
+        hace de bulkhead). Los rechazos del servidor no abren el circuito;
+        los fallos de conexión sí.
+        """
+        rejected: Optional[Exception] = None
+        with dependency("smtp").call():
+            try:
+                return self._send(send, operation)
+            except (smtplib.SMTPRecipientsRefused, smtplib.SMTPResponseException) as e:
+                rejected = e
+        raise rejected
+
+    def _send(self, send: Callable[[smtplib.SMTP], dict], operation: str) -> dict:
+        """
+        Ejecutar `send` con una conexión del pool. Si la conexión reutilizada
+        se cayó, se reintenta una vez con una conexión nueva.
+        """
+        for attempt in range(2):
+            conn = self._acquire()
+            try:
+                with track("smtp", operation):
+                    refused = send(conn.smtp)
+            except (smtplib.SMTPRecipientsRefused, smtplib.SMTPResponseException):
+                # El servidor rechazó el mensaje; la sesión sigue siendo válida
+                self._release(conn)
+                raise
+            except Exception as e:
+                self._close(conn)
+                self._release(None)
+                dropped = isinstance(e, smtplib.SMTPServerDisconnected) or (
+                    isinstance(e, OSError) and not isinstance(e, smtplib.SMTPException)
+                )
+                if attempt == 0 and dropped:
+                    continue
+                raise
+            self._release(conn)
+            return refused
+        return {}
+
+    async def _run_async(self, send: Callable[[smtplib.SMTP], dict], operation: str = "send") -> dict:
+        if self._async_slots is None:
+            self._async_slots = asyncio.Semaphore(self.size)
+        # Esperar turno en el loop evita ocupar hilos bloqueados en el pool
+        async with self._async_slots:
+            return await asyncio.to_thread(self._run, send, operation)
+
+    def send_message_sync(self, msg: EmailMessage, to_addrs: Optional[List[str]] = None) -> dict:
+        return self._run(lambda smtp: smtp.send_message(msg, to_addrs=to_addrs), "send_message")
+
+    async def send_message(self, msg: EmailMessage, to_addrs: Optional[List[str]] = None) -> dict:
+        """Enviar un EmailMessage en un hilo, sin bloquear el event loop"""
+        return await self._run_async(lambda smtp: smtp.send_message(msg, to_addrs=to_addrs), "send_message")
+
+    async def send_file(self, from_addr: str, to_addrs: List[str], path: str) -> dict:
+        """Enviar un mensaje guardado en disco, transmitiéndolo por bloques"""
+        return await self._run_async(lambda smtp: stream_file(smtp, from_addr, to_addrs, path), "send_file")
+
+    def prewarm(self) -> None:
+        """Abrir una conexión y dejarla en el pool para el primer envío"""
+        conn = self._acquire()
+        self._release(conn)
+
+    def close(self) -> None:
+        self._closed = True
+        while True:
+            try:
+                self._close(self._idle.get_nowait())
+            except queue.Empty:
+                break
+
+
+def create_smtp_pool() -> SMTPPool:
+    """Pool con la configuración SMTP_*"""
+    return SMTPPool(
+        SMTP_HOST,
+        SMTP_PORT,
+        user=GMAIL_USER,
+        password=GMAIL_PASSWORD_APP,
+        size=SMTP_POOL_SIZE,
+        use_ssl=SMTP_SSL,
+        starttls=SMTP_STARTTLS,
+        timeout=SMTP_TIMEOUT,
+        noop_interval=SMTP_NOOP_INTERVAL,
+    )
+
+
+def get_smtp_pool() -> SMTPPool:
+    """Pool compartido, creado en el primer uso"""
+    return registry.get("smtp")
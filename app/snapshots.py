@@ -0,0 +1,405 @@
+"""
+Snapshots columnares de companies, contacts, calls y emails para análisis.
+Cada tabla se lee de Supabase por páginas keyset (`id > último`, sin OFFSET)
+y cada página se convierte en un RecordBatch de Arrow con tipos derivados de
+los modelos de `app/models.py`. Los lotes se escriben en Parquet, por defecto
+particionado por mes de `created_at` al estilo Hive
+(`calls/created_month=2025-03/part-….parquet`), así que leer un mes solo abre
+sus archivos. En modo incremental se añade un archivo con las filas posteriores
+a la última marca: por defecto (`cursor_column="id"`) solo las filas nuevas; con
+una columna como `updated_at` (mantenida por un trigger) también las
+modificadas, y entonces la misma fila puede aparecer en varios archivos (la
+vigente es la de mayor `cursor_column`). Los borrados solo se reflejan con un
+snapshot completo. Requiere pyarrow (opcional).
+"""
+import asyncio
+import io
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+from datetime import date, datetime, timezone
+from typing import Dict, Iterable, Iterator, List, Optional, Union, get_args, get_origin
+
+from app import database, metrics
+from app.config import (
+    SNAPSHOT_COMPRESSION,
+    SNAPSHOT_CURSOR_COLUMN,
+    SNAPSHOT_DIR,
+    SNAPSHOT_INTERVAL,
+    SNAPSHOT_PAGE_SIZE,
+    SNAPSHOT_PARTITION,
+)
+from app.models import Call, Company, Contact, Email
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # opcional: sin pyarrow no hay snapshots ni stream Arrow
+    pa = pq = None
+
+MODELS = {"companies": Company, "contacts": Contact, "calls": Call, "emails": Email}
+TABLES = tuple(MODELS)
+PARTITIONS = ("month", "none")
+PARTITION_COLUMN = "created_month"
+UNKNOWN_MONTH = "unknown"
+ARROW_STREAM_TYPE = "application/vnd.apache.arrow.stream"
+
+SNAPSHOT_ROWS = metrics.counter("snapshot_rows_total", "Rows written to Parquet snapshots", ("table", "mode"))
+SNAPSHOT_SECONDS = metrics.histogram("snapshot_seconds", "Time to snapshot one table", ("table", "mode"))
+
+
+def available() -> bool:
+    return pa is not None
+
+
+def _now_iso() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+# ---- Esquema y conversión a Arrow ----
+def _arrow_type(annotation):
+    if get_origin(annotation) is Union:
+        annotation = next((a for a in get_args(annotation) if a is not type(None)), str)
+    return {
+        bool: pa.bool_(),
+        int: pa.int64(),
+        float: pa.float64(),
+        str: pa.string(),
+        date: pa.date32(),
+        datetime: pa.timestamp("us", tz="UTC"),
+    }.get(annotation, pa.string())
+
+
+def arrow_schema(table: str):
+    """
+    Esquema Arrow de la tabla a partir de su modelo Pydantic (id primero). Solo
+    columnas del modelo más `created_at`: la columna del cursor incremental puede
+    no existir en la tabla y no se pide salvo en el modo incremental que la usa.
+    """
+    types = {"id": pa.int64()}
+    for name, field in MODELS[table].model_fields.items():
+        types.setdefault(name, _arrow_type(field.annotation))
+    types.setdefault("created_at", pa.timestamp("us", tz="UTC"))
+    return pa.schema(list(types.items()))
+
+
+def _convert(values: list, type_):
+    if pa.types.is_timestamp(type_) or pa.types.is_date(type_):
+        # PostgREST devuelve fechas ISO 8601: Arrow las convierte sin pasar por Python
+        return pa.array(values, pa.string()).cast(type_)
+    return pa.array(values, type_)
+
+
+def _column(values: list, type_):
+    try:
+        return _convert(values, type_)
+    except (TypeError, ValueError, OverflowError):
+        # Algún valor no encaja con el modelo: solo esa celda queda nula
+        cells = []
+        for value in values:
+            try:
+                cells.append(_convert([value], type_)[0].as_py())
+            except (TypeError, ValueError, OverflowError):
+                cells.append(None)
+        return pa.array(cells, type_)
+
+
+def to_batch(rows: List[dict], schema):
+    """Filas de PostgREST → RecordBatch con el esquema dado (columnas que faltan: nulas)"""
+    return pa.RecordBatch.from_arrays(
+        [_column([row.get(field.name) for row in rows], field.type) for field in schema],
+        schema=schema,
+    )
+
+
+def _month(row: dict) -> str:
+    created = row.get("created_at")
+    return created[:7] if isinstance(created, str) and len(created) >= 7 else UNKNOWN_MONTH
+
+
+def _month_range(month: str):
+    """Límites [inicio, fin) de un mes YYYY-MM en UTC"""
+    year, number = (int(p) for p in month.split("-"))
+    end_year, end_month = (year + 1, 1) if number == 12 else (year, number + 1)
+    return f"{year:04d}-{number:02d}-01T00:00:00+00:00", f"{end_year:04d}-{end_month:02d}-01T00:00:00+00:00"
+
+
+# ---- Lectura por páginas ----
+def id_pages(db, table: str, columns: str, page_size: int, after_id: int = 0,
+             month: Optional[str] = None, position: Optional[dict] = None) -> Iterator[List[dict]]:
+    """Toda la tabla (o un mes de `created_at`) por páginas keyset ordenadas por id"""
+    while True:
+        query = db.table(table).select(columns).gt("id", after_id)
+        if month:
+            start, end = _month_range(month)
+            query = query.gte("created_at", start).lt("created_at", end)
+        rows = query.order("id").limit(page_size).execute().data or []
+        if not rows:
+            return
+        after_id = rows[-1]["id"]
+        if position is not None:
+            position["id"] = after_id
+        yield rows
+        if len(rows) < page_size:
+            return
+
+
+def ipc_stream(db, table: str, month: Optional[str] = None,
+               page_size: int = SNAPSHOT_PAGE_SIZE) -> Iterator[bytes]:
+    """Stream IPC de Arrow (un RecordBatch por página) para `StreamingResponse`"""
+    schema = arrow_schema(table)
+    sink = io.BytesIO()
+    options = pa.ipc.IpcWriteOptions(compression="zstd")
+    with pa.ipc.new_stream(sink, schema, options=options) as writer:
+        for rows in id_pages(db, table, ",".join(schema.names), page_size, month=month):
+            writer.write_batch(to_batch(rows, schema))
+            yield sink.getvalue()
+            sink.seek(0)
+            sink.truncate()
+    yield sink.getvalue()
+
+
+class SnapshotWriter:
+    def __init__(self, directory: str, page_size: int, partition: str, cursor_column: str,
+                 compression: str, interval: float):
+        self.directory = directory
+        self.page_size = page_size
+        self.partition = partition if partition in PARTITIONS else "none"
+        self.cursor_column = cursor_column
+        self.compression = compression
+        self.interval = interval
+        self.state_path = os.path.join(directory, "_state.json")
+        self.state = self._load_state()
+        self.last_run: Dict[str, object] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._running = threading.Lock()
+
+    # ---- Marca persistida ----
+    def _load_state(self) -> dict:
+        try:
+            with open(self.state_path, "r", encoding="utf-8") as fh:
+                return json.load(fh)
+        except FileNotFoundError:
+            return {}
+
+    def _save_state(self) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        tmp = f"{self.state_path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as fh:
+            json.dump(self.state, fh, indent=2)
+            fh.flush()
+            os.fsync(fh.fileno())
+        os.replace(tmp, self.state_path)
+
+    # ---- Lectura ----
+    def _watermark(self, db, table: str) -> dict:
+        """Marca actual (antes de leer): lo modificado después entra en el siguiente incremental"""
+        if self.cursor_column == "id":
+            return {"cursor": None, "id": 0}
+        column = self.cursor_column
+        rows = (
+            db.table(table).select(f"id,{column}").not_.is_(column, "null")
+            .order(column, desc=True).order("id", desc=True).limit(1).execute().data or []
+        )
+        return {"cursor": rows[0][column], "id": rows[0]["id"]} if rows else {"cursor": None, "id": 0}
+
+    def _changed_pages(self, db, table: str, columns: str, mark: dict, position: dict) -> Iterator[List[dict]]:
+        """Filas con (cursor, id) posterior a la marca, por páginas ordenadas"""
+        column = self.cursor_column
+        cursor, last_id = mark["cursor"], mark["id"]
+        while True:
+            rows: List[dict] = []
+            if cursor is not None:
+                # Filas con el mismo cursor que la marca y id mayor (empates)
+                rows = (
+                    db.table(table).select(columns).eq(column, cursor).gt("id", last_id)
+                    .order("id").limit(self.page_size).execute().data or []
+                )
+            if len(rows) < self.page_size:
+                query = db.table(table).select(columns).not_.is_(column, "null")
+                if cursor is not None:
+                    query = query.gt(column, cursor)
+                rows += query.order(column).order("id").limit(self.page_size - len(rows)).execute().data or []
+            if not rows:
+                return
+            cursor, last_id = rows[-1][column], rows[-1]["id"]
+            position.update(cursor=cursor, id=last_id)
+            yield rows
+            if len(rows) < self.page_size:
+                return
+
+    # ---- Escritura ----
+    def _write(self, table: str, pages: Iterable[List[dict]], target: str, run_id: str, partition: str) -> int:
+        """Escribir las páginas en `target` (un archivo por partición); devuelve las filas escritas"""
+        schema = arrow_schema(table)
+        writers: Dict[str, "pq.ParquetWriter"] = {}
+        paths: Dict[str, str] = {}
+        written = 0
+        try:
+            for rows in pages:
+                batch = to_batch(rows, schema)
+                if partition == "month":
+                    groups: Dict[str, List[int]] = {}
+                    for index, row in enumerate(rows):
+                        groups.setdefault(_month(row), []).append(index)
+                else:
+                    groups = {"": None}
+                for month, indices in groups.items():
+                    writer = writers.get(month)
+                    if writer is None:
+                        directory = os.path.join(target, f"{PARTITION_COLUMN}={month}") if month else target
+                        os.makedirs(directory, exist_ok=True)
+                        # Oculto (prefijo ".") hasta cerrarlo: los lectores de datasets lo ignoran
+                        paths[month] = os.path.join(directory, f".part-{run_id}.parquet")
+                        writer = writers[month] = pq.ParquetWriter(paths[month], schema, compression=self.compression)
+                    writer.write_batch(batch if indices is None else batch.take(pa.array(indices, pa.int64())))
+                written += len(rows)
+        except BaseException:
+            for writer in writers.values():
+                writer.close()
+            for path in paths.values():
+                if os.path.exists(path):
+                    os.remove(path)
+            raise
+        for writer in writers.values():
+            writer.close()
+        for path in paths.values():
+            os.replace(path, os.path.join(os.path.dirname(path), os.path.basename(path)[1:]))
+        return written
+
+    def snapshot_table(self, db, table: str, full: bool = False, partition: Optional[str] = None) -> dict:
+        """Snapshot completo (reemplaza el dataset) o incremental (añade un archivo por partición)"""
+        partition = partition or self.partition
+        final_dir = os.path.join(self.directory, table)
+        mark = self.state.get(table)
+        if not full and (mark is None or mark.get("partition") != partition
+                         or mark.get("cursor_column") != self.cursor_column or not os.path.isdir(final_dir)):
+            # Sin snapshot previo compatible no hay a qué añadir
+            full = True
+        mode = "full" if full else "incremental"
+        run_id = f"{time.strftime('%Y%m%dT%H%M%S', time.gmtime())}-{uuid.uuid4().hex[:6]}"
+        columns = ",".join(arrow_schema(table).names)
+        started = time.monotonic()
+
+        if full:
+            next_mark = self._watermark(db, table)
+            position = {"id": 0}
+            tmp_dir = os.path.join(self.directory, f".{table}-{run_id}")
+            try:
+                rows = self._write(table, id_pages(db, table, columns, self.page_size, position=position),
+                                   tmp_dir, run_id, partition)
+            except BaseException:
+                shutil.rmtree(tmp_dir, ignore_errors=True)
+                raise
+            os.makedirs(tmp_dir, exist_ok=True)
+            old_dir = os.path.join(self.directory, f".{table}-old-{run_id}")
+            if os.path.isdir(final_dir):
+                os.replace(final_dir, old_dir)
+            os.replace(tmp_dir, final_dir)
+            shutil.rmtree(old_dir, ignore_errors=True)
+            if self.cursor_column == "id":
+                next_mark = {"cursor": None, "id": position["id"]}
+        else:
+            position = {"cursor": mark["cursor"], "id": mark["id"]}
+            if self.cursor_column == "id":
+                pages = id_pages(db, table, columns, self.page_size, after_id=mark["id"], position=position)
+            else:
+                # El cursor se pide para paginar, pero no se escribe (no está en el esquema)
+                if self.cursor_column not in columns.split(","):
+                    columns = f"{columns},{self.cursor_column}"
+                pages = self._changed_pages(db, table, columns, mark, position)
+            rows = self._write(table, pages, final_dir, run_id, partition)
+            next_mark = {"cursor": position.get("cursor"), "id": position["id"]}
+
+        seconds = time.monotonic() - started
+        SNAPSHOT_ROWS.inc(rows, table=table, mode=mode)
+        SNAPSHOT_SECONDS.observe(seconds, table=table, mode=mode)
+        self.state[table] = {
+            **next_mark,
+            "cursor_column": self.cursor_column,
+            "partition": partition,
+            "full_at": _now_iso() if full else (mark or {}).get("full_at"),
+            "last_run_at": _now_iso(),
+        }
+        self._save_state()
+        return {"mode": mode, "rows": rows, "seconds": round(seconds, 3), "path": final_dir}
+
+    def run_once(self, tables: Optional[Iterable[str]] = None, full: bool = False,
+                 partition: Optional[str] = None) -> dict:
+        """Snapshot de las tablas (bloqueante); no se solapa con otro en curso"""
+        if pa is None:
+            return {"ok": False, "reason": "pyarrow_missing"}
+        if not self._running.acquire(blocking=False):
+            return {"ok": False, "reason": "already_running"}
+        started = time.time()
+        result: Dict[str, object] = {"ok": True, "started_at": started, "tables": {}}
+        try:
+            db = database.get_client()
+            if db is None:
+                raise RuntimeError("Supabase client not configured")
+            for table in tables or TABLES:
+                try:
+                    result["tables"][table] = self.snapshot_table(db, table, full, partition)
+                except Exception as e:
+                    # La marca no avanza: se reintenta en la siguiente ejecución
+                    result["ok"] = False
+                    result.setdefault("errors", {})[table] = str(getattr(e, "detail", e))
+                    print(f"[WARN] Snapshot of {table} failed: {e}")
+        except Exception as e:
+            result.update(ok=False, errors={"all": str(e)})
+        finally:
+            self._running.release()
+        result["seconds"] = round(time.time() - started, 3)
+        self.last_run = result
+        return result
+
+    # ---- Ciclo en segundo plano ----
+    async def _loop(self) -> None:
+        while True:
+            await asyncio.to_thread(self.run_once)
+            await asyncio.sleep(self.interval)
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def status(self) -> dict:
+        return {
+            "available": available(),
+            "running": self._task is not None,
+            "interval": self.interval,
+            "directory": os.path.abspath(self.directory),
+            "partition": self.partition,
+            "cursor_column": self.cursor_column,
+            "watermarks": self.state,
+            "last_run": self.last_run,
+        }
+
+
+_writer: Optional[SnapshotWriter] = None
+
+
+def get_snapshots() -> SnapshotWriter:
+    global _writer
+    if _writer is None:
+        _writer = SnapshotWriter(
+            SNAPSHOT_DIR,
+            page_size=SNAPSHOT_PAGE_SIZE,
+            partition=SNAPSHOT_PARTITION,
+            cursor_column=SNAPSHOT_CURSOR_COLUMN,
+            compression=SNAPSHOT_COMPRESSION,
+            interval=SNAPSHOT_INTERVAL,
+        )
+    return _writer
@@ -0,0 +1,190 @@
+"""
+Tiempos por petición: cabecera `Server-Timing` con el desglose (validación,
+Supabase, HubSpot, Gemini, SMTP, serialización) y perfil por muestreo
+bajo demanda con `?profile=1` (solo administradores).
+"""
+import asyncio
+import functools
+import hmac
+import threading
+import time
+from contextvars import ContextVar
+from typing import Callable, Dict, Iterable, Optional
+from urllib.parse import parse_qs
+
+from fastapi.routing import APIRoute
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.responses import PlainTextResponse
+
+from app.profiler import SamplingProfiler
+
+ADMIN_TOKEN_HEADER = "x-admin-token"
+
+# Orden de las entradas en Server-Timing
+TIMING_ORDER = ("validation", "supabase", "hubspot", "gemini", "smtp", "app", "serialization")
+
+
+class RequestTimings:
+    """Duraciones acumuladas de una petición; compartido con los hilos que lanza"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.durations: Dict[str, float] = {}
+        self.endpoint_started: Optional[float] = None
+        self.endpoint_finished: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def add(self, name: str, seconds: float) -> None:
+        with self._lock:
+            self.durations[name] = self.durations.get(name, 0.0) + seconds
+
+    def header(self) -> str:
+        total = time.perf_counter() - self.started
+        names = [n for n in TIMING_ORDER if n in self.durations]
+        names += sorted(n for n in self.durations if n not in TIMING_ORDER)
+        entries = [f"{n};dur={self.durations[n] * 1000:.1f}" for n in names]
+        entries.append(f"total;dur={total * 1000:.1f}")
+        return ", ".join(entries)
+
+
+_current: ContextVar[Optional[RequestTimings]] = ContextVar("request_timings", default=None)
+
+
+def add(name: str, seconds: float) -> None:
+    """Sumar `seconds` a la entrada `name` de la petición en curso (si hay)"""
+    timings = _current.get()
+    if timings is not None:
+        timings.add(name, seconds)
+
+
+def _timed_call(call: Callable) -> Callable:
+    """Marcar inicio y fin del endpoint para separar validación y serialización"""
+    if asyncio.iscoroutinefunction(call):
+        @functools.wraps(call)
+        async def timed(*args, **kwargs):
+            timings = _current.get()
+            if timings is not None:
+                timings.endpoint_started = time.perf_counter()
+            try:
+                return await call(*args, **kwargs)
+            finally:
+                if timings is not None:
+                    timings.endpoint_finished = time.perf_counter()
+        return timed
+
+    @functools.wraps(call)
+    def timed_sync(*args, **kwargs):
+        timings = _current.get()
+        if timings is not None:
+            timings.endpoint_started = time.perf_counter()
+        try:
+            return call(*args, **kwargs)
+        finally:
+            if timings is not None:
+                timings.endpoint_finished = time.perf_counter()
+    return timed_sync
+
+
+class TimedRoute(APIRoute):
+    """
+    APIRoute que reparte el tiempo del handler en `validation` (lectura del
+    cuerpo, dependencias y validación), `app` (el endpoint) y `serialization`.
+    """
+
+    def get_route_handler(self) -> Callable:
+        self.dependant.call = _timed_call(self.dependant.call)
+        handler = super().get_route_handler()
+
+        async def timed_handler(request):
+            timings = _current.get()
+            started = time.perf_counter()
+            try:
+                return await handler(request)
+            finally:
+                if timings is not None:
+                    now = time.perf_counter()
+                    if timings.endpoint_started is None:
+                        timings.add("validation", now - started)
+                    else:
+                        finished = timings.endpoint_finished or now
+                        timings.add("validation", timings.endpoint_started - started)
+                        timings.add("app", finished - timings.endpoint_started)
+                        timings.add("serialization", now - finished)
+
+        return timed_handler
+
+
+class ServerTimingMiddleware:
+    """
+    Middleware ASGI que abre el contexto de tiempos de cada petición y agrega
+    `Server-Timing`. Con `?profile=1` y un `X-Admin-Token` válido la respuesta
+    se sustituye por las pilas muestreadas en formato collapsed.
+    """
+
+    def __init__(self, app, admin_token: Optional[str] = None, profile_interval: float = 0.005,
+                 allowed_origins: Iterable[str] = ()):
+        self.app = app
+        self.admin_token = admin_token
+        self.profile_interval = profile_interval
+        self.allowed_origins = set(allowed_origins)
+
+    def _wants_profile(self, scope) -> bool:
+        query = parse_qs(scope.get("query_string", b"").decode("latin-1"))
+        return query.get("profile", [""])[-1].lower() in ("1", "true")
+
+    def _is_admin(self, headers: Headers) -> bool:
+        given = headers.get(ADMIN_TOKEN_HEADER)
+        return bool(self.admin_token and given and hmac.compare_digest(given, self.admin_token))
+
+    def _timing_headers(self, timings: RequestTimings, request_headers: Headers) -> Dict[str, str]:
+        out = {"Server-Timing": timings.header()}
+        origin = request_headers.get("origin")
+        # Sin Timing-Allow-Origin el navegador oculta Server-Timing en peticiones cross-origin
+        if origin and ("*" in self.allowed_origins or origin in self.allowed_origins):
+            out["Timing-Allow-Origin"] = origin
+        return out
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        request_headers = Headers(scope=scope)
+        profiling = self._wants_profile(scope)
+        if profiling and not self._is_admin(request_headers):
+            await PlainTextResponse("Profiling requires a valid X-Admin-Token", status_code=403)(
+                scope, receive, send
+            )
+            return
+
+        timings = RequestTimings()
+        token = _current.set(timings)
+        try:
+            if not profiling:
+                async def send_with_timing(message):
+                    if message["type"] == "http.response.start":
+                        headers = MutableHeaders(scope=message)
+                        for name, value in self._timing_headers(timings, request_headers).items():
+                            headers.append(name, value)
+                    await send(message)
+
+                await self.app(scope, receive, send_with_timing)
+                return
+
+            status = {"code": 500}
+
+            async def discard(message):
+                if message["type"] == "http.response.start":
+                    status["code"] = message["status"]
+
+            profiler = SamplingProfiler(self.profile_interval).start()
+            try:
+                await self.app(scope, receive, discard)
+            finally:
+                profiler.stop()
+            headers = self._timing_headers(timings, request_headers)
+            headers["X-Profile-Samples"] = str(profiler.samples)
+            headers["X-Profiled-Status"] = str(status["code"])
+            await PlainTextResponse(profiler.collapsed(), headers=headers)(scope, receive, send)
+        finally:
+            _current.reset(token)
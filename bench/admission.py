@@ -0,0 +1,110 @@
+"""
+Benchmark de control de admisión: un script masivo contra usuarios interactivos.
+
+Un cliente "batch" (`X-API-Key: batch`) lanza `--abusers` peticiones
+simultáneas a `/parse/contacts` (ante un 429 espera `Retry-After`, salvo con
+`--ignore-retry-after`), mientras
+`--users` clientes interactivos envían una petición cada `--interval`
+segundos. Se mide la latencia de los interactivos con `ADMISSION_ENABLED`
+activado y desactivado.
+
+Uso:
+    python bench/admission.py [--duration 10] [--abusers 64] [--users 4]
+"""
+import argparse
+import asyncio
+import itertools
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+from collections import Counter
+from typing import Dict, List
+
+import httpx
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from bench.load import _free_text, _standins_main, percentile, start_app  # noqa: E402
+
+
+async def run(base_url: str, args) -> Dict[str, object]:
+    counter = itertools.count()
+    deadline = time.monotonic() + args.duration
+    interactive: List[float] = []
+    statuses: Dict[str, Counter] = {"batch": Counter(), "interactive": Counter()}
+    limits = httpx.Limits(max_connections=args.abusers + args.users + 8)
+
+    async with httpx.AsyncClient(base_url=base_url, timeout=60, limits=limits) as client:
+        async def post(key: str) -> httpx.Response:
+            # Texto distinto en cada petición: sin aciertos en la caché de parseo
+            body = {"text": _free_text(next(counter))}
+            return await client.post("/parse/contacts", json=body, headers={"X-API-Key": key})
+
+        async def abuser() -> None:
+            while time.monotonic() < deadline:
+                resp = await post("batch")
+                statuses["batch"][resp.status_code] += 1
+                if resp.status_code == 429 and not args.ignore_retry_after:
+                    await asyncio.sleep(float(resp.headers.get("retry-after", "1")))
+
+        async def user(n: int) -> None:
+            while time.monotonic() < deadline:
+                started = time.perf_counter()
+                resp = await post(f"user-{n}")
+                interactive.append((time.perf_counter() - started) * 1000)
+                statuses["interactive"][resp.status_code] += 1
+                await asyncio.sleep(args.interval)
+
+        await asyncio.gather(*(abuser() for _ in range(args.abusers)), *(user(n) for n in range(args.users)))
+
+    interactive.sort()
+    return {
+        "p50": percentile(interactive, 50),
+        "p95": percentile(interactive, 95),
+        "p99": percentile(interactive, 99),
+        "statuses": statuses,
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Per-client admission control benchmark")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds per run")
+    parser.add_argument("--abusers", type=int, default=64, help="concurrent requests from the batch client")
+    parser.add_argument("--users", type=int, default=4, help="interactive clients")
+    parser.add_argument("--interval", type=float, default=0.5, help="seconds between interactive requests")
+    parser.add_argument("--gemini-latency", type=float, default=0.2)
+    parser.add_argument("--ignore-retry-after", action="store_true", help="batch client retries 429s at once")
+    args = parser.parse_args()
+
+    # Stand-ins en otro proceso: el bucle del cliente batch no les quita el GIL
+    parent, child = multiprocessing.Pipe()
+    standins = multiprocessing.Process(target=_standins_main, args=(child, {
+        "hubspot_companies": 1, "hubspot_contacts": 1, "hubspot_429": 0.0, "hubspot_latency": 0.0,
+        "postgrest_latency": 0.0, "gemini_latency": args.gemini_latency,
+    }), daemon=True)
+    standins.start()
+    urls = parent.recv()
+    print(f"{'admission':<10} {'p50':>8} {'p95':>8} {'p99':>8}  interactive      batch")
+    for enabled in ("false", "true"):
+        with tempfile.TemporaryDirectory() as outbox_dir:
+            proc, base_url = start_app(urls, outbox_dir, 1, {
+                "ADMISSION_ENABLED": enabled,
+                "ADMISSION_API_KEYS": ",".join(["batch"] + [f"user-{n}" for n in range(args.users)]),
+            })
+            try:
+                result = asyncio.run(run(base_url, args))
+            finally:
+                proc.terminate()
+                proc.wait(timeout=10)
+        statuses = result["statuses"]
+        print(f"{'on' if enabled == 'true' else 'off':<10} {result['p50']:>8.1f} {result['p95']:>8.1f} "
+              f"{result['p99']:>8.1f}  {dict(statuses['interactive'])!s:<16} {dict(statuses['batch'])}")
+    parent.send("stop")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,351 @@
+"""
+Benchmark de carga sin red: levanta los stand-ins de `bench/standins.py` en un
+proceso aparte, arranca la app con uvicorn apuntando a ellos y ejecuta cada
+escenario con concurrencia. Reporta p50/p95/p99 y throughput por ruta y
+compara contra `bench/baseline.json`.
+
+Uso:
+    python bench/load.py                       # todos los escenarios
+    python bench/load.py --only companies_list,parse_contacts -n 500 -c 32
+    python bench/load.py --save-baseline       # guardar los resultados como baseline
+    python bench/load.py --hubspot-429 0.05    # inyectar 5% de 429 en HubSpot
+    python bench/load.py --postgrest-latency 0.02  # Supabase remoto (20 ms por llamada)
+
+Sale con código 1 si algún escenario empeora más que `--tolerance`.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import multiprocessing
+import os
+import platform
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+from typing import Callable, Dict, List, Optional, Tuple
+
+import httpx
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from bench.standins import GeminiStandIn, HubSpotStandIn, PostgrestStandIn, SMTPSink  # noqa: E402
+
+BASELINE_PATH = os.path.join(ROOT, "bench", "baseline.json")
+# JWT sintáctico: supabase-py valida el formato de la clave
+BENCH_SUPABASE_KEY = "eyJhbGciOiJIUzI1NiJ9.eyJyb2xlIjoic2VydmljZV9yb2xlIn0.YmVuY2g"
+
+
+class Scenario:
+    def __init__(self, name: str, method: str, route: str,
+                 build: Callable[[int], Tuple[str, dict]], expect: Tuple[int, ...] = (200,)):
+        self.name = name
+        self.method = method
+        self.route = route
+        self.build = build
+        self.expect = expect
+
+
+def _free_text(i: int) -> str:
+    return (
+        f"Reunión con Carla Rojas{i} gerente de ventas en Andes Foods, carla{i}@andesfoods.pe\n"
+        f"También asistió Luis Paredes{i} de Minera Sur, luis{i}@minerasur.com, +51 988 {i:06d}"
+    )
+
+
+def _csv_text(i: int) -> str:
+    rows = "\n".join(f"Persona{i}-{j},persona{i}.{j}@demo.com,Demo SA,Analista" for j in range(5))
+    return "nombre,email,empresa,cargo\n" + rows
+
+
+SCENARIOS: List[Scenario] = [
+    Scenario("companies_list", "GET", "/companies", lambda i: ("/companies?limit=100", {})),
+    Scenario("companies_get", "GET", "/companies/{company_id}",
+             lambda i: (f"/companies/{i % 100 + 1}", {})),
+    Scenario("contacts_list", "GET", "/contacts", lambda i: ("/contacts?limit=100", {})),
+    Scenario("parse_contacts", "POST", "/parse/contacts",
+             lambda i: ("/parse/contacts", {"json": {"text": _free_text(i)}})),
+    Scenario("parse_contacts_local", "POST", "/parse/contacts",
+             lambda i: ("/parse/contacts", {"json": {"text": _csv_text(i)}})),
+    Scenario("parse_contacts_stream", "POST", "/parse/contacts/stream",
+             lambda i: ("/parse/contacts/stream", {"json": {"text": _free_text(i)}})),
+    Scenario("parse_batch", "POST", "/parse/batch",
+             lambda i: ("/parse/batch", {"json": {"items": [
+                 {"id": str(j), "type": "contacts", "text": _free_text(i * 10 + j)} for j in range(10)
+             ]}})),
+    Scenario("hubspot_list", "GET", "/empresas", lambda i: ("/empresas", {})),
+    Scenario("hubspot_search", "GET", "/contactos",
+             lambda i: (f"/contactos?filter=email:EQ:contacto{i % 2000}@empresa{i % 2000 % 500}.com", {})),
+    Scenario("hubspot_sync_company", "POST", "/sync/empresa",
+             lambda i: ("/sync/empresa", {"json": {"id": i + 1, "name": f"Bench {i}", "country": "Peru"}})),
+    Scenario("emails_send", "POST", "/emails/send",
+             lambda i: ("/emails/send", {
+                 "data": {"asunto": f"Bench {i}", "para": f"dest{i}@example.com", "body": "Hola"},
+                 "files": [("files", ("nota.txt", b"x" * 2048, "text/plain"))],
+             }), expect=(202,)),
+    Scenario("metrics", "GET", "/metrics", lambda i: ("/metrics", {})),
+]
+
+
+# ---- Stand-ins en un proceso aparte (no compiten por el GIL con el generador de carga) ----
+def _standins_main(conn, options: dict) -> None:
+    hubspot = HubSpotStandIn(companies=options["hubspot_companies"], contacts=options["hubspot_contacts"],
+                             rate_limit_ratio=options["hubspot_429"], latency=options["hubspot_latency"])
+    postgrest = PostgrestStandIn(latency=options["postgrest_latency"])
+    gemini = GeminiStandIn(latency=options["gemini_latency"])
+    smtp = SMTPSink()
+    conn.send({
+        "hubspot": hubspot.start(),
+        "postgrest": postgrest.start(),
+        "gemini": gemini.start(),
+        "smtp_port": smtp.start(),
+    })
+    while True:
+        message = conn.recv()
+        if message == "stats":
+            conn.send({
+                "hubspot_requests": hubspot.requests,
+                "hubspot_429": hubspot.rate_limited,
+                "postgrest_requests": postgrest.requests,
+                "gemini_requests": gemini.requests,
+                "smtp_messages": smtp.messages,
+            })
+        elif message == "stop":
+            return
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_app(urls: dict, outbox_dir: str, workers: int,
+              extra_env: Optional[dict] = None) -> Tuple[subprocess.Popen, str]:
+    port = _free_port()
+    env = dict(os.environ)
+    # El generador de carga es un único cliente: sin límites por cliente salvo que se pidan
+    env.setdefault("ADMISSION_ENABLED", "false")
+    env.update({
+        "PYTHONPATH": ROOT + os.pathsep + env.get("PYTHONPATH", ""),
+        "SUPABASE_URL": urls["postgrest"],
+        "SUPABASE_SERVICE_KEY": BENCH_SUPABASE_KEY,
+        "CLAVE_API_HUBSPOT": "bench",
+        "HUBSPOT_BASE_URL": urls["hubspot"],
+        "GEMINI_KEY_API": "bench",
+        "GEMINI_BASE_URL": urls["gemini"],
+        "SMTP_HOST": "127.0.0.1",
+        "SMTP_PORT": str(urls["smtp_port"]),
+        "SMTP_SSL": "false",
+        "SMTP_STARTTLS": "false",
+        "GMAIL_USER": "bench@example.com",
+        "GMAIL_PASSWORD_APP": "bench",
+        "OUTBOX_DIR": outbox_dir,
+    })
+    env.update(extra_env or {})
+    cmd = [sys.executable, "-m", "uvicorn", "app.main:app", "--host", "127.0.0.1",
+           "--port", str(port), "--log-level", "warning", "--workers", str(workers)]
+    proc = subprocess.Popen(cmd, cwd=ROOT, env=env)
+    base = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError("uvicorn exited during startup")
+        try:
+            if httpx.get(base + "/", timeout=1).status_code == 200:
+                return proc, base
+        except httpx.HTTPError:
+            time.sleep(0.1)
+    proc.terminate()
+    raise RuntimeError("app did not become ready in 30s")
+
+
+# ---- Carga ----
+def percentile(sorted_values: List[float], p: float) -> float:
+    if not sorted_values:
+        return 0.0
+    rank = max(int(round(p / 100 * len(sorted_values) + 0.5)) - 1, 0)
+    return sorted_values[min(rank, len(sorted_values) - 1)]
+
+
+async def run_scenario(client: httpx.AsyncClient, scenario: Scenario, requests: int,
+                       concurrency: int, warmup: int) -> dict:
+    async def one(i: int, latencies: Optional[List[float]], statuses: Counter) -> None:
+        path, kwargs = scenario.build(i)
+        started = time.perf_counter()
+        try:
+            r = await client.request(scenario.method, path, **kwargs)
+            statuses[r.status_code] += 1
+        except httpx.HTTPError as e:
+            statuses[type(e).__name__] += 1
+        if latencies is not None:
+            latencies.append(time.perf_counter() - started)
+
+    for i in range(warmup):
+        await one(-1 - i, None, Counter())
+
+    latencies: List[float] = []
+    statuses: Counter = Counter()
+    counter = itertools.count()
+
+    async def worker():
+        while True:
+            i = next(counter)
+            if i >= requests:
+                return
+            await one(i, latencies, statuses)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    errors = sum(n for code, n in statuses.items() if code not in scenario.expect)
+    return {
+        "route": f"{scenario.method} {scenario.route}",
+        "requests": requests,
+        "concurrency": concurrency,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+        "max_ms": round(latencies[-1] * 1000, 2) if latencies else 0.0,
+        "rps": round(requests / elapsed, 1) if elapsed else 0.0,
+        "error_rate": round(errors / requests, 4) if requests else 0.0,
+        "statuses": {str(k): v for k, v in sorted(statuses.items(), key=lambda kv: str(kv[0]))},
+    }
+
+
+def compare(results: Dict[str, dict], baseline: Dict[str, dict], tolerance: float) -> List[str]:
+    """Escenarios que empeoran más que `tolerance` en p95, throughput o tasa de errores"""
+    regressions = []
+    for name, current in results.items():
+        base = baseline.get(name)
+        if not base:
+            continue
+        if base["p95_ms"] and current["p95_ms"] > base["p95_ms"] * (1 + tolerance):
+            regressions.append(f"{name}: p95 {base['p95_ms']} -> {current['p95_ms']} ms")
+        if base["rps"] and current["rps"] < base["rps"] * (1 - tolerance):
+            regressions.append(f"{name}: rps {base['rps']} -> {current['rps']}")
+        if current["error_rate"] > base.get("error_rate", 0) + 0.01:
+            regressions.append(f"{name}: error rate {base.get('error_rate', 0)} -> {current['error_rate']}")
+    return regressions
+
+
+def print_table(results: Dict[str, dict], baseline: Dict[str, dict]) -> None:
+    header = f"{'scenario':<24} {'p50':>8} {'p95':>8} {'p99':>8} {'rps':>8} {'err':>6}  {'Δp95':>7} {'Δrps':>7}"
+    print(header)
+    print("-" * len(header))
+    for name, r in results.items():
+        base = baseline.get(name) or {}
+        d95 = f"{(r['p95_ms'] / base['p95_ms'] - 1) * 100:+.0f}%" if base.get("p95_ms") else "-"
+        drps = f"{(r['rps'] / base['rps'] - 1) * 100:+.0f}%" if base.get("rps") else "-"
+        print(f"{name:<24} {r['p50_ms']:>8.1f} {r['p95_ms']:>8.1f} {r['p99_ms']:>8.1f} "
+              f"{r['rps']:>8.1f} {r['error_rate'] * 100:>5.1f}%  {d95:>7} {drps:>7}")
+
+
+async def drive(base_url: str, scenarios: List[Scenario], args) -> Dict[str, dict]:
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    results = {}
+    async with httpx.AsyncClient(base_url=base_url, timeout=120, limits=limits) as client:
+        for scenario in scenarios:
+            results[scenario.name] = await run_scenario(
+                client, scenario, args.requests, args.concurrency, args.warmup
+            )
+            print(f"  {scenario.name}: done", file=sys.stderr)
+    return results
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Offline load benchmark with local upstream stand-ins")
+    parser.add_argument("-n", "--requests", type=int, default=200, help="requests per scenario")
+    parser.add_argument("-c", "--concurrency", type=int, default=16)
+    parser.add_argument("--warmup", type=int, default=5)
+    parser.add_argument("--only", default="", help="comma-separated scenario names")
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn workers")
+    parser.add_argument("--gemini-latency", type=float, default=0.2, help="seconds per Gemini call")
+    parser.add_argument("--hubspot-latency", type=float, default=0.0)
+    parser.add_argument("--postgrest-latency", type=float, default=0.0, help="seconds per Supabase call")
+    parser.add_argument("--hubspot-429", type=float, default=0.0, help="ratio of HubSpot requests answered 429")
+    parser.add_argument("--hubspot-companies", type=int, default=500)
+    parser.add_argument("--hubspot-contacts", type=int, default=2000)
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    parser.add_argument("--output", help="write results JSON here")
+    args = parser.parse_args()
+
+    selected = [s for s in SCENARIOS if not args.only or s.name in args.only.split(",")]
+    if not selected:
+        print("no scenarios selected")
+        return 2
+
+    parent, child = multiprocessing.Pipe()
+    standins = multiprocessing.Process(target=_standins_main, args=(child, {
+        "hubspot_companies": args.hubspot_companies,
+        "hubspot_contacts": args.hubspot_contacts,
+        "hubspot_429": args.hubspot_429,
+        "hubspot_latency": args.hubspot_latency,
+        "postgrest_latency": args.postgrest_latency,
+        "gemini_latency": args.gemini_latency,
+    }), daemon=True)
+    standins.start()
+    urls = parent.recv()
+
+    with tempfile.TemporaryDirectory() as outbox_dir:
+        app, base_url = start_app(urls, outbox_dir, args.workers)
+        try:
+            results = asyncio.run(drive(base_url, selected, args))
+            time.sleep(0.5)
+            parent.send("stats")
+            stats = parent.recv()
+        finally:
+            app.terminate()
+            app.wait(timeout=10)
+            parent.send("stop")
+            standins.join(timeout=5)
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, "r", encoding="utf-8") as fh:
+            baseline = json.load(fh).get("scenarios", {})
+
+    print_table(results, baseline)
+    print("upstreams:", ", ".join(f"{k}={v}" for k, v in stats.items()))
+
+    report = {
+        "meta": {
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "cpus": os.cpu_count(),
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+            "gemini_latency": args.gemini_latency,
+            "postgrest_latency": args.postgrest_latency,
+            "hubspot_429": args.hubspot_429,
+            "date": time.strftime("%Y-%m-%d"),
+        },
+        "scenarios": results,
+        "upstreams": stats,
+    }
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as fh:
+            json.dump(report, fh, indent=2)
+    if args.save_baseline:
+        merged = {**baseline, **results}
+        with open(args.baseline, "w", encoding="utf-8") as fh:
+            json.dump({**report, "scenarios": merged}, fh, indent=2)
+        print(f"baseline saved to {args.baseline}")
+        return 0
+
+    regressions = compare(results, baseline, args.tolerance)
+    for line in regressions:
+        print("REGRESSION", line)
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
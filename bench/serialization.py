@@ -0,0 +1,95 @@
+"""
+Benchmark de serialización y compresión de respuestas (sin red).
+
+Compara, para respuestas grandes típicas de la API:
+- baseline: el camino por defecto de FastAPI (jsonable_encoder + JSONResponse)
+- fast: FastJSONResponse directo (orjson si está instalado)
+- cached: PrecomputedJSON ya codificado y comprimido (aciertos de caché)
+y el tamaño sin comprimir, con gzip y con brotli (si está instalado).
+
+Uso:
+    python bench/serialization.py [--rows 1000] [--repeat 50]
+"""
+import argparse
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from fastapi.encoders import jsonable_encoder  # noqa: E402
+from starlette.responses import JSONResponse  # noqa: E402
+
+from app import serialization  # noqa: E402
+from app.serialization import FastJSONResponse, PrecomputedJSON, compress  # noqa: E402
+from bench.standins import HubSpotStandIn  # noqa: E402
+
+
+def supabase_rows(n: int) -> dict:
+    """Respuesta de GET /companies?limit=n"""
+    return {"ok": True, "data": [
+        {
+            "id": i + 1, "name": f"Empresa {i}", "country": "Peru", "sector": "Retail",
+            "estado": "Activo", "lead_status": "No contactada", "total_revenue": 1250000.5 + i,
+            "net_profit": 98000.25, "hubspot_id": str(10000 + i), "website": f"https://empresa{i}.pe",
+            "created_at": "2025-01-15T10:20:30.123456+00:00", "updated_at": "2025-03-02T08:00:00+00:00",
+            "notas": "Cliente potencial del sector retail con presencia en Lima y Arequipa",
+        }
+        for i in range(n)
+    ]}
+
+
+def hubspot_dump(n: int) -> list:
+    """Respuesta de GET /empresas (listado completo del portal)"""
+    standin = HubSpotStandIn(companies=n, contacts=0)
+    return list(standin.objects["companies"].values())
+
+
+def cpu_ms(fn, repeat: int) -> float:
+    started = time.process_time()
+    for _ in range(repeat):
+        fn()
+    return (time.process_time() - started) * 1000 / repeat
+
+
+def measure(name: str, content, repeat: int) -> None:
+    baseline = JSONResponse(jsonable_encoder(content)).body
+    fast = FastJSONResponse(content).body
+    cached = PrecomputedJSON(content)
+    cached.response("gzip")
+
+    rows = [
+        ("baseline", cpu_ms(lambda: JSONResponse(jsonable_encoder(content)), repeat), len(baseline)),
+        ("fast", cpu_ms(lambda: FastJSONResponse(content), repeat), len(fast)),
+        ("fast+gzip", cpu_ms(lambda: compress(FastJSONResponse(content).body, "gzip"), repeat),
+         len(compress(fast, "gzip"))),
+    ]
+    if serialization.brotli is not None:
+        rows.append(("fast+br", cpu_ms(lambda: compress(FastJSONResponse(content).body, "br"), repeat),
+                     len(compress(fast, "br"))))
+    rows.append(("cached+gzip", cpu_ms(lambda: cached.response("gzip"), repeat), len(cached.response("gzip").body)))
+
+    base_ms, base_bytes = rows[0][1], rows[0][2]
+    print(f"\n{name}")
+    print(f"  {'path':<12} {'cpu ms':>9} {'speedup':>8} {'bytes':>10} {'ratio':>7}")
+    for label, ms, size in rows:
+        speedup = base_ms / ms if ms else float("inf")
+        print(f"  {label:<12} {ms:>9.3f} {speedup:>7.1f}x {size:>10} {base_bytes / size:>6.1f}:1")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Response serialization/compression benchmark")
+    parser.add_argument("--rows", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+
+    print(f"serializer: {'orjson' if serialization.USE_ORJSON else 'json'}, "
+          f"encodings: {', '.join(serialization.ENCODINGS)}")
+    measure(f"GET /companies?limit={args.rows}", supabase_rows(args.rows), args.repeat)
+    measure(f"GET /empresas ({args.rows // 2} companies)", hubspot_dump(args.rows // 2), args.repeat)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
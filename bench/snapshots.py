@@ -0,0 +1,109 @@
+"""
+Benchmark de snapshots columnares: `--rows` llamadas repartidas en `--months`
+meses en el stand-in de PostgREST. Compara la exportación JSON existente
+(`/calls/export`, NDJSON) con el stream Arrow (`/snapshots/calls/arrow`),
+y mide el snapshot Parquet completo, uno incremental tras modificar
+`--changed` filas y la lectura de un solo mes desde el dataset particionado.
+
+Requiere pyarrow en la app y en este script.
+
+Uso:
+    python bench/snapshots.py [--rows 50000] [--months 12] [--postgrest-latency 0.02]
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+import httpx
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from bench.load import start_app  # noqa: E402
+from bench.standins import HubSpotStandIn, PostgrestStandIn, SMTPSink  # noqa: E402
+
+try:
+    import pyarrow as pa
+    import pyarrow.ipc  # noqa: F401
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+
+
+def timed(label: str, fn):
+    started = time.perf_counter()
+    result = fn()
+    print(f"{label:<34} {(time.perf_counter() - started) * 1000:>9.1f} ms  {result}")
+    return result
+
+
+def dir_size(path: str) -> int:
+    return sum(os.path.getsize(os.path.join(d, f)) for d, _, files in os.walk(path) for f in files)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Parquet/Arrow snapshot benchmark")
+    parser.add_argument("--rows", type=int, default=50000, help="calls to seed")
+    parser.add_argument("--months", type=int, default=12, help="created_at months the calls span")
+    parser.add_argument("--changed", type=int, default=200, help="rows modified before the incremental run")
+    parser.add_argument("--postgrest-latency", type=float, default=0.0)
+    args = parser.parse_args()
+    if pa is None:
+        print("pyarrow is not installed: pip install pyarrow")
+        return 1
+
+    pg = PostgrestStandIn(seed_companies=100, seed_contacts=0, latency=args.postgrest_latency)
+    with pg._lock:
+        pg._insert("calls", [
+            {"company_id": i % 100 + 1, "duracion": i % 45, "resultado": "Interesado", "responsable": "bench",
+             "asunto": f"Llamada {i}", "notas": f"Notas de la llamada {i} " * 3,
+             "created_at": f"2025-{i % args.months + 1:02d}-{i % 28 + 1:02d}T09:00:00+00:00"}
+            for i in range(args.rows)
+        ], upsert=False)
+    hubspot, smtp = HubSpotStandIn(companies=1, contacts=1), SMTPSink()
+    urls = {"postgrest": pg.start(), "gemini": "http://127.0.0.1:1", "smtp_port": smtp.start(), "hubspot": hubspot.start()}
+
+    with tempfile.TemporaryDirectory() as snapshot_dir, tempfile.TemporaryDirectory() as outbox_dir:
+        # El stand-in mantiene `updated_at`: el incremental recoge también las filas editadas
+        proc, base_url = start_app(urls, outbox_dir, 1, {
+            "SNAPSHOT_DIR": snapshot_dir, "SNAPSHOT_CURSOR_COLUMN": "updated_at",
+        })
+        try:
+            client = httpx.Client(base_url=base_url, timeout=600)
+
+            def json_export():
+                resp = client.get("/calls/export")
+                rows = [json.loads(line) for line in resp.text.splitlines() if line]
+                return f"{len(rows)} rows, {len(resp.content) / 1e6:.1f} MB"
+
+            def arrow_stream():
+                resp = client.get("/snapshots/calls/arrow")
+                table = pa.ipc.open_stream(resp.content).read_all()
+                return f"{table.num_rows} rows, {len(resp.content) / 1e6:.1f} MB"
+
+            def snapshot(full: bool):
+                data = client.post("/snapshots/run", json={"tables": ["calls"], "full": full}).json()["data"]
+                return data["tables"]["calls"]["rows"], data.get("errors")
+
+            timed("JSON export (NDJSON, parsed)", json_export)
+            timed("Arrow stream (read_all)", arrow_stream)
+            timed("Parquet snapshot, full", lambda: snapshot(True))
+            path = os.path.join(snapshot_dir, "calls")
+            print(f"{'  on disk':<34} {dir_size(path) / 1e6:>9.1f} MB")
+            for call_id in range(1, args.changed + 1):
+                client.patch(f"/calls/{call_id * 7}", json={"resultado": "Reunión agendada"})
+            timed("Parquet snapshot, incremental", lambda: snapshot(False))
+            timed("Parquet read, whole dataset", lambda: pq.read_table(path).num_rows)
+            timed("Parquet read, one month", lambda: pq.read_table(
+                path, filters=[("created_month", "=", "2025-01")]).num_rows)
+        finally:
+            proc.terminate()
+            proc.wait(timeout=10)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,698 @@
+"""
+Servicios locales que sustituyen a los upstreams en los benchmarks:
+
+- HubSpotStandIn: CRM v3/v4 con paginación, endpoints batch, búsqueda e
+  inyección de 429 (`rate_limit_ratio`)
+- PostgrestStandIn: subconjunto de PostgREST (lo que usa supabase-py) sobre SQLite;
+  mantiene `updated_at` en cada escritura, como un trigger moddatetime
+- GeminiStandIn: generateContent / streamGenerateContent con latencia configurable
+- SMTPSink: servidor SMTP que acepta y descarta los mensajes
+
+Cada servicio corre en su propio hilo (`start()` devuelve la URL o el puerto).
+"""
+import json
+import random
+import re
+import socketserver
+import sqlite3
+import threading
+import time
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import parse_qsl, urlsplit
+
+EMAIL_RE = re.compile(r"[\w.+-]+@[\w-]+\.[\w.-]+")
+TABLE_RE = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+
+
+def _now_iso() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+class _JSONHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Cabeceras y cuerpo en un solo write, sin Nagle (evita esperas de ~40 ms por ACK retardado)
+    wbufsize = 64 * 1024
+    disable_nagle_algorithm = True
+    service: Any = None
+
+    def log_message(self, *args):
+        pass
+
+    def _body(self) -> Any:
+        length = int(self.headers.get("Content-Length") or 0)
+        raw = self.rfile.read(length) if length else b""
+        return json.loads(raw) if raw else None
+
+    def _send(self, status: int, payload: Any = None, headers: Optional[Dict[str, str]] = None) -> None:
+        data = b"" if payload is None else json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        if data:
+            self.wfile.write(data)
+
+    def _dispatch(self, method: str) -> None:
+        parts = urlsplit(self.path)
+        query = parse_qsl(parts.query, keep_blank_values=True)
+        try:
+            status, payload, headers = self.service.handle(method, parts.path, query, self._body(), self.headers)
+        except Exception as e:
+            status, payload, headers = 500, {"message": str(e)}, None
+        self._send(status, payload, headers)
+
+    def do_GET(self):
+        self._dispatch("GET")
+
+    def do_POST(self):
+        self._dispatch("POST")
+
+    def do_PATCH(self):
+        self._dispatch("PATCH")
+
+    def do_PUT(self):
+        self._dispatch("PUT")
+
+    def do_DELETE(self):
+        self._dispatch("DELETE")
+
+
+def _serve(service, handler_cls=_JSONHandler) -> Tuple[ThreadingHTTPServer, int]:
+    handler = type(f"{type(service).__name__}Handler", (handler_cls,), {"service": service})
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, server.server_address[1]
+
+
+# ---------------------------------------------------------------- HubSpot ----
+def _property(name: str, type_: str = "string", options: Optional[List[str]] = None, **extra) -> dict:
+    field_type = {"string": "text", "number": "number", "enumeration": "select"}.get(type_, "text")
+    definition = {"name": name, "label": name, "type": type_, "fieldType": field_type, **extra}
+    if options is not None:
+        definition["options"] = [{"label": o, "value": o, "hidden": False} for o in options]
+    return definition
+
+
+LEAD_STATUS_OPTIONS = ["NEW", "OPEN", "IN_PROGRESS", "OPEN_DEAL", "UNQUALIFIED",
+                       "ATTEMPTED_TO_CONTACT", "CONNECTED", "BAD_TIMING"]
+
+
+def default_properties() -> Dict[str, Dict[str, dict]]:
+    """Definiciones de propiedades de un portal típico (net_profit es personalizada)"""
+    common = [
+        _property("hs_object_id", "number", modificationMetadata={"readOnlyValue": True}),
+        _property("hs_lastmodifieddate", "datetime", modificationMetadata={"readOnlyValue": True}),
+        _property("country"),
+        _property("hs_lead_status", "enumeration", LEAD_STATUS_OPTIONS),
+    ]
+    companies = common + [_property("name"), _property("industry"), _property("annualrevenue", "number"),
+                          _property("net_profit", "number")]
+    contacts = common + [_property(n) for n in ("firstname", "lastname", "email", "phone", "jobtitle")]
+    return {
+        "companies": {p["name"]: p for p in companies},
+        "contacts": {p["name"]: p for p in contacts},
+    }
+
+
+class HubSpotStandIn:
+    def __init__(self, companies: int = 500, contacts: int = 2000,
+                 rate_limit_ratio: float = 0.0, latency: float = 0.0, seed: int = 7):
+        self.rate_limit_ratio = rate_limit_ratio
+        self.latency = latency
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._next_id = 1
+        self.objects: Dict[str, Dict[str, dict]] = {"companies": {}, "contacts": {}}
+        self.requests = 0
+        self.rate_limited = 0
+        self.associations = 0
+        self.validation_errors = 0
+        # Esquema del portal: los payloads con propiedades desconocidas u
+        # opciones inválidas se rechazan con 400 (el lote entero, como HubSpot)
+        self.properties = default_properties()
+        # contact id -> company id (v4 associations)
+        self.contact_company: Dict[str, str] = {}
+        for i in range(companies):
+            self._create("companies", {"name": f"Empresa {i}", "country": "Peru", "industry": "Retail"})
+        for i in range(contacts):
+            contact = self._create("contacts", {
+                "email": f"contacto{i}@empresa{i % max(companies, 1)}.com",
+                "firstname": f"Nombre{i}", "lastname": f"Apellido{i}", "phone": f"+51 9{i:08d}",
+            })
+            if companies:
+                self.contact_company[contact["id"]] = str(i % companies + 1)
+        self.server = None
+
+    def _create(self, object_type: str, properties: dict) -> dict:
+        with self._lock:
+            object_id = str(self._next_id)
+            self._next_id += 1
+        now = time.strftime("%Y-%m-%dT%H:%M:%S.000Z", time.gmtime())
+        obj = {
+            "id": object_id,
+            "properties": {**properties, "hs_object_id": object_id, "hs_lastmodifieddate": now},
+            "createdAt": now,
+            "updatedAt": now,
+            "archived": False,
+        }
+        self.objects.setdefault(object_type, {})[object_id] = obj
+        return obj
+
+    def _update(self, object_type: str, object_id: str, properties: dict) -> Optional[dict]:
+        obj = self.objects.get(object_type, {}).get(str(object_id))
+        if obj is None:
+            return None
+        now = time.strftime("%Y-%m-%dT%H:%M:%S.000Z", time.gmtime())
+        obj["properties"].update(properties or {})
+        obj["properties"]["hs_lastmodifieddate"] = now
+        obj["updatedAt"] = now
+        return obj
+
+    def _invalid(self, object_type: str, inputs: List[dict]) -> Optional[str]:
+        schema = self.properties.get(object_type, {})
+        for properties in inputs:
+            for name, value in (properties or {}).items():
+                definition = schema.get(name)
+                if definition is None:
+                    return f'Property "{name}" does not exist'
+                if (definition.get("modificationMetadata") or {}).get("readOnlyValue"):
+                    return f'Property "{name}" is read-only'
+                options = [o["value"] for o in definition.get("options") or []]
+                if definition["type"] == "enumeration" and value not in options:
+                    return f'{value} was not one of the allowed options: {options}'
+        return None
+
+    def _validation_error(self, message: str):
+        self.validation_errors += 1
+        return 400, {"status": "error", "category": "VALIDATION_ERROR", "message": message}, None
+
+    def _with_company(self, contact: dict) -> dict:
+        company_id = self.contact_company.get(contact["id"])
+        if company_id is None:
+            return contact
+        return {**contact, "associations": {"companies": {"results": [
+            {"id": company_id, "type": "contact_to_company"}
+        ]}}}
+
+    def _find(self, object_type: str, prop: str, value: Any) -> Optional[str]:
+        wanted = str(value or "").lower()
+        for object_id, obj in self.objects.get(object_type, {}).items():
+            if str(obj["properties"].get(prop) or "").lower() == wanted:
+                return object_id
+        return None
+
+    @staticmethod
+    def _project(obj: dict, properties: Optional[List[str]]) -> dict:
+        if not properties:
+            return obj
+        props = {k: v for k, v in obj["properties"].items() if k in properties or k == "hs_object_id"}
+        return {**obj, "properties": props}
+
+    def _page(self, items: List[dict], limit: int, after: Optional[str], properties) -> dict:
+        start = int(after or 0)
+        page = items[start:start + limit]
+        result = {"results": [self._project(o, properties) for o in page]}
+        if start + limit < len(items):
+            result["paging"] = {"next": {"after": str(start + limit)}}
+        return result
+
+    def handle(self, method, path, query, body, headers):
+        self.requests += 1
+        if self.latency:
+            time.sleep(self.latency)
+        if self.rate_limit_ratio and self._random.random() < self.rate_limit_ratio:
+            self.rate_limited += 1
+            return 429, {
+                "status": "error",
+                "message": "You have reached your secondly limit.",
+                "errorType": "RATE_LIMIT",
+                "policyName": "SECONDLY",
+            }, {"Retry-After": "1"}
+
+        params = dict(query)
+        parts = [p for p in path.split("/") if p]
+        # /crm/v4/objects/contacts/{id}/associations/companies/{id}
+        if len(parts) >= 7 and parts[1] == "v4" and parts[5] == "associations":
+            return 200, {"status": "COMPLETE"}, None
+        # /crm/v4/associations/contacts/companies/batch/associate/default
+        if len(parts) >= 7 and parts[1] == "v4" and parts[2] == "associations" and parts[5] == "batch":
+            for pair in (body or {}).get("inputs", []):
+                self.contact_company[str(pair["from"]["id"])] = str(pair["to"]["id"])
+                self.associations += 1
+            return 200, {"status": "COMPLETE", "results": []}, None
+        # /crm/v3/properties/{objectType}
+        if len(parts) == 4 and parts[:3] == ["crm", "v3", "properties"] and method == "GET":
+            return 200, {"results": list(self.properties.get(parts[3], {}).values())}, None
+        if len(parts) < 4 or parts[:3] != ["crm", "v3", "objects"]:
+            return 404, {"message": "not found"}, None
+
+        object_type = parts[3]
+        items = self.objects.setdefault(object_type, {})
+        properties = params.get("properties", "").split(",") if params.get("properties") else None
+        limit = min(int(params.get("limit", 10)), 100)
+
+        if len(parts) == 4:
+            if method == "GET":
+                page = self._page(list(items.values()), limit, params.get("after"), properties)
+                if object_type == "contacts" and params.get("associations") == "companies":
+                    page["results"] = [self._with_company(o) for o in page["results"]]
+                return 200, page, None
+            if method == "POST":
+                error = self._invalid(object_type, [(body or {}).get("properties")])
+                if error:
+                    return self._validation_error(error)
+                return 201, self._create(object_type, (body or {}).get("properties", {})), None
+        elif len(parts) == 5 and parts[4] == "search" and method == "POST":
+            body = body or {}
+            found = [o for o in items.values() if self._matches(o, body.get("filterGroups") or [])]
+            if body.get("query"):
+                text = body["query"].lower()
+                found = [o for o in found if any(text in str(v).lower() for v in o["properties"].values())]
+            for sort in reversed(body.get("sorts") or []):
+                found.sort(key=lambda o, p=sort["propertyName"]: str(o["properties"].get(p) or ""),
+                           reverse=sort.get("direction") == "DESCENDING")
+            page = self._page(found, min(int(body.get("limit", 10)), 200), body.get("after"),
+                              body.get("properties"))
+            page["total"] = len(found)
+            return 200, page, None
+        elif len(parts) == 5 and method in ("GET", "PATCH"):
+            obj = items.get(parts[4])
+            if method == "PATCH":
+                error = self._invalid(object_type, [(body or {}).get("properties")])
+                if error:
+                    return self._validation_error(error)
+                obj = self._update(object_type, parts[4], (body or {}).get("properties", {}))
+            if obj is None:
+                return 404, {"status": "error", "message": "resource not found"}, None
+            return 200, self._project(obj, properties), None
+        elif len(parts) == 6 and parts[4] == "batch" and method == "POST":
+            inputs = (body or {}).get("inputs", [])
+            action = parts[5]
+            if action != "read":
+                error = self._invalid(object_type, [i.get("properties") for i in inputs])
+                if error:
+                    return self._validation_error(error)
+            if action == "read":
+                results = [self._project(items[str(i["id"])], (body or {}).get("properties"))
+                           for i in inputs if str(i.get("id")) in items]
+            elif action == "create":
+                results = []
+                for i in inputs:
+                    obj = self._create(object_type, i.get("properties", {}))
+                    trace = {"objectWriteTraceId": i["objectWriteTraceId"]} if "objectWriteTraceId" in i else {}
+                    results.append({**obj, **trace})
+            elif action in ("update", "upsert"):
+                results = []
+                for i in inputs:
+                    object_id = i.get("id")
+                    if i.get("idProperty"):
+                        object_id = self._find(object_type, i["idProperty"], object_id)
+                    obj = self._update(object_type, object_id, i.get("properties", {}))
+                    if obj is None and action == "upsert":
+                        obj = self._create(object_type, i.get("properties", {}))
+                    if obj is not None:
+                        results.append(obj)
+            else:
+                return 404, {"message": "unknown batch action"}, None
+            return 200, {"status": "COMPLETE", "results": results}, None
+        return 405, {"message": "method not allowed"}, None
+
+    @staticmethod
+    def _matches(obj: dict, groups: List[dict]) -> bool:
+        if not groups:
+            return True
+        props = obj["properties"]
+        for group in groups:
+            ok = True
+            for f in group.get("filters", []):
+                value = props.get(f.get("propertyName"))
+                op = f.get("operator", "EQ")
+                target = f.get("value")
+                if op == "EQ":
+                    ok = str(value) == str(target)
+                elif op == "NEQ":
+                    ok = str(value) != str(target)
+                elif op == "GT":
+                    ok = value is not None and str(value) > str(target)
+                elif op == "GTE":
+                    ok = value is not None and str(value) >= str(target)
+                elif op == "LT":
+                    ok = value is not None and str(value) < str(target)
+                elif op == "LTE":
+                    ok = value is not None and str(value) <= str(target)
+                elif op == "CONTAINS_TOKEN":
+                    ok = str(target).strip("*").lower() in str(value or "").lower()
+                elif op == "HAS_PROPERTY":
+                    ok = value not in (None, "")
+                elif op == "NOT_HAS_PROPERTY":
+                    ok = value in (None, "")
+                elif op == "NOT_CONTAINS_TOKEN":
+                    ok = str(target).strip("*").lower() not in str(value or "").lower()
+                elif op == "IN":
+                    ok = str(value) in [str(v) for v in f.get("values", [])]
+                elif op == "NOT_IN":
+                    ok = str(value) not in [str(v) for v in f.get("values", [])]
+                elif op == "BETWEEN":
+                    ok = value is not None and str(target) <= str(value) <= str(f.get("highValue"))
+                if not ok:
+                    break
+            if ok:
+                return True
+        return False
+
+    def start(self) -> str:
+        self.server, port = _serve(self)
+        return f"http://127.0.0.1:{port}"
+
+
+# -------------------------------------------------------------- PostgREST ----
+def _split_in(value: str) -> List[str]:
+    """Valores de `in.(a,"b,c",d)` respetando comillas"""
+    inner = value[1:-1] if value.startswith("(") and value.endswith(")") else value
+    out, current, quoted = [], "", False
+    for ch in inner:
+        if ch == '"':
+            quoted = not quoted
+        elif ch == "," and not quoted:
+            out.append(current)
+            current = ""
+        else:
+            current += ch
+    if current or inner:
+        out.append(current)
+    return out
+
+
+def _number(value: str) -> Any:
+    try:
+        return int(value)
+    except ValueError:
+        try:
+            return float(value)
+        except ValueError:
+            return value
+
+
+class PostgrestStandIn:
+    """
+    Cada tabla es `(id INTEGER PRIMARY KEY, data JSON)` en una base SQLite en
+    memoria; los filtros de PostgREST se traducen a `json_extract`.
+    """
+
+    OPS = {"eq": "=", "neq": "!=", "gt": ">", "gte": ">=", "lt": "<", "lte": "<="}
+
+    def __init__(self, seed_companies: int = 200, seed_contacts: int = 1000, latency: float = 0.0):
+        self.latency = latency
+        self._db = sqlite3.connect(":memory:", check_same_thread=False)
+        self._lock = threading.Lock()
+        self._tables = set()
+        self.requests = 0
+        self.seed(seed_companies, seed_contacts)
+        self.server = None
+
+    def _ensure(self, table: str) -> None:
+        if not TABLE_RE.match(table):
+            raise ValueError(f"invalid table {table}")
+        if table not in self._tables:
+            self._db.execute(f'CREATE TABLE IF NOT EXISTS "{table}" (id INTEGER PRIMARY KEY, data TEXT NOT NULL)')
+            self._tables.add(table)
+
+    def seed(self, companies: int, contacts: int) -> None:
+        with self._lock:
+            self._insert("companies", [
+                {"name": f"Empresa {i}", "country": "Peru", "sector": "Retail", "estado": "Activo",
+                 "lead_status": "No contactada"}
+                for i in range(companies)
+            ], upsert=False)
+            self._insert("contacts", [
+                {"nombre": f"Nombre{i} Apellido{i}", "email": f"contacto{i}@empresa{i % max(companies, 1)}.com",
+                 "company_id": (i % max(companies, 1)) + 1, "cargo": "Gerente", "estado": "Nuevo"}
+                for i in range(contacts)
+            ], upsert=False)
+
+    def _where(self, query: List[Tuple[str, str]]) -> Tuple[str, list]:
+        clauses, args = [], []
+        for column, expr in query:
+            if column in ("select", "order", "limit", "offset", "on_conflict", "columns"):
+                continue
+            negate = expr.startswith("not.")
+            if negate:
+                expr = expr[4:]
+            op, _, value = expr.partition(".")
+            field = "id" if column == "id" else f"json_extract(data, '$.{column}')"
+            if op in self.OPS:
+                clause = f"{field} {self.OPS[op]} ?"
+                args.append(_number(value) if op not in ("eq", "neq") or column == "id" else value)
+                if op in ("eq", "neq") and column != "id":
+                    clause = f"CAST({field} AS TEXT) {self.OPS[op]} ?"
+            elif op == "in":
+                values = _split_in(value)
+                clause = f"CAST({field} AS TEXT) IN ({','.join('?' for _ in values)})" if values else "0"
+                args.extend(values)
+            elif op == "is":
+                clause = f"{field} IS NULL" if value == "null" else f"{field} = ?"
+                if value != "null":
+                    args.append(1 if value == "true" else 0)
+            elif op in ("like", "ilike"):
+                clause = f"{field} LIKE ?"
+                args.append(value.replace("*", "%"))
+            else:
+                raise ValueError(f"unsupported operator {op}")
+            clauses.append(f"NOT ({clause})" if negate else clause)
+        return (" WHERE " + " AND ".join(clauses)) if clauses else "", args
+
+    @staticmethod
+    def _order(query: dict) -> str:
+        order = query.get("order")
+        if not order:
+            return " ORDER BY id"
+        terms = []
+        for term in order.split(","):
+            pieces = term.split(".")
+            column = pieces[0]
+            direction = "DESC" if "desc" in pieces[1:] else "ASC"
+            field = "id" if column == "id" else f"json_extract(data, '$.{column}')"
+            terms.append(f"{field} {direction}")
+        return " ORDER BY " + ", ".join(terms)
+
+    @staticmethod
+    def _project(row: dict, select: Optional[str]) -> dict:
+        if not select or select == "*":
+            return row
+        return {c: row.get(c) for c in select.split(",")}
+
+    def _rows(self, table: str, query: List[Tuple[str, str]]) -> List[Tuple[int, dict]]:
+        params = dict(query)
+        where, args = self._where(query)
+        sql = f'SELECT id, data FROM "{table}"{where}{self._order(params)}'
+        if params.get("limit"):
+            sql += f" LIMIT {int(params['limit'])}"
+            if params.get("offset"):
+                sql += f" OFFSET {int(params['offset'])}"
+        return [(rid, json.loads(data)) for rid, data in self._db.execute(sql, args)]
+
+    def _insert(self, table: str, rows: List[dict], upsert: bool, on_conflict: Optional[str] = None) -> List[dict]:
+        self._ensure(table)
+        out = []
+        for row in rows:
+            row = dict(row)
+            existing = None
+            if upsert:
+                key = on_conflict or "id"
+                if row.get(key) is not None:
+                    where, args = self._where([(key, f"eq.{row[key]}")])
+                    existing = self._db.execute(f'SELECT id, data FROM "{table}"{where} LIMIT 1', args).fetchone()
+            if existing:
+                merged = {**json.loads(existing[1]), **row, "id": existing[0], "updated_at": _now_iso()}
+                self._db.execute(f'UPDATE "{table}" SET data = ? WHERE id = ?', (json.dumps(merged), existing[0]))
+                out.append(merged)
+                continue
+            row.setdefault("created_at", time.strftime("%Y-%m-%dT%H:%M:%S+00:00", time.gmtime()))
+            row["updated_at"] = _now_iso()
+            if row.get("id") is not None:
+                self._db.execute(f'INSERT INTO "{table}" (id, data) VALUES (?, ?)', (int(row["id"]), json.dumps(row)))
+            else:
+                cur = self._db.execute(f'INSERT INTO "{table}" (data) VALUES (?)', (json.dumps(row),))
+                row["id"] = cur.lastrowid
+                self._db.execute(f'UPDATE "{table}" SET data = ? WHERE id = ?', (json.dumps(row), row["id"]))
+            out.append(row)
+        return out
+
+    def handle(self, method, path, query, body, headers):
+        self.requests += 1
+        if self.latency:
+            # Ida y vuelta a Supabase (fuera del lock: las peticiones se solapan)
+            time.sleep(self.latency)
+        parts = [p for p in path.split("/") if p]
+        if len(parts) != 3 or parts[:2] != ["rest", "v1"]:
+            return 404, {"message": "not found"}, None
+        table = parts[2]
+        params = dict(query)
+        prefer = headers.get("Prefer", "")
+        with self._lock:
+            self._ensure(table)
+            if method == "GET":
+                rows = [self._project(r, params.get("select")) for _, r in self._rows(table, query)]
+                return 200, rows, None
+            if method == "POST":
+                rows = body if isinstance(body, list) else [body or {}]
+                created = self._insert(table, rows, "resolution=" in prefer, params.get("on_conflict"))
+                self._db.commit()
+                return 201, created, None
+            if method == "PATCH":
+                updated = []
+                for rid, row in self._rows(table, [q for q in query if q[0] not in ("limit", "offset")]):
+                    row.update(body or {})
+                    row["updated_at"] = _now_iso()
+                    self._db.execute(f'UPDATE "{table}" SET data = ? WHERE id = ?', (json.dumps(row), rid))
+                    updated.append(row)
+                self._db.commit()
+                return 200, updated, None
+            if method == "DELETE":
+                deleted = self._rows(table, query)
+                for rid, _ in deleted:
+                    self._db.execute(f'DELETE FROM "{table}" WHERE id = ?', (rid,))
+                self._db.commit()
+                return 200, [r for _, r in deleted], None
+        return 405, {"message": "method not allowed"}, None
+
+    def count(self, table: str) -> int:
+        with self._lock:
+            self._ensure(table)
+            return self._db.execute(f'SELECT COUNT(*) FROM "{table}"').fetchone()[0]
+
+    def start(self) -> str:
+        self.server, port = _serve(self)
+        return f"http://127.0.0.1:{port}"
+
+
+# ----------------------------------------------------------------- Gemini ----
+class _GeminiHandler(_JSONHandler):
+    def do_POST(self):
+        parts = urlsplit(self.path)
+        body = self._body() or {}
+        method = parts.path.rsplit(":", 1)[-1]
+        self.service.requests += 1
+        time.sleep(self.service.latency)
+        text = self.service.answer(body)
+        usage = {"promptTokenCount": 200, "candidatesTokenCount": len(text) // 4, "totalTokenCount": 200 + len(text) // 4}
+        if method != "streamGenerateContent":
+            self._send(200, {
+                "candidates": [{"content": {"parts": [{"text": text}]}}],
+                "usageMetadata": usage,
+            })
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        step = max(len(text) // self.service.stream_chunks, 1)
+        for i in range(0, len(text), step):
+            chunk = {"candidates": [{"content": {"parts": [{"text": text[i:i + step]}]}}]}
+            if i + step >= len(text):
+                chunk["usageMetadata"] = usage
+            self.wfile.write(f"data: {json.dumps(chunk)}\r\n\r\n".encode("utf-8"))
+            self.wfile.flush()
+            time.sleep(self.service.chunk_delay)
+        self.close_connection = True
+
+
+class GeminiStandIn:
+    """Responde con un contacto/empresa por cada email o línea del texto del prompt"""
+
+    def __init__(self, latency: float = 0.2, stream_chunks: int = 8, chunk_delay: float = 0.01):
+        self.latency = latency
+        self.stream_chunks = stream_chunks
+        self.chunk_delay = chunk_delay
+        self.requests = 0
+        self.server = None
+
+    @staticmethod
+    def answer(body: dict) -> str:
+        prompt = "".join(
+            p.get("text", "") for c in body.get("contents", []) for p in c.get("parts", [])
+        )
+        text = prompt.rsplit("Text:", 1)[-1] if "Text:" in prompt else prompt.rsplit("Texto:", 1)[-1]
+        items = []
+        for line in [l for l in text.splitlines() if l.strip()][:20]:
+            email = EMAIL_RE.search(line)
+            words = EMAIL_RE.sub("", line).split()
+            item = {"first_name": words[0] if words else "Nombre", "last_name": " ".join(words[1:3]),
+                    "name": " ".join(words[:3]) or "Empresa", "country": "Peru", "role": "Trabajador"}
+            if email:
+                item["email"] = email.group(0)
+            items.append(item)
+        return json.dumps({"items": items}, ensure_ascii=False)
+
+    def start(self) -> str:
+        self.server, port = _serve(self, _GeminiHandler)
+        return f"http://127.0.0.1:{port}"
+
+
+# ------------------------------------------------------------------- SMTP ----
+class _SMTPHandler(socketserver.StreamRequestHandler):
+    disable_nagle_algorithm = True
+    sink: "SMTPSink" = None
+
+    def handle(self):
+        def reply(line: str) -> None:
+            self.wfile.write((line + "\r\n").encode("ascii"))
+
+        reply("220 bench-smtp ready")
+        in_data = False
+        size = 0
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            if in_data:
+                if line in (b".\r\n", b".\n"):
+                    in_data = False
+                    self.sink.delivered(size)
+                    size = 0
+                    reply("250 2.0.0 queued")
+                else:
+                    size += len(line)
+                continue
+            cmd = line.decode("ascii", "replace").strip().upper()
+            if cmd.startswith("EHLO"):
+                reply("250-bench-smtp")
+                reply("250-AUTH PLAIN LOGIN")
+                reply("250 SIZE 104857600")
+            elif cmd.startswith("HELO"):
+                reply("250 bench-smtp")
+            elif cmd.startswith("AUTH"):
+                reply("235 2.7.0 accepted")
+            elif cmd.startswith("DATA"):
+                in_data = True
+                reply("354 end with .")
+            elif cmd.startswith("QUIT"):
+                reply("221 bye")
+                return
+            else:
+                reply("250 ok")
+
+
+class SMTPSink:
+    def __init__(self):
+        self.messages = 0
+        self.bytes = 0
+        self._lock = threading.Lock()
+        self.server = None
+
+    def delivered(self, size: int) -> None:
+        with self._lock:
+            self.messages += 1
+            self.bytes += size
+
+    def start(self) -> int:
+        handler = type("BenchSMTPHandler", (_SMTPHandler,), {"sink": self})
+        self.server = socketserver.ThreadingTCPServer(("127.0.0.1", 0), handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self.server.server_address[1]
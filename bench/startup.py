@@ -0,0 +1,84 @@
+"""
+Benchmark de arranque en frío.
+
+Cada corrida es un proceso nuevo de Python que mide:
+- import_ms: importar `app.main`
+- ready_ms: import + lifespan de arranque (la app ya acepta peticiones)
+- warm_ms: calentamiento de los clientes externos en paralelo (en segundo plano en producción)
+
+Uso:
+    python bench/startup.py [--runs 5] [--budget-ms 1000] [--warm supabase,hubspot,gemini]
+
+Sale con código 1 si la mediana de `ready_ms` supera el presupuesto.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CHILD = r"""
+import asyncio, json, sys, time
+t0 = time.perf_counter()
+import app.main as main
+t1 = time.perf_counter()
+
+async def run():
+    async with main.app.router.lifespan_context(main.app):
+        t2 = time.perf_counter()
+        names = [n for n in sys.argv[1].split(",") if n]
+        report = await main.registry.warm_up(names)
+        t3 = time.perf_counter()
+    return t2, t3, report
+
+t2, t3, report = asyncio.run(run())
+print(json.dumps({
+    "import_ms": (t1 - t0) * 1000,
+    "ready_ms": (t2 - t0) * 1000,
+    "warm_ms": (t3 - t2) * 1000,
+    "clients": report,
+}))
+"""
+
+
+def run_once(warm: str) -> dict:
+    env = dict(os.environ)
+    env["PYTHONPATH"] = ROOT + os.pathsep + env.get("PYTHONPATH", "")
+    # El calentamiento se mide aparte, no en segundo plano
+    env["WARMUP_ON_STARTUP"] = "false"
+    out = subprocess.run(
+        [sys.executable, "-c", CHILD, warm],
+        cwd=ROOT, env=env, capture_output=True, text=True, check=True,
+    )
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Cold-start benchmark")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--budget-ms", type=float, default=1000.0)
+    parser.add_argument("--warm", default="supabase,hubspot,gemini",
+                        help="clients to warm up after startup (comma-separated)")
+    args = parser.parse_args()
+
+    results = [run_once(args.warm) for _ in range(args.runs)]
+    print(f"{'metric':<10} {'min':>9} {'median':>9} {'max':>9}")
+    for key in ("import_ms", "ready_ms", "warm_ms"):
+        values = [r[key] for r in results]
+        print(f"{key:<10} {min(values):>9.1f} {statistics.median(values):>9.1f} {max(values):>9.1f}")
+    for name, info in results[-1]["clients"].items():
+        status = "ok" if info["ok"] else f"error: {info.get('error')}"
+        print(f"  warm {name:<9} {info['ms']:>8.1f} ms  {status}")
+
+    ready = statistics.median(r["ready_ms"] for r in results)
+    if ready > args.budget_ms:
+        print(f"FAIL: median ready_ms {ready:.1f} > budget {args.budget_ms:.0f}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())